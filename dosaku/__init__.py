@@ -16,6 +16,7 @@ from dosaku.core.module import Module
 from dosaku.core.service import Service
 from dosaku.core.executor import Executor
 from dosaku.core.agent import Agent
+from dosaku.core.model_registry import ModelHandle, ModelKey, ModelRegistry, model_registry
 from dosaku.backend.server import Server
 from dosaku.backend.backend_agent import BackendAgent
 from dosaku.discord.discord_bot import DiscordBot
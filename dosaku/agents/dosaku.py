@@ -1,7 +1,7 @@
 from math import ceil
 import os
 import random
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import discord
 from PIL.Image import Image
@@ -64,6 +64,9 @@ class Dosaku(Service, BackendAgent):
     def text_to_speech(self, text: str) -> Audio:
         return self.models['text_to_speech'].text_to_speech(text)
 
+    def text_to_speech_stream(self, text: str) -> Iterator[bytes]:
+        return self.models['text_to_speech'].text_to_speech_stream(text)
+
     def text_to_image(self, prompt: str) -> Image:
         return self.models['text_to_image'].text_to_image(prompt)
 
@@ -78,6 +81,15 @@ class Dosaku(Service, BackendAgent):
     ) -> str:
         return 'This is not a real transcript'
 
+    def transcribe_interview_stream(
+            self,
+            audio_file: str,
+            interviewer: Optional[str] = None,
+            interviewee: Optional[str] = None
+    ) -> Iterator[str]:
+        return self.models['interview_transcriptionist'].transcribe_interview_stream(
+            audio_file, interviewer=interviewer, interviewee=interviewee)
+
     def voices(self) -> List[str]:
         return self.models['text_to_speech'].voices
 
@@ -1,18 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+import threading
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Optional, Tuple
+from urllib3.util.retry import Retry
 
 from dosaku import Config
-from dosaku.utils import bytes_to_pil, center, ifnone, pil_to_bytes
+from dosaku.utils import bytes_to_pil, center, IMAGE_ENCODINGS, ifnone, pil_to_bytes, stitch_tiles, tile_boxes
 
 
 class Clipdrop:
     """Clipdrop wrapper class around Stability AI's Clipdrop API.
 
     Clipdrop requires an API key to use. Put the API key in dosaku/config/config.ini.
+
+    Images larger than an endpoint's entry in max_image_sizes (along either side) are split into overlapping tiles of
+    at most tile_size pixels, which are sent to the API up to max_concurrent_tiles at a time and then stitched back
+    together with feathered seams. For upscale(), the limit applies to the output size, so large upscales use smaller
+    input tiles, which overlap by at most a quarter of their size.
+
+    Requests go through a pooled, keep-alive requests.Session, shared by all Clipdrop instances unless one is passed in,
+    so that connections (and their TLS handshakes) are reused across calls. Each endpoint has its own (connect, read)
+    timeout. Requests rejected with 429 (rate limited) or 503 (unavailable), or that fail to connect, have not been
+    processed, and are retried with exponential backoff (honouring any Retry-After header); other failures, including
+    read timeouts, are not retried, as the request may already have been processed (and billed).
+
+    Args:
+        session (optional): The session to send requests with. Defaults to a session shared by all instances.
     """
     config = Config()
     engine_id = "stable-diffusion-xl-1024-v1-0"
+    upload_encoding = IMAGE_ENCODINGS['fast']  # Lossless, and much faster to encode than default PNG compression
+    max_image_sizes = {'inpaint': 2048, 'remove_text': 2048, 'reimagine': 1024, 'upscale': 4096}
+    tile_size = 1024
+    tile_overlap = 128
+    max_concurrent_tiles = 4
+    timeout = (5, 60)  # (connect, read) timeout, in seconds
+    timeouts: Dict[str, Tuple[float, float]] = {
+        'text_to_image': (5, 120), 'sketch_to_image': (5, 120), 'reimagine': (5, 120), 'upscale': (5, 180)}
+    max_retries = 3
+    backoff_factor = 0.5  # Retries wait 0.5s, 1s, 2s, ...
+    pool_size = 16  # The maximum number of pooled connections; at least max_concurrent_tiles
+
+    _default_session: Optional[requests.Session] = None
+    _default_session_lock = threading.Lock()
+
+    def __init__(self, session: Optional[requests.Session] = None):
+        self.session = session if session is not None else self.default_session()
+
+    @classmethod
+    def create_session(cls) -> requests.Session:
+        """Create a session with a connection pool and the retry policy described above."""
+        retries = Retry(
+            total=cls.max_retries,
+            connect=cls.max_retries,
+            read=False,  # Raise read errors (e.g. timeouts) as they are, without retrying
+            status=cls.max_retries,
+            status_forcelist=(429, 503),
+            allowed_methods=frozenset(['POST']),
+            backoff_factor=cls.backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False)  # Return the last response, to be raised by the caller
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=cls.pool_size, max_retries=retries)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @classmethod
+    def default_session(cls) -> requests.Session:
+        """Return the session shared by all Clipdrop instances, creating it on first use."""
+        with cls._default_session_lock:
+            if Clipdrop._default_session is None:
+                Clipdrop._default_session = cls.create_session()
+            return Clipdrop._default_session
+
+    def _post(self, endpoint: str, files: dict, data: Optional[dict] = None) -> requests.Response:
+        """Send a request to the given endpoint (e.g. 'remove_text'), with its configured URL and timeout."""
+        return self.session.post(self.config['CLIPDROP'][f'{endpoint.upper()}_URL'],
+                                 files=files,
+                                 data=data,
+                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']},
+                                 timeout=self.timeouts.get(endpoint, self.timeout))
+
+    def _image_file(self, image: Image, name: str = 'original', extension: Optional[str] = None) -> tuple:
+        """Encode an image for upload, returning a (filename, content, content type) tuple for requests' files."""
+        extension = ifnone(extension, default=self.upload_encoding['format']).lower()
+        encoding = self.upload_encoding if extension == self.upload_encoding['format'] else dict(format=extension)
+        content_type = 'image/jpeg' if extension == 'jpg' else f'image/{extension}'
+        return f'{name}.{extension}', pil_to_bytes(image, **encoding), content_type
+
+    def _tiled(
+            self,
+            process: Callable[[Image, Optional[Image], Tuple[int, int]], Image],
+            image: Image,
+            tile_size: int,
+            mask: Optional[Image] = None,
+            scale: Tuple[float, float] = (1., 1.)
+    ) -> Image:
+        """Process an image in overlapping tiles, concurrently, and stitch the processed tiles back together.
+
+        Args:
+            process: Processes a single tile, given the tile, its mask (or None) and its (width, height) in the output.
+            image: The image to process.
+            tile_size: The maximum width and height of each tile of the input image.
+            mask (optional): A mask for the image, cropped into tiles alongside it.
+            scale: The (horizontal, vertical) scale of the output image relative to the input image.
+
+        Returns:
+            The processed image.
+        """
+        overlap = min(self.tile_overlap, tile_size // 4)  # Small tiles (e.g. for large upscales) overlap less
+        boxes = tile_boxes(image.size, tile_size, overlap)
+        output_boxes = [
+            (round(left * scale[0]), round(top * scale[1]), round(right * scale[0]), round(bottom * scale[1]))
+            for left, top, right, bottom in boxes]
+
+        def process_tile(idx: int) -> Image:
+            left, top, right, bottom = output_boxes[idx]
+            tile_mask = None if mask is None else mask.crop(boxes[idx])
+            return process(image.crop(boxes[idx]), tile_mask, (right - left, bottom - top))
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_tiles) as executor:
+            tiles = list(executor.map(process_tile, range(len(boxes))))
+        output_size = (round(image.width * scale[0]), round(image.height * scale[1]))
+        return stitch_tiles(tiles, output_boxes, output_size, feather=round(overlap * min(scale)))
 
     def text_to_image(self, prompt: str, ) -> Image:
         """Replaces the background according to the prompt.
@@ -36,9 +149,7 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_text_to_image.png
         """
-        response = requests.post(self.config['CLIPDROP']['TEXT_TO_IMAGE_URL'],
-                                 files={'prompt': (None, prompt, 'text/plain')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('text_to_image', files={'prompt': (None, prompt, 'text/plain')})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -69,11 +180,7 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_remove_background.png
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['REMOVE_BACKGROUND_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('remove_background', files={'image_file': self._image_file(image)})
 
         if response.ok:
             foreground_image = bytes_to_pil(response.content)
@@ -112,12 +219,9 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_replace_background.png
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['REPLACE_BACKGROUND_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 data={'prompt': prompt},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('replace_background',
+                              files={'image_file': self._image_file(image)},
+                              data={'prompt': prompt})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -129,6 +233,7 @@ class Clipdrop:
 
         Args:
             image: Input image.
+            extension: The image format to upload the image as, e.g. 'png' or 'jpg'.
 
         Returns:
             An image with the text removed and image inpainted.
@@ -140,17 +245,17 @@ class Clipdrop:
             from dosaku.utils import draw_images
 
             cd = Clipdrop()
-            image = Image.open(''tests/resources/keep_calm.jpg')
+            image = Image.open('tests/resources/keep_calm.jpg')
             image_notext = cd.remove_text(image, extension='jpg')
             draw_images((image, image_notext), labels=('Original', 'No Text'))
 
         .. image:: sample_resources/clipdrop_remove_text.png
         """
-        image_bytes = pil_to_bytes(image)
+        if max(image.size) > self.max_image_sizes['remove_text']:
+            return self._tiled(lambda tile, _, __: self.remove_text(tile, extension=extension), image,
+                               tile_size=min(self.tile_size, self.max_image_sizes['remove_text']))
 
-        response = requests.post(self.config['CLIPDROP']['REMOVE_TEXT_URL'],
-                                 files={'image_file': (f'original.{extension}', image_bytes, f'image/{extension}')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('remove_text', files={'image_file': self._image_file(image, extension=extension)})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -162,12 +267,16 @@ class Clipdrop:
 
         Args:
             image: Input image.
-            width: Output image width. Must be between 1 and 4096.
-            height: Output image height. Must be between 1 and 4096.
+            width: Output image width. Widths above max_image_sizes['upscale'] are upscaled in tiles.
+            height: Output image height. Heights above max_image_sizes['upscale'] are upscaled in tiles.
 
         Returns:
             An Image with the given resolution.
 
+        Raises:
+            ValueError: If the upscale factor is larger than max_image_sizes['upscale'], so that even a single pixel
+                would be too large to upscale in one request.
+
         Example::
 
             from PIL import Image
@@ -183,12 +292,19 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_upscale_closeup.png
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['UPSCALE_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 data={'target_width': width, 'target_height': height},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        max_size = self.max_image_sizes['upscale']
+        if width > max_size or height > max_size:
+            scale = (width / image.width, height / image.height)
+            tile_size = int(min(self.tile_size, max_size / max(scale)))
+            if tile_size < 1:
+                raise ValueError(f'Unable to upscale a {image.width}x{image.height} image to {width}x{height}: the '
+                                 f'upscale factor may be at most {max_size}.')
+            return self._tiled(lambda tile, _, size: self.upscale(tile, width=size[0], height=size[1]), image,
+                               tile_size=tile_size, scale=scale)
+
+        response = self._post('upscale',
+                              files={'image_file': self._image_file(image)},
+                              data={'target_width': width, 'target_height': height})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -223,13 +339,17 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_inpaint.png
         """
-        image_bytes = pil_to_bytes(image)
-        mask_bytes = pil_to_bytes(mask)
-
-        response = requests.post(self.config['CLIPDROP']['INPAINT_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png'),
-                                        'mask_file': ('mask.png', mask_bytes, 'image/png')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        if max(image.size) > self.max_image_sizes['inpaint']:
+            def inpaint_tile(tile: Image, tile_mask: Image, _) -> Image:
+                if tile_mask.getbbox() is None:  # Nothing to inpaint in this tile
+                    return tile
+                return self.inpaint(tile, tile_mask)
+            return self._tiled(inpaint_tile, image, mask=mask,
+                               tile_size=min(self.tile_size, self.max_image_sizes['inpaint']))
+
+        response = self._post('inpaint',
+                              files={'image_file': self._image_file(image),
+                                     'mask_file': self._image_file(mask, name='mask')})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -258,11 +378,7 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_portrait_depth.png
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['PORTRAIT_DEPTH_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('portrait_depth', files={'image_file': self._image_file(image)})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -291,11 +407,7 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_surface_normals.png
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['PORTRAIT_SURFACE_NORMALS_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('portrait_surface_normals', files={'image_file': self._image_file(image)})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -311,6 +423,7 @@ class Clipdrop:
         Args:
             image: Input image.
             prompt: Prompt describing the image to generate.
+            extension: The image format to upload the sketch as, one of 'png', 'jpg' or 'webp'.
 
         Returns:
             An image matching the sketch and prompt.
@@ -330,12 +443,9 @@ class Clipdrop:
         .. warning::
             The Sketch-to-Image API has not been tested successfully. It appears to be an issue on the API side.
         """
-        image_bytes = pil_to_bytes(image)
-
-        response = requests.post(self.config['CLIPDROP']['SKETCH_TO_IMAGE_URL'],
-                                 files={'image_file': (f'original.{extension}', image_bytes, f'image/{extension}')},
-                                 data={'prompt': prompt},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('sketch_to_image',
+                              files={'image_file': self._image_file(image, extension=extension)},
+                              data={'prompt': prompt})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -364,11 +474,11 @@ class Clipdrop:
 
         .. image:: sample_resources/clipdrop_reimagine.png
         """
-        image_bytes = pil_to_bytes(image)
+        if max(image.size) > self.max_image_sizes['reimagine']:
+            return self._tiled(lambda tile, _, __: self.reimagine(tile), image,
+                               tile_size=min(self.tile_size, self.max_image_sizes['reimagine']))
 
-        response = requests.post(self.config['CLIPDROP']['REIMAGINE_URL'],
-                                 files={'image_file': ('original.png', image_bytes, 'image/png')},
-                                 headers={'x-api-key': self.config['API_KEYS']['CLIPDROP']})
+        response = self._post('reimagine', files={'image_file': self._image_file(image)})
 
         if response.ok:
             return bytes_to_pil(response.content)
@@ -1,5 +1,5 @@
 from PIL.Image import Image
-from typing import List, Optional, Protocol
+from typing import Iterator, List, Optional, Protocol
 
 from dosaku.types import Audio, Message
 
@@ -17,6 +17,9 @@ class BackendAgent(Protocol):
     def text_to_speech(self, text: str) -> Audio:
         raise NotImplementedError
 
+    def text_to_speech_stream(self, text: str) -> Iterator[bytes]:
+        raise NotImplementedError
+
     def text_to_image(self, prompt: str) -> Image:
         raise NotImplementedError
 
@@ -31,6 +34,14 @@ class BackendAgent(Protocol):
     ) -> str:
         return self.transcribe_audio(audio)
 
+    def transcribe_interview_stream(
+            self,
+            audio_file: str,
+            interviewer: Optional[str] = None,
+            interviewee: Optional[str] = None
+    ) -> Iterator[str]:
+        raise NotImplementedError
+
     def voices(self) -> List[str]:
         raise NotImplementedError
 
@@ -1,7 +1,7 @@
 import json
 from PIL.Image import Image
 import requests
-from typing import List
+from typing import Iterator, List, Optional
 
 from dosaku.types import Audio, Message
 from dosaku.utils import ascii_to_pil
@@ -31,3 +31,24 @@ class Connection:
         response = requests.request('POST', self.host + 'text-to-speech', json={'text': text})
         audio_ascii = json.loads(response.content)['audio']
         return Audio.from_ascii(audio_ascii)
+
+    def text_to_speech_stream(self, text: str, chunk_size: int = 4096) -> Iterator[bytes]:
+        response = requests.request('POST', self.host + 'text-to-speech-stream', json={'text': text}, stream=True)
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+
+    def transcribe_interview_stream(
+            self,
+            audio_file: str,
+            interviewer: Optional[str] = 'Interviewer',
+            interviewee: Optional[str] = 'Interviewee'
+    ) -> Iterator[str]:
+        response = requests.request(
+            'POST',
+            self.host + 'transcribe-interview-stream',
+            json={'audio_file': audio_file, 'interviewer': interviewer, 'interviewee': interviewee},
+            stream=True)
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)['text']
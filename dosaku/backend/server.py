@@ -1,13 +1,16 @@
 from __future__ import annotations
 from typing import Optional, TYPE_CHECKING
 
+import json
+
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 
 if TYPE_CHECKING:
     from dosaku import BackendAgent
 from dosaku import DosakuBase
 from dosaku.agents import Dosaku
-from dosaku.utils import pil_to_ascii
+from dosaku.utils import IMAGE_ENCODINGS, pil_to_ascii
 from dosaku.backend.connection import Connection
 from dosaku.backend.types import (ChatInput,
                                   TextToImageInput,
@@ -17,6 +20,8 @@ from dosaku.backend.types import (ChatInput,
 
 
 class Server(DosakuBase):
+    image_encoding = IMAGE_ENCODINGS['lossless_fast']  # Lossless, and fast to encode for 1024px+ images
+
     def __init__(self, agent: Optional[BackendAgent] = None):
         super().__init__()
         self.agent = agent
@@ -40,17 +45,31 @@ class Server(DosakuBase):
         @_app.post('/text-to-image')
         def text_to_image(payload: TextToImageInput):
             image = self.agent.text_to_image(prompt=payload.prompt)
-            return {'prompt': payload.prompt, 'image': pil_to_ascii(image)}
+            return {'prompt': payload.prompt, 'image': pil_to_ascii(image, **self.image_encoding)}
 
         @_app.post('/text-to-speech')
         def text_to_speech(payload: TextToSpeechInput):
             audio = self.agent.text_to_speech(text=payload.text)
             return {'text': payload.text, 'audio': audio.to_ascii()}
 
+        @_app.post('/text-to-speech-stream')
+        def text_to_speech_stream(payload: TextToSpeechInput):
+            return StreamingResponse(self.agent.text_to_speech_stream(text=payload.text), media_type='audio/mpeg')
+
         @_app.post('/transcribe-interview')
         def transcribe_interview(payload: TranscribeInterviewInput):
             pass
 
+        @_app.post('/transcribe-interview-stream')
+        def transcribe_interview_stream(payload: TranscribeInterviewInput):
+            sections = self.agent.transcribe_interview_stream(
+                audio_file=payload.audio_file,
+                interviewer=payload.interviewer,
+                interviewee=payload.interviewee)
+            return StreamingResponse(
+                (json.dumps({'text': section}) + '\n' for section in sections),
+                media_type='application/x-ndjson')
+
         @_app.post('/voices')
         def voices():
             return {'voices': self.agent.voices()}
@@ -0,0 +1,301 @@
+"""Process-wide registry for sharing loaded models between module instances."""
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import weakref
+
+from dosaku import Config, OptionNotSupported
+from dosaku.core.model_snapshot import has_snapshot, snapshot_path
+from dosaku.utils import ifnone
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    """Unique key identifying a loaded model within the registry."""
+    task: str
+    model: str
+    device: Optional[str] = None
+    dtype: Optional[str] = None
+    quantization: Optional[str] = None
+    compiled: bool = False
+    pipeline_kwargs: Tuple[Tuple[str, Hashable], ...] = ()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Return a hashable form of the given (pipeline keyword argument) value, so that it may be part of a ModelKey."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(val)) for key, val in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(val) for val in value)
+    elif isinstance(value, set):
+        return frozenset(_freeze(val) for val in value)
+    try:
+        hash(value)
+    except TypeError as err:
+        raise ValueError(f'Pipeline keyword argument value {value!r} is not hashable, and so cannot be part of a model '
+                         f'key.') from err
+    return value
+
+
+class ModelHandle:
+    """Shared handle to a model held by a ModelRegistry.
+
+    Handles are callable and forward any call or attribute lookup to the underlying model (e.g. a Hugging Face
+    pipeline), so that they may be used as drop-in replacements for the model itself. The model is released back to the
+    registry when the handle is garbage collected, or when release() is called explicitly.
+    """
+    def __init__(self, registry: 'ModelRegistry', key: ModelKey, model: Any):
+        self.key = key
+        self.model = model
+        self._registry = registry
+        self._finalizer = weakref.finalize(self, registry.release, key)
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+    def release(self):
+        """Release the handle. The model may be evicted once all of its handles have been released."""
+        self._finalizer()
+
+    def warm_up(self, warmup: Callable[[Any], None]) -> bool:
+        """Warm up the shared model, unless another handle to it has already done so. See ModelRegistry.warm_up."""
+        return self._registry.warm_up(self.key, warmup)
+
+    def __call__(self, *args, **kwargs):
+        return self.model(*args, **kwargs)
+
+    def __getattr__(self, item: str):
+        if item in ('model', '_registry'):
+            raise AttributeError(item)
+        return getattr(self.model, item)
+
+
+class _Entry:
+    def __init__(self, model: Any, size: int):
+        self.model = model
+        self.size = size
+        self.ref_count = 0
+        self.warmed_up = False
+
+
+class ModelRegistry:
+    """Reference-counted model registry.
+
+    The registry loads each model at most once per process, keyed by (task, model, device, dtype, quantization,
+    compiled, pipeline_kwargs), and hands out shared ModelHandles to it. Models with no outstanding handles are kept
+    around as idle models so that they may be reused, but will be evicted, least recently used first, once the total
+    memory used by the registry exceeds the memory budget. Models that are still in use are never evicted.
+
+    If a snapshot of the model exists in DIR_PATHS/MODELS (see dosaku.core.model_snapshot) it will be loaded from there,
+    with its weights memory-mapped, instead of from the Hugging Face hub cache. Models whose snapshot is missing, stale
+    or fails to load are loaded from the hub.
+
+    Args:
+        memory_budget (optional): The memory budget, in bytes. If not given, it will be read from the MODEL_REGISTRY
+            section of the config (in MB). A budget of 0 disables eviction.
+
+    Example::
+
+        from dosaku import model_registry
+
+        summarizer = model_registry.acquire('summarization', 'facebook/bart-large-cnn')
+        same_summarizer = model_registry.acquire('summarization', 'facebook/bart-large-cnn')  # Does not reload
+        assert summarizer.model is same_summarizer.model
+        print(summarizer('Some long text to summarize ...')[0]['summary_text'])
+    """
+    config = Config()
+    logger = logging.getLogger(__name__)
+    quantization_options = ['int8']
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        if memory_budget is None:
+            memory_budget = int(self.config['MODEL_REGISTRY']['MEMORY_BUDGET']) * 2 ** 20
+        self.memory_budget = memory_budget
+        self._entries: Dict[ModelKey, _Entry] = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = dict()
+
+    @property
+    def memory_usage(self) -> int:
+        """The total (estimated) memory used by all registered models, in bytes."""
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def ref_count(self, key: ModelKey) -> int:
+        """Return the number of outstanding handles for the given model."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.ref_count if entry is not None else 0
+
+    def acquire(
+            self,
+            task: str,
+            model: str,
+            device: Optional[str] = None,
+            dtype: Optional[str] = None,
+            quantization: Optional[str] = None,
+            compiled: bool = False,
+            loader: Optional[Callable[[ModelKey], Any]] = None,
+            **pipeline_kwargs
+    ) -> ModelHandle:
+        """Return a shared handle to the given model, loading it if it is not yet registered.
+
+        Args:
+            task: The Hugging Face pipeline task, e.g. 'summarization'.
+            model: The Hugging Face model name, e.g. 'facebook/bart-large-cnn'.
+            device (optional): The device to load the model onto.
+            dtype (optional): The torch dtype to load the model weights with, e.g. 'float16'.
+            quantization (optional): The quantization to apply after loading. Currently only 'int8' (dynamic
+                quantization of linear layers) is supported.
+            compiled: Whether to compile the model with torch.compile after loading.
+            loader (optional): Callable used to load the model from its key. Defaults to loading a Hugging Face
+                pipeline.
+            **pipeline_kwargs: Any additional keyword arguments passed to the Hugging Face pipeline when loading. They
+                form part of the model key, and so must be hashable (dicts, lists and sets of hashable values are also
+                accepted).
+
+        Returns:
+            A handle to the shared model.
+        """
+        if quantization is not None and quantization not in self.quantization_options:
+            raise OptionNotSupported(
+                f'Unknown quantization "{quantization}". Expected one of {self.quantization_options}.')
+        key = ModelKey(task=task, model=model, device=device, dtype=dtype, quantization=quantization,
+                       compiled=compiled, pipeline_kwargs=_freeze(pipeline_kwargs))
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:  # Only one thread loads a given model; any others wait for it to finish
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                loaded_model = loader(key) if loader is not None else self._load(key, **pipeline_kwargs)
+                entry = _Entry(model=loaded_model, size=self._model_size(loaded_model))
+                self.logger.info(f'Loaded model {key} ({entry.size / 2 ** 20:.1f} MB).')
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                entry.ref_count += 1
+                self._evict()
+
+        return ModelHandle(self, key, entry.model)
+
+    def warm_up(self, key: ModelKey, warmup: Callable[[Any], None]) -> bool:
+        """Run the given warm-up function on a registered model, unless the model has already been warmed up.
+
+        Warm-up is tracked per loaded model rather than per module instance, so modules sharing a model only warm it up
+        once. A model which is evicted and later reloaded is warmed up again.
+
+        Args:
+            key: The key of the model to warm up.
+            warmup: Callable taking the model and warming it up, e.g. by running a few passes on dummy data.
+
+        Returns:
+            Whether the warm-up function was run.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        if entry is None:
+            raise KeyError(f'Model {key} is not registered.')
+
+        with load_lock:  # Any other handles wait for the warm-up to finish rather than running their own
+            if entry.warmed_up:
+                return False
+            warmup(entry.model)
+            entry.warmed_up = True
+            return True
+
+    def release(self, key: ModelKey):
+        """Decrement the reference count of the given model.
+
+        In general you should call ModelHandle.release() (or simply drop the handle) rather than calling this directly.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.ref_count == 0:
+                return
+            entry.ref_count -= 1
+            self._evict()
+
+    def evict(self, memory_budget: Optional[int] = None):
+        """Evict idle models until the memory used is within the given budget.
+
+        Args:
+            memory_budget (optional): The budget to evict down to, in bytes. Defaults to the registry budget. Pass 0 to
+                evict every idle model.
+        """
+        with self._lock:
+            self._evict(memory_budget=ifnone(memory_budget, default=self.memory_budget), force=True)
+
+    def _evict(self, memory_budget: Optional[int] = None, force: bool = False):
+        memory_budget = ifnone(memory_budget, default=self.memory_budget)
+        if memory_budget <= 0 and not force:  # Eviction disabled
+            return
+        for key in list(self._entries.keys()):  # Ordered from least to most recently used
+            if 0 < memory_budget and self.memory_usage <= memory_budget:
+                break
+            if self._entries[key].ref_count == 0:
+                self.logger.info(f'Evicting idle model {key}.')
+                del self._entries[key]
+        if self.memory_usage > memory_budget > 0:
+            self.logger.warning(f'Models in use ({self.memory_usage / 2 ** 20:.1f} MB) exceed the memory budget '
+                                f'({memory_budget / 2 ** 20:.1f} MB).')
+
+    @classmethod
+    def _load(cls, key: ModelKey, **pipeline_kwargs) -> Any:
+        import torch
+        from transformers import pipeline
+
+        if key.dtype is not None:
+            pipeline_kwargs['torch_dtype'] = getattr(torch, key.dtype)
+        model = None
+        if has_snapshot(key.model):  # Memory-map the snapshot weights rather than deserializing them
+            model_kwargs = dict(pipeline_kwargs.get('model_kwargs', dict()))
+            model_kwargs.setdefault('low_cpu_mem_usage', True)
+            model_kwargs.setdefault('use_safetensors', True)
+            try:
+                model = pipeline(key.task, model=snapshot_path(key.model), device=key.device,
+                                 **{**pipeline_kwargs, 'model_kwargs': model_kwargs})
+            except (OSError, ValueError) as err:  # E.g. weights deleted from the snapshot; load from the hub instead
+                cls.logger.warning(f'Unable to load the snapshot of {key.model}, loading it from the hub: {err}')
+        if model is None:
+            model = pipeline(key.task, model=key.model, device=key.device, **pipeline_kwargs)
+        if key.quantization == 'int8':
+            model.model = torch.ao.quantization.quantize_dynamic(
+                model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if key.compiled:
+            model.model = torch.compile(model.model)
+        return model
+
+    @staticmethod
+    def _model_size(model: Any) -> int:
+        """Estimate the memory used by a model (or pipeline), in bytes, from its state dict."""
+        module = getattr(model, 'model', model)
+        if not hasattr(module, 'state_dict'):
+            return 0
+
+        def nbytes(value) -> int:
+            if hasattr(value, 'element_size') and hasattr(value, 'numel'):
+                return value.element_size() * value.numel()
+            elif isinstance(value, (tuple, list)):
+                return sum(nbytes(val) for val in value)
+            return 0
+
+        return sum(nbytes(value) for value in module.state_dict().values())
+
+    def __contains__(self, key: ModelKey) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+model_registry = ModelRegistry()
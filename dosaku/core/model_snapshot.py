@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Fast-load model snapshots.
+
+A snapshot is a copy of a Hugging Face pipeline (model weights, resolved config, tokenizer and feature extractor)
+saved into the DIR_PATHS/MODELS directory, with the weights stored as safetensors. Safetensors files are memory-mapped
+on load, so the weights are read straight from the file rather than unpickled into a temporary copy first, which
+lowers both load time and peak memory use.
+
+The models to snapshot are configured under MODEL_REGISTRY/SNAPSHOTS in the config as a comma-separated list of
+task:model pairs. Run the snapshot command to write them to disk::
+
+    dosaku_snapshot
+
+The ModelRegistry loads any model with a snapshot from disk automatically.
+"""
+import argparse
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from dosaku import Config
+
+logger = logging.getLogger(__name__)
+manifest_filename = 'dosaku_snapshot.json'
+
+
+def snapshot_path(model: str, models_dir: Optional[str] = None) -> str:
+    """Return the snapshot directory for the given Hugging Face model name."""
+    models_dir = models_dir if models_dir is not None else Config()['DIR_PATHS']['MODELS']
+    return os.path.join(models_dir, model.replace('/', '--'))
+
+
+def has_snapshot(model: str, models_dir: Optional[str] = None) -> bool:
+    """Return whether a complete snapshot of the given model exists.
+
+    A snapshot whose manifest is missing (i.e. which was never completely written), unreadable or records a different
+    model (e.g. left behind under a clashing directory name) is stale, and does not count.
+    """
+    try:
+        with open(os.path.join(snapshot_path(model, models_dir=models_dir), manifest_filename), 'r') as manifest:
+            return json.load(manifest).get('model') == model
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def configured_snapshots(config: Optional[Config] = None) -> List[Tuple[str, str]]:
+    """Return the (task, model) pairs listed under MODEL_REGISTRY/SNAPSHOTS in the config."""
+    config = config if config is not None else Config()
+    entries = [entry.strip() for entry in config['MODEL_REGISTRY']['SNAPSHOTS'].split(',') if entry.strip()]
+    return [tuple(entry.split(':', maxsplit=1)) for entry in entries]
+
+
+def save_snapshot(task: str, model: str, models_dir: Optional[str] = None, overwrite: bool = False) -> str:
+    """Save a memory-mappable snapshot of the given Hugging Face pipeline.
+
+    Args:
+        task: The Hugging Face pipeline task, e.g. 'summarization'.
+        model: The Hugging Face model name, e.g. 'facebook/bart-large-cnn'.
+        models_dir (optional): The directory to save the snapshot into. Defaults to DIR_PATHS/MODELS.
+        overwrite: Whether to overwrite an existing snapshot.
+
+    Returns:
+        The snapshot directory.
+    """
+    from transformers import pipeline
+
+    path = snapshot_path(model, models_dir=models_dir)
+    if has_snapshot(model, models_dir=models_dir) and not overwrite:
+        logger.info(f'Snapshot for {model} already exists at {path}.')
+        return path
+
+    pipe = pipeline(task, model=model, device='cpu')
+    if os.path.exists(os.path.join(path, manifest_filename)):  # Incomplete until rewritten
+        os.remove(os.path.join(path, manifest_filename))
+    pipe.save_pretrained(path, safe_serialization=True)
+    with open(os.path.join(path, manifest_filename), 'w') as manifest:  # Written last; marks the snapshot complete
+        json.dump({'task': task, 'model': model}, manifest, indent=4)
+    logger.info(f'Saved snapshot for {model} to {path}.')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write fast-load snapshots of the configured models.')
+    parser.add_argument('--models', nargs='+', default=None,
+                        help='task:model pairs to snapshot. Defaults to MODEL_REGISTRY/SNAPSHOTS in the config.')
+    parser.add_argument('--models_dir', type=str, nargs='?', default=None)
+    parser.add_argument('--overwrite', action='store_true')
+
+    opt = parser.parse_args()
+    if opt.models is None:
+        snapshots = configured_snapshots()
+    else:
+        snapshots = [tuple(entry.split(':', maxsplit=1)) for entry in opt.models]
+
+    for task, model in snapshots:
+        path = save_snapshot(task, model, models_dir=opt.models_dir, overwrite=opt.overwrite)
+        print(f'{model} ({task}): {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from math import floor
 import os
 import requests
 from typing import List, Optional
+import uuid
 
 import discord
 from discord.ext import commands
@@ -117,11 +120,14 @@ class DiscordBot(DosakuBase):
         @bot.command()
         async def text_to_speech(ctx, *, text: Optional[str] = None):
             self.logger.debug(f'Received text_to_speech request from user {ctx.author} with text: {text}')
-            filename = os.path.join(self.config['DIR_PATHS']['TEMP'], 'audio.mp3')
+            filename = os.path.join(self.config['DIR_PATHS']['TEMP'], f'audio_{uuid.uuid4().hex}.mp3')
             audio = self.backend_server.text_to_speech(text=text)
             audio.write(filename=filename)
             self.logger.debug(f'Returning text_to_speech request for user {ctx.author} with audio save to {filename}.')
-            await ctx.send('Sure, here\'s the associated audio:', file=discord.File(filename))
+            try:
+                await ctx.send('Sure, here\'s the associated audio:', file=discord.File(filename))
+            finally:
+                os.remove(filename)
 
         @bot.command()
         async def transcribe_audio(
@@ -131,18 +137,30 @@ class DiscordBot(DosakuBase):
         ):
             self.logger.debug(f'Received transcribe_audio request from user {ctx.author}.')
             attachment_url = ctx.message.attachments[0].url
-            file_request = requests.get(attachment_url)
-            filename = os.path.join(self.config['DIR_PATHS']['TEMP'], 'audio.mp3')
+            file_request = await asyncio.to_thread(requests.get, attachment_url)
+            filename = os.path.join(self.config['DIR_PATHS']['TEMP'], f'audio_{uuid.uuid4().hex}.mp3')
             with open(filename, 'wb') as audio_file:
                 audio_file.write(file_request.content)
 
-            transcription = self.backend_server.transcribe_interview(
+            sections = self.backend_server.transcribe_interview_stream(
                 audio_file=filename,
                 interviewer=interviewer,
                 interviewee=interviewee
             )
+            # Pull each section in a worker thread so the event loop is not blocked while the server transcribes. A
+            # single worker also serializes closing the stream after any pull that is still running.
+            loop = asyncio.get_running_loop()
+            puller = ThreadPoolExecutor(max_workers=1)
+            max_len = 2000
+            try:
+                while (section := await loop.run_in_executor(puller, next, sections, None)) is not None:
+                    for start in range(0, len(section), max_len):  # Send each part as soon as the server has it
+                        await ctx.send(section[start:start + max_len])
+            finally:
+                puller.submit(sections.close)  # Stops the transcription if the command is cancelled
+                puller.submit(os.remove, filename)  # Only once the stream no longer reads the upload
+                puller.shutdown(wait=False)
             self.logger.debug(f'Returning transcribe_audio request for user {ctx.author}.')
-            await ctx.send(f'{transcription}')
 
         @bot.command()
         async def set_voice(ctx, voice: str):
@@ -1,21 +1,22 @@
-from transformers import pipeline
-
-from dosaku import Module
+from dosaku import Module, model_registry
 
 
 class BARTSummarizer(Module):
     """Meta's BART model set up for summarization.
 
     Refer to the `paper <https://arxiv.org/abs/1910.13461>`_ for model details.
+
+    The underlying model is shared, through the model registry, between all BARTSummarizer instances on the same device.
     """
     name = 'BARTSummarizer'
+    model_name = 'facebook/bart-large-cnn'
 
     def __init__(self, device='cuda'):
         super().__init__()
 
-        self.model = pipeline(
-            "summarization",
-            model="facebook/bart-large-cnn",
+        self.model = model_registry.acquire(
+            'summarization',
+            self.model_name,
             device=device)
 
     def summarize(self, text: str, min_length: str = 30, max_length: str = 130, do_sample: bool = False) -> str:
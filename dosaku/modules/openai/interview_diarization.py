@@ -1,13 +1,20 @@
 """OpenAI InterviewDiarization module."""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from math import ceil
 import os
+import re
+import threading
+from typing import Iterator, List, Optional
 
+import numpy as np
 from openai import OpenAI
 from pydub import AudioSegment
 
-from dosaku import Service
-from dosaku.modules import GPT
-from dosaku.utils import ifnone
+from dosaku import OptionNotSupported, Service
+from dosaku.modules import GPT, Whisper
+from dosaku.types import Audio
+from dosaku.utils import (clean_transcript, codec_pool, decode_stream, ifnone, JobManifest, silence_boundaries,
+                          split_stream, TranscriptionCache)
 
 
 class OpenAIInterviewDiarization(Service):
@@ -21,7 +28,20 @@ class OpenAIInterviewDiarization(Service):
         audio_file = 'tests/resources/fridman_susskind.mp3'
         text = transcriber.transcribe_interview(audio_file, interviewer='Lex Fridman', interviewee='Leonard Susskind')
         print(text)
+
+    Args:
+        use_cache: Whether to cache Whisper API transcriptions by audio content. Cached chunks are not re-sent to the
+            API, even when re-submitted under a different filename.
+        cache (optional): The transcription cache to use. Defaults to the default TranscriptionCache.
+        whisper (optional): The local Whisper model to use in the fast mode. Defaults to a Whisper model using the
+            whisper_profile inference profile, loaded on first use.
     """
+    whisper_model = 'whisper-1'
+
+    # Whisper resamples all audio to 16 kHz mono, so uploading anything richer only costs bandwidth
+    upload_format = 'mp3'
+    upload_sample_rate = 16000
+    upload_bitrate = '32k'
 
     whisper_instructions = (
         'INTERVIEWER: So I was just thinking about the Roman Empire, as one does.\n'
@@ -29,6 +49,38 @@ class OpenAIInterviewDiarization(Service):
         'INTERVIEWEE: Is that whole meme where all guys are thinking about the Roman Empire at least once a day?\n'
     )
 
+    whisper_profile = 'cpu'
+
+    labelling_instructions = (
+        'You are an expert editor tasked with labelling the speakers in transcribed text from interviews. You will be '
+        'given cleaned up interview text between an interviewer and an interviewee, split into chunks. Each chunk '
+        'starts with a marker line such as [[CHUNK 0]]. Your task is to add speaker labels whenever the speaker '
+        'changes, without otherwise changing the text. If you are given the names of the interviewer and interviewee '
+        'use them as the labels; if the names are not given, use "INTERVIEWER" and "INTERVIEWEE". Keep every chunk '
+        'marker, unchanged and in order, on its own line, and start each chunk with a speaker label.\n'
+        '\n'
+        'For example, given the text:\n'
+        '\n'
+        'Lex Fridman interviewing Elon Musk:\n'
+        '\n'
+        '[[CHUNK 0]]\n'
+        'So I was just thinking about the Roman Empire, as one does.\n'
+        'Is that whole meme where all guys are thinking about the Roman Empire at least once a day?\n'
+        '\n'
+        '[[CHUNK 1]]\n'
+        'And half the population is confused whether it’s true or not.\n'
+        '\n'
+        'You should respond with the following text:\n'
+        '\n'
+        '[[CHUNK 0]]\n'
+        'LEX FRIDMAN: So I was just thinking about the Roman Empire, as one does.\n'
+        '\n'
+        'ELON MUSK: Is that whole meme where all guys are thinking about the Roman Empire at least once a day?\n'
+        '\n'
+        '[[CHUNK 1]]\n'
+        'LEX FRIDMAN: And half the population is confused whether it’s true or not.\n'
+    )
+
     gpt_instructions = (
         'You are an expert editor tasked with editing transcribed text from interviews. You will be given raw '
         'interview text between an interviewer and an interviewee. The raw text will not have '
@@ -63,91 +115,398 @@ class OpenAIInterviewDiarization(Service):
 
     def __init__(
         self,
+        use_cache: bool = True,
+        cache: Optional[TranscriptionCache] = None,
+        whisper: Optional[Whisper] = None,
         **kwargs
     ):
         super().__init__(**kwargs)
         self.client = OpenAI(api_key=self.config['API_KEYS']['OPENAI'])
+        self.cache = None
+        if use_cache:
+            self.cache = cache if cache is not None else TranscriptionCache()
+        self._whisper = whisper
+        self._whisper_lock = threading.RLock()
+
+    @staticmethod
+    def split_chunks(raw_audio: AudioSegment, chunk_length: int, tolerance: int = 0) -> List[AudioSegment]:
+        """Split audio into chunks of at most chunk_length milliseconds.
+
+        If a tolerance is given, each cut is moved back by up to tolerance milliseconds to the quietest point in the
+        audio, so that chunks are cut between words rather than in the middle of them.
+
+        Args:
+            raw_audio: The audio to split.
+            chunk_length: The maximum length of each chunk, in milliseconds.
+            tolerance: How far back a cut may be moved to find silence, in milliseconds.
+
+        Returns:
+            The audio chunks, in order.
+        """
+        if tolerance <= 0:
+            num_chunks = ceil(len(raw_audio) / chunk_length)
+            spans = [(chunk_length * idx, min(chunk_length * (idx + 1), len(raw_audio) - 1))
+                     for idx in range(num_chunks)]
+        else:
+            if raw_audio.sample_width == 3:  # No numpy type for 24 bit samples
+                raw_audio = raw_audio.set_sample_width(4)
+            audio = Audio.from_pcm(raw_audio.raw_data, raw_audio.frame_rate, channels=raw_audio.channels,
+                                   dtype=f'<i{raw_audio.sample_width}')
+            to_ms = 1000 / audio.sample_rate
+            spans = [(int(start * to_ms), int(end * to_ms)) for start, end in silence_boundaries(
+                audio.data, audio.sample_rate, chunk_length=chunk_length / 1000, tolerance=tolerance / 1000)]
+        return [raw_audio[start:end] for start, end in spans]
+
+    def stream_chunks(
+            self,
+            audio_file: str,
+            chunk_length: int,
+            tolerance: int = 0,
+            block_length: int = 60000
+    ) -> Iterator[AudioSegment]:
+        """Decode and split an audio file into chunks as a stream, holding only about one chunk in memory at a time.
+
+        The audio is decoded straight to the upload sample rate in mono, and split at the same boundaries as
+        split_chunks() would.
+
+        Args:
+            audio_file: The audio file to split.
+            chunk_length: The maximum length of each chunk, in milliseconds.
+            tolerance: How far back a cut may be moved to find silence, in milliseconds.
+            block_length: The length of each block decoded at a time, in milliseconds.
+
+        Returns:
+            An iterator over the audio chunks, in order.
+        """
+        sample_rate = self.upload_sample_rate
+        blocks = decode_stream(audio_file, sample_rate, channels=1, block_size=block_length * sample_rate // 1000)
+        for chunk in split_stream(blocks, sample_rate, chunk_length=chunk_length / 1000, tolerance=tolerance / 1000):
+            yield AudioSegment(chunk.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1)
+
+    def encode_chunk(self, audio_chunk: AudioSegment) -> bytes:
+        """Encode an audio chunk in memory as compact (mono, 16 kHz, low bitrate) audio for upload to the Whisper API.
+
+        Args:
+            audio_chunk: The decoded audio chunk.
+
+        Returns:
+            The encoded audio, in upload_format.
+        """
+        audio_chunk = audio_chunk.set_channels(1).set_frame_rate(self.upload_sample_rate)
+        return codec_pool.encode(self._chunk_samples(audio_chunk), sample_rate=self.upload_sample_rate,
+                                 format=self.upload_format, bitrate=self.upload_bitrate)
+
+    @staticmethod
+    def _chunk_samples(audio_chunk: AudioSegment) -> np.ndarray:
+        """View an audio chunk as 16 bit samples, of shape (num_samples,) or (num_samples, num_channels)."""
+        samples = np.frombuffer(audio_chunk.set_sample_width(2).raw_data, dtype='<i2')
+        return samples.reshape(-1, audio_chunk.channels) if audio_chunk.channels > 1 else samples
+
+    def transcribe_chunk(
+            self,
+            audio_chunk: AudioSegment,
+            audio_bytes: Optional[bytes] = None,
+            name: str = 'chunk'
+    ) -> str:
+        """Transcribe a single audio chunk with the Whisper API, reusing any cached transcription of the same audio.
+
+        Args:
+            audio_chunk: The decoded audio chunk, used to look up the transcription cache.
+            audio_bytes (optional): The chunk, already encoded for upload. On a cache miss, the chunk is encoded with
+                encode_chunk() if not given.
+            name: Name of the chunk, used in log messages and as the upload filename.
+
+        Returns:
+            The raw transcribed text.
+        """
+        key = None
+        if self.cache is not None:
+            pcm = np.array(audio_chunk.get_array_of_samples())
+            key = self.cache.key(
+                pcm, audio_chunk.frame_rate, model=self.whisper_model, prompt=self.whisper_instructions)
+            text = self.cache.get(key)
+            if text is not None:
+                self.logger.debug(f'Found cached transcription for audio chunk {name}')
+                return text
+
+        audio_bytes = audio_bytes if audio_bytes is not None else self.encode_chunk(audio_chunk)
+        transcript = self.client.audio.transcriptions.create(
+            model=self.whisper_model,
+            file=(f'{name}.{self.upload_format}', audio_bytes),
+            prompt=self.whisper_instructions,
+        )
+        if key is not None:
+            self.cache.put(key, transcript.text)
+        return transcript.text
+
+    def edit_chunk(self, text: str, interviewer: str = 'Interviewer', interviewee: str = 'Interviewee') -> str:
+        """Edit a raw transcribed chunk with GPT, adding speaker labels and punctuation and removing filler words.
+
+        Args:
+            text: The raw transcribed text.
+            interviewer: The name of the interviewer.
+            interviewee: The name of the interviewee.
+
+        Returns:
+            The edited text.
+        """
+        text = f'{interviewer} interviewing {interviewee}:\n\n{text}'
+        gpt = GPT(instructions=self.gpt_instructions)
+        return gpt.message(text).message
+
+    def label_speakers(
+            self,
+            texts: List[str],
+            interviewer: str = 'Interviewer',
+            interviewee: str = 'Interviewee'
+    ) -> List[str]:
+        """Add speaker labels to several cleaned up transcribed chunks with a single GPT request.
+
+        Each chunk is preceded by a chunk marker, which GPT is instructed to keep, so that the labelled text can be
+        split back into its chunks. Should GPT drop or mangle any marker, each chunk is labelled with its own request
+        instead.
+
+        Args:
+            texts: The cleaned up text of each chunk, in order.
+            interviewer: The name of the interviewer.
+            interviewee: The name of the interviewee.
+
+        Returns:
+            The speaker-labelled text of each chunk.
+        """
+        message = f'{interviewer} interviewing {interviewee}:\n\n' + '\n\n'.join(
+            f'[[CHUNK {idx}]]\n{text}' for idx, text in enumerate(texts))
+        gpt = GPT(instructions=self.labelling_instructions)
+        reply = gpt.message(message).message
+
+        parts = re.split(r'\[\[CHUNK (\d+)\]\]', reply)
+        labelled = {int(idx): text.strip() for idx, text in zip(parts[1::2], parts[2::2])}
+        if sorted(labelled.keys()) == list(range(len(texts))):
+            return [labelled[idx] for idx in range(len(texts))]
+        if len(texts) == 1:
+            return [parts[-1].strip()]
 
-    def save_chunks(self, raw_audio: AudioSegment, chunk_length: int, overwrite: bool = False):
-        temp_dir = self.config['DIR_PATHS']['TEMP']
-        num_chunks = ceil(len(raw_audio) / chunk_length)
-        filenames = []
-        for idx in range(num_chunks):
-            filename = os.path.join(temp_dir, f'audio_{idx}.mp3')
-            if overwrite is True or not os.path.exists(filename):
-                start = chunk_length * idx
-                end = min(chunk_length * (idx + 1), len(raw_audio) - 1)
-                audio_chunk = raw_audio[start:end]
-                audio_chunk.export(filename, format='mp3')
-                self.logger.debug(f'Exported audio chunk to {filename}')
-            filenames.append(filename)
-
-        return filenames
+        self.logger.warning(f'GPT did not preserve the markers of {len(texts)} chunks; labelling them one at a time')
+        return [self.label_speakers([text], interviewer, interviewee)[0] for text in texts]
+
+    @property
+    def whisper(self) -> Whisper:
+        """The local Whisper model used by the fast mode, loaded on first use."""
+        with self._whisper_lock:
+            if self._whisper is None:
+                self._whisper = Whisper(
+                    profile=self.whisper_profile, use_cache=self.cache is not None, cache=self.cache)
+            return self._whisper
+
+    def transcribe_chunk_locally(self, audio_chunk: AudioSegment) -> str:
+        """Transcribe a single audio chunk with the local Whisper model and clean up the text.
+
+        Args:
+            audio_chunk: The decoded audio chunk.
+
+        Returns:
+            The transcribed text, without filler words and with each sentence on its own line.
+        """
+        audio = Audio.from_pcm(audio_chunk.raw_data, audio_chunk.frame_rate, channels=audio_chunk.channels)
+        whisper = self.whisper
+        with self._whisper_lock:  # The model runs one chunk at a time, using all of torch's threads
+            text = whisper.transcribe(audio)
+        return clean_transcript(text)
 
     def transcribe_interview(
             self,
             audio_file: str,
             chunk_length: int = 1200,
+            boundary_tolerance: int = 30,
             chunk_separater: str = '\n\n***GPT CHUNK BREAK***\n\n',
             overwrite_files: bool = True,
             interviewer: str = 'Interviewer',
-            interviewee: str = 'Interviewee'
+            interviewee: str = 'Interviewee',
+            max_workers: int = 4,
+            mode: str = 'accurate',
+            labelling_batch_size: int = 4,
+            restart: bool = False
     ):
         """Transcribe audio file with diarization (speak identification).
 
-        If the input file is too long it will be broken into separate chunks for processing.
+        If the input file is too long it will be broken into separate chunks for processing. Chunks are transcribed and
+        edited concurrently, with at most max_workers transcriptions and max_workers edits in flight at a time. Use
+        transcribe_interview_stream to receive each edited chunk as soon as it is ready.
 
         Args:
             audio_file: Path to the given mp3 file.
             chunk_length: Maximum length of each audio chunk for processing, in seconds.
+            boundary_tolerance: How far back, in seconds, each chunk boundary may be moved to cut the audio at a quiet
+                point rather than mid-word. Set to 0 to cut at fixed chunk_length offsets.
             chunk_separater: Separater text placed between transcribed chunks.
-            overwrite_files: Whether to overwrite temp files found with the same name.
+            overwrite_files: Whether to redo every stage, overwriting any checkpointed output of this job. Pass False to
+                resume a previously interrupted job.
             interviewer: The name of the interviewer.
             interviewee: The name of the interviewee.
+            max_workers: The maximum number of chunks to transcribe (and to edit) concurrently.
+            mode: One of {'accurate', 'fast'}. See transcribe_interview_stream.
+            labelling_batch_size: The number of chunks labelled per GPT request in the fast mode.
+            restart: Whether to delete any checkpointed progress of this job before starting. Raises a RuntimeError if
+                another worker is running the same job.
         """
+        sections = self.transcribe_interview_stream(
+            audio_file,
+            chunk_length=chunk_length,
+            boundary_tolerance=boundary_tolerance,
+            overwrite_files=overwrite_files,
+            interviewer=interviewer,
+            interviewee=interviewee,
+            max_workers=max_workers,
+            mode=mode,
+            labelling_batch_size=labelling_batch_size,
+            restart=restart)
+        return chunk_separater.join(section for section in sections if len(section) > 0)
+
+    def transcribe_interview_stream(
+            self,
+            audio_file: str,
+            chunk_length: int = 1200,
+            boundary_tolerance: int = 30,
+            overwrite_files: bool = True,
+            interviewer: str = 'Interviewer',
+            interviewee: str = 'Interviewee',
+            max_workers: int = 4,
+            mode: str = 'accurate',
+            labelling_batch_size: int = 4,
+            restart: bool = False
+    ) -> Iterator[str]:
+        """Transcribe audio file with diarization, yielding each edited chunk in order as soon as it is ready.
+
+        Transcription and editing form a pipeline: each chunk is sent for GPT editing as soon as its own transcription
+        finishes, so that editing chunk i overlaps with transcribing chunk i+1 onwards. Edited chunks are yielded in
+        order, so the first part of a long interview is available long before the whole interview is done. The audio
+        file is decoded as a stream, and only as far ahead as the transcribers can keep up with, so memory use does not
+        grow with the length of the interview.
+
+        In the 'accurate' mode, each chunk is transcribed with the Whisper API and then fully edited by GPT. The 'fast'
+        mode is meant for drafts: chunks are transcribed with the local Whisper model, filler words and sentence breaks
+        are handled locally, and GPT is only asked to add speaker labels, for labelling_batch_size chunks per request.
+
+        Each job is checkpointed into its own directory under DIR_PATHS/TEMP/interviews, keyed by a hash of the audio
+        file and the chunking parameters. With overwrite_files=False, a job that crashes or is restarted resumes where
+        it left off without repeating any API calls. Concurrent jobs never overwrite each other's files, and the job
+        directory is deleted once every chunk has been yielded.
+
+        Args:
+            audio_file: Path to the given mp3 file.
+            chunk_length: Maximum length of each audio chunk for processing, in seconds.
+            boundary_tolerance: How far back, in seconds, each chunk boundary may be moved to cut the audio at a quiet
+                point rather than mid-word. Set to 0 to cut at fixed chunk_length offsets.
+            overwrite_files: Whether to redo every stage, overwriting any checkpointed output of this job. Pass False to
+                resume a previously interrupted job.
+            interviewer: The name of the interviewer.
+            interviewee: The name of the interviewee.
+            max_workers: The maximum number of chunks to transcribe (and to edit) concurrently. In the fast mode,
+                chunks are transcribed one at a time by the local model.
+            mode: One of {'accurate', 'fast'}.
+            labelling_batch_size: The number of chunks labelled per GPT request in the fast mode.
+            restart: Whether to delete any checkpointed progress of this job before starting. Raises a RuntimeError if
+                another worker is running the same job.
+
+        Returns:
+            An iterator over the edited transcript of each chunk.
+
+        Example::
+
+            from dosaku.modules import OpenAIInterviewDiarization
+
+            transcriber = OpenAIInterviewDiarization()
+            audio_file = 'tests/resources/fridman_susskind.mp3'
+            for section in transcriber.transcribe_interview_stream(audio_file, chunk_length=600, mode='fast'):
+                print(section)
+        """
+        if mode not in ('accurate', 'fast'):
+            raise OptionNotSupported(f'Unknown transcription mode "{mode}". Expected one of [\'accurate\', \'fast\'].')
         chunk_length = chunk_length * 1000  # pydub measures time in ms
-        raw_audio = AudioSegment.from_mp3(audio_file)
-        files = self.save_chunks(raw_audio, chunk_length, overwrite=overwrite_files)
-
-        final_transcript = ''
-        for idx, audio_filename in enumerate(files):
-            text_filename = os.path.join(self.config['DIR_PATHS']['TEMP'], f'transcription_{idx}.txt')
-            gpt_text_filename = os.path.join(self.config['DIR_PATHS']['TEMP'], f'gpt_transcription_{idx}.txt')
-
-            if overwrite_files or not os.path.exists(text_filename):
-                with (
-                    open(audio_filename, 'rb') as audio_file,
-                    open(text_filename, 'w') as text_file
-                ):
-                    transcript = self.client.audio.transcriptions.create(
-                        model='whisper-1',
-                        file=audio_file,
-                        prompt=self.whisper_instructions,
-                    )
-                    text_file.write(transcript.text)
-                    self.logger.debug(f'Transcribed audio chunk {audio_filename} to {text_filename}')
-
-            if overwrite_files is True or not os.path.exists(gpt_text_filename):
-                with (
-                    open(text_filename, 'r') as text_file,
-                    open(gpt_text_filename, 'w') as gpt_file
-                ):
-                    interviewer = ifnone(interviewer, default='Interviewer')
-                    interviewee = ifnone(interviewee, default='Interviewee')
-                    text = f'{interviewer} interviewing {interviewee}:\n\n'
-                    text += text_file.read()
-                    gpt = GPT(instructions=self.gpt_instructions)
-                    gpt_text = gpt.message(text)
-                    gpt_file.write(gpt_text.message)
-                    self.logger.debug(f'Corrected {text_filename} with GPT and saved the result to {gpt_text_filename}')
-
-            with open(gpt_text_filename, 'r') as gpt_file:
-                if len(final_transcript) > 0:
-                    final_transcript += chunk_separater
-                final_transcript += gpt_file.read()
-
-        return final_transcript
-
-
-OpenAIInterviewDiarization.register_action('save_chunks')
+        boundary_tolerance = boundary_tolerance * 1000
+        interviewer = ifnone(interviewer, default='Interviewer')
+        interviewee = ifnone(interviewee, default='Interviewee')
+        batch_size = labelling_batch_size if mode == 'fast' else 1
+        params = {'chunk_length': chunk_length, 'boundary_tolerance': boundary_tolerance}
+        job = JobManifest(
+            JobManifest.job_id(audio_file, **params),
+            jobs_dir=os.path.join(self.config['DIR_PATHS']['TEMP'], 'interviews'),
+            params={'audio_file': audio_file, **params},
+            restart=restart)
+
+        def transcribe(idx: int, chunk: AudioSegment) -> str:
+            if not overwrite_files and job.is_complete(idx, 'transcription'):
+                return job.read(idx, 'transcription')
+
+            # Encoded in memory, in this worker, and only when the transcription is not already cached
+            text = self.transcribe_chunk(chunk, name=f'audio_{idx}')
+            job.complete(idx, 'transcription', text=text)
+            self.logger.debug(f'Transcribed audio chunk {idx} of job {job.job_id}')
+            return text
+
+        def transcribe_locally(idx: int, chunk: AudioSegment) -> str:
+            if not overwrite_files and job.is_complete(idx, 'local_transcription'):
+                return job.read(idx, 'local_transcription')
+
+            text = self.transcribe_chunk_locally(chunk)
+            job.complete(idx, 'local_transcription', text=text)
+            self.logger.debug(f'Transcribed audio chunk {idx} of job {job.job_id} locally')
+            return text
+
+        def edit(indices: List[int]) -> List[str]:
+            idx = indices[0]
+            if not overwrite_files and job.is_complete(idx, 'gpt_transcription', interviewer=interviewer,
+                                                       interviewee=interviewee):
+                return [job.read(idx, 'gpt_transcription')]
+
+            text = transcriptions[idx].result()  # Waits only on this chunk's own transcription
+            gpt_text = self.edit_chunk(text, interviewer=interviewer, interviewee=interviewee)
+            job.complete(idx, 'gpt_transcription', text=gpt_text, interviewer=interviewer, interviewee=interviewee)
+            self.logger.debug(f'Corrected transcription chunk {idx} of job {job.job_id} with GPT')
+            return [gpt_text]
+
+        def label(indices: List[int]) -> List[str]:
+            meta = {'interviewer': interviewer, 'interviewee': interviewee}
+            todo = [idx for idx in indices if overwrite_files or not job.is_complete(idx, 'speaker_labels', **meta)]
+            if len(todo) > 0:
+                texts = self.label_speakers(
+                    [transcriptions[idx].result() for idx in todo], interviewer=interviewer, interviewee=interviewee)
+                for idx, text in zip(todo, texts):
+                    job.complete(idx, 'speaker_labels', text=text, **meta)
+                self.logger.debug(f'Labelled speakers of chunks {todo} of job {job.job_id} with GPT')
+            return [job.read(idx, 'speaker_labels') for idx in indices]
+
+        transcribe_fn, edit_fn = (transcribe_locally, label) if mode == 'fast' else (transcribe, edit)
+
+        # Separate pools for the two stages, so that queued transcriptions never hold up the edits of finished chunks
+        transcriber = ThreadPoolExecutor(max_workers=1 if mode == 'fast' else max_workers)
+        editor = ThreadPoolExecutor(max_workers=max_workers)
+        transcriptions, edits, batch = [], [], []
+        next_batch = 0
+        try:
+            for idx, chunk in enumerate(self.stream_chunks(audio_file, chunk_length, tolerance=boundary_tolerance)):
+                # Decode no further ahead than the transcribers can keep up with, so memory stays bounded
+                pending = [transcription for transcription in transcriptions if not transcription.done()]
+                while len(pending) >= 2 * max_workers:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                transcriptions.append(transcriber.submit(transcribe_fn, idx, chunk))
+                batch.append(idx)
+                if len(batch) == batch_size:
+                    edits.append(editor.submit(edit_fn, batch))
+                    batch = []
+                while next_batch < len(edits) and edits[next_batch].done():
+                    yield from edits[next_batch].result()
+                    next_batch += 1
+            if len(batch) > 0:
+                edits.append(editor.submit(edit_fn, batch))
+            for texts in edits[next_batch:]:
+                yield from texts.result()
+            job.remove()
+        finally:  # Do not keep making paid API calls if the caller stops early
+            transcriber.shutdown(wait=False, cancel_futures=True)
+            editor.shutdown(wait=False, cancel_futures=True)
+            job.close()
+
+
 OpenAIInterviewDiarization.register_action('audio_to_text')
+OpenAIInterviewDiarization.register_action('transcribe_interview_stream')
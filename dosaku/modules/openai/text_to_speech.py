@@ -1,11 +1,11 @@
-import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
 from openai import OpenAI
 
 from dosaku import Config, Service
 from dosaku.types import Audio
-from dosaku.utils import ifnone
+from dosaku.utils import ifnone, split_text
 
 
 class OpenAITextToSpeech(Service):
@@ -18,27 +18,150 @@ class OpenAITextToSpeech(Service):
         self.model = 'tts-1'
         self.voices = ['alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer']
         self.voice = 'alloy'
+        self.max_input_length = 4096  # The maximum number of characters the API accepts per request
 
     def set_voice(self, voice: str):
         self.voice = voice
 
-    def text_to_speech(self, text: str, output_filename: Optional[str] = None, voice: Optional[str] = None) -> Audio:
-        voice = ifnone(voice, default=self.voice)
-        response = self.client.audio.speech.create(
-            model=self.model,
-            voice=voice,
-            input=text
-        )
+    def text_to_speech_stream(
+            self,
+            text: str,
+            voice: Optional[str] = None,
+            chunk_size: int = 4096,
+            response_format: str = 'mp3'
+    ) -> Iterator[bytes]:
+        """Synthesize speech, yielding the encoded bytes as they arrive from the API.
 
-        if output_filename is not None:
-            response.stream_to_file(output_filename)
-            audio = Audio(filename=output_filename)
+        Playback or forwarding of the audio may start before synthesis of the whole text has finished. Older openai
+        clients, without a streaming response interface, read the whole response before the first chunk is yielded.
+
+        Args:
+            text: The text to synthesize, of at most max_input_length characters.
+            voice (optional): The voice to use. Defaults to the current voice.
+            chunk_size: The (maximum) number of bytes in each yielded chunk.
+            response_format: The audio format to synthesize. One of {'mp3', 'opus', 'aac', 'flac'}.
+
+        Returns:
+            An iterator over consecutive chunks of the encoded speech.
+        """
+        voice = ifnone(voice, default=self.voice)
+        request = {'model': self.model, 'voice': voice, 'input': text, 'response_format': response_format}
+        speech = self.client.audio.speech
+        if hasattr(speech, 'with_streaming_response'):
+            with speech.with_streaming_response.create(**request) as response:
+                yield from response.iter_bytes(chunk_size)
         else:
-            output_filename = os.path.join(self.config['DIR_PATHS']['TEMP'], 'audio.mp3')
-            response.stream_to_file(output_filename)
-            audio = Audio(filename=output_filename)
+            content = speech.create(**request).content
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+
+    def text_to_speech_segments(
+            self,
+            text: str,
+            voice: Optional[str] = None,
+            segment_length: int = 1000,
+            first_segment_length: int = 200,
+            max_workers: int = 4
+    ) -> Iterator[Audio]:
+        """Synthesize long text as a pipeline of sentence-aligned segments, yielding the audio of each in order.
 
+        The text is split between sentences (and preferably paragraphs) into segments, which are synthesized
+        concurrently, with at most max_workers requests in flight. The first segment is kept short, so that its audio
+        is available almost immediately, while later segments are synthesized in the background.
+
+        Segments are synthesized as flac, which, unlike mp3, adds no encoder padding, so the decoded segments can be
+        joined without gaps. Use Audio.concatenate to join them, or text_to_speech_long to do both.
+
+        Args:
+            text: The text to synthesize, of any length.
+            voice (optional): The voice to use. Defaults to the current voice.
+            segment_length: The maximum length of each segment, in characters. At most max_input_length.
+            first_segment_length: The maximum length of the first segment, in characters.
+            max_workers: The maximum number of segments synthesized concurrently.
+
+        Returns:
+            An iterator over the audio of each segment, in order.
+
+        Example::
+
+            from dosaku.modules import OpenAITextToSpeech
+
+            tts = OpenAITextToSpeech()
+            for audio in tts.text_to_speech_segments(long_text):
+                play(audio)  # Your playback method here
+        """
+        voice = ifnone(voice, default=self.voice)
+        segments = split_text(text, max_length=min(segment_length, self.max_input_length),
+                              first_length=first_segment_length)
+
+        def synthesize(segment: str) -> Audio:
+            encoded = b''.join(self.text_to_speech_stream(segment, voice=voice, response_format='flac'))
+            return Audio(encoded=encoded, format='flac')
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(synthesize, segment) for segment in segments]
+            for future in futures:
+                yield future.result()
+        finally:  # Do not keep making paid API calls if the caller stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def text_to_speech_long(
+            self,
+            text: str,
+            output_filename: Optional[str] = None,
+            voice: Optional[str] = None,
+            max_workers: int = 4
+    ) -> Audio:
+        """Synthesize text of any length with text_to_speech_segments, joining the segments without gaps.
+
+        Args:
+            text: The text to synthesize.
+            output_filename (optional): A file to also write the audio to. The format follows the file extension.
+            voice (optional): The voice to use. Defaults to the current voice.
+            max_workers: The maximum number of segments synthesized concurrently.
+
+        Returns:
+            The speech audio.
+        """
+        audio = Audio.concatenate(list(self.text_to_speech_segments(text, voice=voice, max_workers=max_workers)))
+        if output_filename is not None:
+            audio.write(output_filename)
         return audio
 
+    def text_to_speech(self, text: str, output_filename: Optional[str] = None, voice: Optional[str] = None) -> Audio:
+        """Synthesize speech for the given text, returning the audio once all of it has been synthesized.
+
+        Text longer than max_input_length is synthesized with text_to_speech_long: its segments are synthesized
+        concurrently, but this method still waits for every segment before returning. Use text_to_speech_segments (or
+        text_to_speech_stream, for short text) to start playback before synthesis has finished.
+
+        Args:
+            text: The text to synthesize.
+            output_filename (optional): A file to also write the audio to.
+            voice (optional): The voice to use. Defaults to the current voice.
+
+        Returns:
+            The speech audio.
+        """
+        if len(text) > self.max_input_length:
+            return self.text_to_speech_long(text, output_filename=output_filename, voice=voice)
+
+        chunks = []
+        output_file = open(output_filename, 'wb') if output_filename is not None else None
+        try:
+            for chunk in self.text_to_speech_stream(text, voice=voice):
+                chunks.append(chunk)
+                if output_file is not None:
+                    output_file.write(chunk)
+        finally:
+            if output_file is not None:
+                output_file.close()
+
+        # Backed by the mp3 bytes as received; only decoded if the caller accesses the samples
+        return Audio(encoded=b''.join(chunks), format='mp3')
+
 
 OpenAITextToSpeech.register_action('text_to_speech')
+OpenAITextToSpeech.register_action('text_to_speech_stream')
+OpenAITextToSpeech.register_action('text_to_speech_segments')
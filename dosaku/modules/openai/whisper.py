@@ -1,9 +1,13 @@
+import logging
+import time
 from typing import List, Optional
 
 import numpy as np
-from transformers import pipeline
+import torch
 
+from dosaku import OptionNotSupported, model_registry
 from dosaku.types import Audio
+from dosaku.utils import TranscriptionCache, silence_boundaries
 
 
 class Whisper:
@@ -13,6 +17,21 @@ class Whisper:
         spellcheck: CURRENTLY NOT SUPPORTED. Whether to spellcheck the output text before returning it.
         spellcheck_model: The model to use for spellchecking the output.
         key_terms: A list of key terms. The spellchecker will be prompted with these terms to know their spelling.
+        profile: The inference profile to use. One of {'default', 'cpu'}. The 'cpu' profile is tuned for CPU-only
+            machines: it dynamically quantizes the model's linear layers to int8, sets the torch thread counts and runs
+            warm-up passes at load time. Any of the remaining arguments may be given to override the profile defaults.
+        device (optional): The device to run the model on, e.g. 'cpu' or 'cuda'.
+        quantize (optional): Whether to apply int8 dynamic quantization to the model's linear layers. CPU only.
+        compile_model (optional): Whether to compile the model with torch.compile.
+        num_threads (optional): Number of intra-op threads used by torch. Note that this is a process-wide setting.
+        num_interop_threads (optional): Number of inter-op threads used by torch. Note that this is a process-wide
+            setting, and may only be set before torch runs any inter-op parallel work.
+        warmup_passes (optional): Number of transcription passes to run on silent audio at load time. Instances sharing
+            a model through the model registry only warm it up once.
+        use_cache: Whether to cache transcriptions. Audio longer than segment_length seconds is transcribed in segments
+            cut at silence, and each segment is cached by its content, so repeated (or partially repeated) audio is
+            only transcribed once, even when re-submitted under a different filename. Streamed audio is not cached.
+        cache (optional): The transcription cache to use. Defaults to the default TranscriptionCache.
 
     Example::
 
@@ -28,12 +47,86 @@ class Whisper:
         )
         demo.launch()
 
+    Example using the CPU inference profile::
+
+        from dosaku.modules import Whisper
+        from dosaku.types import Audio
+
+        whisper = Whisper(profile='cpu', num_threads=8)
+        audio = Audio(filename='tests/resources/fridman_susskind.mp3')
+        print(whisper.transcribe(audio))
+        print(f'Real-time factor: {whisper.benchmark(audio):.3f}')
+
     """
     name = 'Whisper'
     model_name = 'openai/whisper-base.en'
-
-    def __init__(self, spellcheck: bool = False, spellcheck_model: Optional[str] = None, key_terms: List[str] = None):
-        self.model = pipeline('automatic-speech-recognition', model=self.model_name)
+    sample_rate = 16000  # The Whisper model operates on 16 kHz mono audio
+    segment_length = 30  # The Whisper model operates on (at most) 30 second windows
+    segment_tolerance = 5  # How far back from each window's end a segment may be cut at silence, in seconds
+    inference_profiles = {
+        'default': {
+            'device': None,
+            'quantize': False,
+            'compile_model': False,
+            'num_threads': None,
+            'num_interop_threads': None,
+            'warmup_passes': 0
+        },
+        'cpu': {
+            'device': 'cpu',
+            'quantize': True,
+            'compile_model': False,
+            'num_threads': None,
+            'num_interop_threads': 1,
+            'warmup_passes': 2
+        }
+    }
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self,
+            spellcheck: bool = False,
+            spellcheck_model: Optional[str] = None,
+            key_terms: List[str] = None,
+            profile: str = 'default',
+            device: Optional[str] = None,
+            quantize: Optional[bool] = None,
+            compile_model: Optional[bool] = None,
+            num_threads: Optional[int] = None,
+            num_interop_threads: Optional[int] = None,
+            warmup_passes: Optional[int] = None,
+            use_cache: bool = False,
+            cache: Optional[TranscriptionCache] = None
+    ):
+        if profile not in self.inference_profiles:
+            raise OptionNotSupported(
+                f'Unknown inference profile "{profile}". Expected one of {list(self.inference_profiles.keys())}.')
+        settings = dict(self.inference_profiles[profile])
+        overrides = {
+            'device': device,
+            'quantize': quantize,
+            'compile_model': compile_model,
+            'num_threads': num_threads,
+            'num_interop_threads': num_interop_threads,
+            'warmup_passes': warmup_passes
+        }
+        settings.update({key: val for key, val in overrides.items() if val is not None})
+        self.profile = profile
+        self.settings = settings
+
+        self._set_threads(settings['num_threads'], settings['num_interop_threads'])
+        self.model = model_registry.acquire(
+            'automatic-speech-recognition',
+            self.model_name,
+            device=settings['device'],
+            quantization='int8' if settings['quantize'] else None,
+            compiled=settings['compile_model'])
+        if settings['warmup_passes'] > 0:  # Models shared with other instances are only warmed up once
+            self.model.warm_up(lambda model: self.warmup(settings['warmup_passes']))
+
+        self.cache = None
+        if use_cache:
+            self.cache = cache if cache is not None else TranscriptionCache()
         self.audio_stream = None
         self._text = None
         self.spellchecker = None
@@ -41,6 +134,74 @@ class Whisper:
             raise NotImplementedError
             self.spellchecker = Spellchecker(model=spellcheck_model, key_terms=key_terms)
 
+    def _set_threads(self, num_threads: Optional[int], num_interop_threads: Optional[int]):
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        if num_interop_threads is not None and torch.get_num_interop_threads() != num_interop_threads:
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as err:  # torch only allows this to be set before any inter-op parallel work starts
+                self.logger.warning(f'Unable to set the number of inter-op threads: {err}')
+
+    @property
+    def cache_model_name(self) -> str:
+        """Name identifying the model in the transcription cache, including any setting that changes its output."""
+        return f'{self.model_name}:{"int8" if self.settings["quantize"] else "fp"}'
+
+    def _transcribe(self, sample_rate: int, data: np.ndarray, use_cache: bool = True) -> str:
+        y = data.astype(np.float32)
+        peak = np.max(np.abs(y), initial=0.)
+        if peak > 0:
+            y /= peak  # Normalized once over the whole input, so that every segment keeps the same gain
+
+        if len(y) > self.segment_length * sample_rate:
+            spans = silence_boundaries(y, sample_rate, chunk_length=self.segment_length,
+                                       tolerance=self.segment_tolerance)
+        else:
+            spans = [(0, len(y))]
+        segments = [(y[start:end], sample_rate) for start, end in spans]
+
+        def transcribe_segment(idx: int) -> str:
+            return self.model({'sampling_rate': sample_rate, 'raw': segments[idx][0]})['text']
+
+        if self.cache is None or not use_cache:
+            texts = [transcribe_segment(idx) for idx in range(len(segments))]
+        else:
+            texts = self.cache.transcribe(segments, transcribe_segment, model=self.cache_model_name)
+        return ' '.join(text.strip() for text in texts)
+
+    def warmup(self, num_passes: int = 1, duration: float = 5.):
+        """Run the model on silent audio to warm up kernels, caches and (if enabled) compilation.
+
+        Args:
+            num_passes: The number of warm-up passes to run.
+            duration: Length of the silent audio used for each pass, in seconds.
+        """
+        silence = np.zeros(int(duration * self.sample_rate), dtype=np.float32)
+        for _ in range(num_passes):
+            self.model({'sampling_rate': self.sample_rate, 'raw': silence})
+
+    def benchmark(self, audio: Audio, num_runs: int = 3) -> float:
+        """Measure the real-time factor (RTF) of transcribing the given audio.
+
+        The real-time factor is the processing time divided by the audio duration. An RTF below 1 means the audio is
+        transcribed faster than real-time.
+
+        Args:
+            audio: The audio to transcribe.
+            num_runs: The number of runs to average over.
+
+        Returns:
+            The mean real-time factor over all runs. The transcription cache is bypassed.
+        """
+        audio = audio.to_mono().resample(self.sample_rate)
+        duration = audio.duration
+        start = time.perf_counter()
+        for _ in range(num_runs):
+            self._transcribe(audio.sample_rate, audio.data, use_cache=False)
+        elapsed = (time.perf_counter() - start) / num_runs
+        return elapsed / duration
+
     def text(self, corrected_text: Optional[str] = None):
         """Combined setter and getter for obtaining the transcribed text.
 
@@ -74,11 +235,8 @@ class Whisper:
         Returns:
             The transcribed text.
         """
-        sr, y = audio.sample_rate, audio.data
-        y = y.astype(np.float32)
-        y /= np.max(np.abs(y))
-
-        self._text = self.model({"sampling_rate": sr, "raw": y})["text"]
+        audio = audio.to_mono().resample(self.sample_rate)
+        self._text = self._transcribe(audio.sample_rate, audio.data)
         if self.spellchecker:
             self._text = self.spellchecker(self.text())
 
@@ -98,6 +256,7 @@ class Whisper:
         Returns:
             The entire transcribed text up to that point. Use reset_stream to reset the transcribed text.
         """
+        new_chunk = new_chunk.to_mono()  # Not resampled, as each chunk would be filtered without its neighbours
         sr, y = new_chunk.sample_rate, new_chunk.data
         y = y.astype(np.float32)
         y /= np.max(np.abs(y))
@@ -107,7 +266,7 @@ class Whisper:
         else:
             self.audio_stream = y
 
-        self._text = self.model({'sampling_rate': sr, 'raw': self.audio_stream})['text']
+        self._text = self._transcribe(sr, self.audio_stream, use_cache=False)
         if self.spellchecker:
             self._text = self.spellchecker(self.text())
 
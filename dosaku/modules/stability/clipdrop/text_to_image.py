@@ -1,4 +1,7 @@
 from PIL.Image import Image
+from typing import Optional
+
+import requests
 
 from dosaku import Service
 from dosaku.apis import Clipdrop
@@ -7,9 +10,9 @@ from dosaku.apis import Clipdrop
 class ClipdropTextToImage(Service):
     name = 'ClipdropTextToImage'
 
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         super().__init__()
-        self.clipdrop = Clipdrop()
+        self.clipdrop = Clipdrop(session=session)  # Shares Clipdrop's default session (and its connections) by default
 
     def text_to_image(self, prompt: str, **_) -> Image:
         return self.clipdrop.text_to_image(prompt=prompt)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Example benchmarking in-process WAV decoding against decoding through an ffmpeg subprocess."""
+import argparse
+from io import BytesIO
+import subprocess
+import time
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+from dosaku.types import Audio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, nargs='?', default=10.,
+                        help='Length of the generated test audio, in seconds.')
+    parser.add_argument('--num_runs', type=int, nargs='?', default=20)
+
+    opt = parser.parse_args()
+    sample_rate = 16000
+    samples = (np.sin(np.arange(int(opt.duration * sample_rate)) * 0.05) * 2 ** 14).astype(np.int16)
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    encoded = buffer.getvalue()
+
+    start = time.perf_counter()
+    for _ in range(opt.num_runs):
+        Audio.from_bytes(encoded).data
+    native = (time.perf_counter() - start) / opt.num_runs
+    print(f'In-process WAV decode: {1000 * native:.2f} ms')
+
+    command = [AudioSegment.converter, '-v', 'error', '-i', 'pipe:0', '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1']
+    start = time.perf_counter()
+    for _ in range(opt.num_runs):
+        pcm = subprocess.run(command, input=encoded, stdout=subprocess.PIPE, check=True).stdout
+        Audio.from_pcm(pcm, sample_rate=sample_rate).data
+    ffmpeg = (time.perf_counter() - start) / opt.num_runs
+    print(f'ffmpeg subprocess WAV decode: {1000 * ffmpeg:.2f} ms')
+    print(f'Speedup: {ffmpeg / native:.1f}x')
+
+
+if __name__ == "__main__":
+    main()
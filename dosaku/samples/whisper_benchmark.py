@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""Example benchmarking the real-time factor of the local Whisper module with and without the CPU inference profile."""
+import argparse
+import os
+
+from dosaku import Config
+from dosaku.modules import Whisper
+from dosaku.types import Audio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--audio_file', type=str, nargs='?',
+                        default=os.path.join(Config()['DIR_SOURCE']['TEST_RESOURCES'], 'fridman_susskind.mp3'))
+    parser.add_argument('--duration', type=float, nargs='?', default=30.,
+                        help='Length of audio to transcribe, in seconds.')
+    parser.add_argument('--num_runs', type=int, nargs='?', default=3)
+    parser.add_argument('--num_threads', type=int, nargs='?', default=None)
+    parser.add_argument('--compile', action='store_true', help='Also compile the model with torch.compile.')
+
+    opt = parser.parse_args()
+    audio = Audio(filename=opt.audio_file)
+    audio = Audio(sample_rate=audio.sample_rate, data=audio.data[:int(opt.duration * audio.sample_rate)])
+
+    # Run the baseline first, as the CPU profile changes process-wide torch thread settings
+    baseline = Whisper()
+    baseline.warmup()
+    baseline_rtf = baseline.benchmark(audio, num_runs=opt.num_runs)
+    print(f'Default profile real-time factor: {baseline_rtf:.3f}')
+    del baseline
+
+    optimized = Whisper(profile='cpu', num_threads=opt.num_threads, compile_model=opt.compile)
+    optimized_rtf = optimized.benchmark(audio, num_runs=opt.num_runs)
+    print(f'CPU profile real-time factor: {optimized_rtf:.3f}')
+    print(f'Speedup: {baseline_rtf / optimized_rtf:.2f}x')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,382 @@
 import base64
 from io import BytesIO
-from typing import Optional
+import os
+import shutil
+import threading
+from typing import Iterator, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pydub
 from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+from pydub.utils import mediainfo
+
+from dosaku.utils import codec_pool, decode_stream, ifnone, read_wav, read_wav_header, resample_poly, sniff_format
 
 
 class Audio:
+    """Audio data, stored as a numpy array of samples.
+
+    The samples may instead come from a lazy source: the encoded bytes of the audio (e.g. an mp3 file received from an
+    API) or an audio file. The source is only decoded the first time data or sample_rate is accessed, so audio which is
+    just passed along (e.g. saved or serialized in its original format) is never decoded at all. Uncompressed WAV and
+    raw PCM files may also be memory-mapped with memmap(), in which case samples are paged in from disk as they are
+    used.
+
+    Encodings of the audio (see to_bytes()) are cached per format and bitrate, and requesting the source format returns
+    the source bytes as they are, so repeated serialization never re-runs the encoder. Assigning new data or a new
+    sample rate discards the source and every cached encoding; modify audio by assigning a new array rather than by
+    changing data in place.
+
+    Args:
+        sample_rate (optional): The sample rate of the audio data.
+        data (optional): The audio samples, of shape (num_samples,) or (num_samples, num_channels).
+        filename (optional): An audio file to use as the source of the audio. Note that the file is read on first use,
+            not when the Audio is created.
+        normalized: Whether the decoded samples should be floats in [-1, 1) rather than int16 values.
+        encoded (optional): The encoded bytes of the audio to use as its source.
+        format (optional): The format of the encoded bytes or file. Defaults to the file extension, or to 'mp3' for
+            encoded bytes.
+
+    Example::
+
+        from dosaku.types import Audio
+
+        audio = Audio(filename='tests/resources/fridman_susskind.mp3')  # Nothing is decoded yet
+        print(audio.sample_rate, audio.data.shape)  # Decoded on first access
+    """
+    default_bitrates = {'mp3': '320k'}
+
     def __init__(
             self,
             sample_rate: Optional[int] = None,
             data: Optional[np.ndarray] = None,
             filename: Optional[str] = None,
-            normalized: bool = False):
-        self.sample_rate = sample_rate
-        self.data = data
+            normalized: bool = False,
+            encoded: Optional[bytes] = None,
+            format: Optional[str] = None):
+        self._sample_rate = sample_rate
+        self._data = data
+        self._lock = threading.Lock()
+        self._encodings = dict()
+        self.normalized = normalized
+        self.filename = None
+        self.encoded = None
+        self.format = format
         if filename is not None:
-            self.load(filename, normalized=normalized)
+            self.load(filename, normalized=normalized, format=format)
+        elif encoded is not None:
+            self.encoded = encoded
+            self.format = ifnone(format, default=sniff_format(encoded[:12]) or 'mp3')
+
+    def load(self, filename: str, normalized: bool = False, format: Optional[str] = None):
+        """Use the given audio file as the source of the audio. The file is decoded on first access of data."""
+        self.filename = filename
+        self.encoded = None
+        if format is None:
+            with open(filename, 'rb') as file:
+                format = sniff_format(file.read(12)) or os.path.splitext(filename)[1][1:].lower() or None
+        self.format = format
+        self.normalized = normalized
+        self._data = None
+        self._sample_rate = None
+        self._encodings = dict()
+
+    @property
+    def has_source(self) -> bool:
+        """Whether the audio is backed by (unmodified) encoded bytes or an audio file."""
+        return self.encoded is not None or self.filename is not None
+
+    @property
+    def decoded(self) -> bool:
+        """Whether the audio samples are available without decoding the source."""
+        return self._data is not None
+
+    @property
+    def data(self) -> Optional[np.ndarray]:
+        """The audio samples, decoded from the source on first access."""
+        if self._data is None and self.has_source:
+            self._decode()
+        return self._data
+
+    @data.setter
+    def data(self, data: Optional[np.ndarray]):
+        self._data = data
+        self._drop_source()  # The source no longer matches the samples
+
+    @property
+    def sample_rate(self) -> Optional[int]:
+        """The sample rate of the audio, decoded from the source on first access."""
+        if self._sample_rate is None and self.has_source:
+            self._decode()
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, sample_rate: Optional[int]):
+        if self.has_source:
+            self._decode()
+        self._sample_rate = sample_rate
+        self._drop_source()
+
+    def _decode(self):
+        with self._lock:
+            if self._data is not None or not self.has_source:
+                return
+            if self.format == 'wav':  # Uncompressed; decoded in-process rather than by an ffmpeg subprocess
+                source = BytesIO(self.encoded) if self.encoded is not None else self.filename
+                try:
+                    self._sample_rate, self._data = read_wav(source, normalized=self.normalized)
+                    return
+                except CouldntDecodeError:  # A WAV variant the wave module does not support, e.g. float samples
+                    pass
+            sample_rate, samples = codec_pool.decode(ifnone(self.encoded, default=self.filename), format=self.format)
+            self._sample_rate = sample_rate
+            self._data = np.float32(samples) / 2 ** 15 if self.normalized else samples.copy()
+
+    def _drop_source(self):
+        self.filename = None
+        self.encoded = None
+        self._encodings = dict()
+
+    def source_bytes(self) -> bytes:
+        """Return the encoded bytes of the source, in the source format."""
+        if self.encoded is not None:
+            return self.encoded
+        with open(self.filename, 'rb') as file:
+            self.encoded = file.read()  # The file is only read once, like any other encoding
+        return self.encoded
+
+    @property
+    def channels(self) -> int:
+        """The number of channels of the audio."""
+        return 1 if self.data.ndim == 1 else self.data.shape[1]
+
+    @property
+    def duration(self) -> float:
+        """The length of the audio, in seconds."""
+        return len(self.data) / self.sample_rate
+
+    def _full_scale(self) -> float:
+        dtype = np.asarray(self.data).dtype
+        return float(np.iinfo(dtype).max) if np.issubdtype(dtype, np.integer) else 1.
+
+    def _with_data(self, data: np.ndarray, sample_rate: Optional[int] = None) -> 'Audio':
+        """Return new Audio with the given float samples, converted back to the sample type of this audio."""
+        dtype = np.asarray(self.data).dtype
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            data = np.clip(np.rint(data), info.min, info.max).astype(dtype)
+        else:
+            data = data.astype(dtype, copy=False)
+        return Audio(sample_rate=ifnone(sample_rate, default=self.sample_rate), data=data, normalized=self.normalized)
+
+    def slice(self, start: float = 0., end: Optional[float] = None) -> 'Audio':
+        """Return the audio between the given times, in seconds. The returned samples are a view, not a copy."""
+        start_idx = int(round(start * self.sample_rate))
+        end_idx = len(self.data) if end is None else int(round(end * self.sample_rate))
+        return Audio(sample_rate=self.sample_rate, data=self.data[start_idx:end_idx], normalized=self.normalized)
+
+    def to_mono(self) -> 'Audio':
+        """Return the audio downmixed to a single channel, by averaging the channels. Mono audio is returned as is."""
+        if self.data.ndim == 1:
+            return self
+        if self.channels == 1:
+            return Audio(sample_rate=self.sample_rate, data=self.data[:, 0], normalized=self.normalized)
+        return self._with_data(self.data.mean(axis=1, dtype=np.float32))
+
+    def resample(self, sample_rate: int) -> 'Audio':
+        """Return the audio resampled to the given sample rate, with a (cached) polyphase low-pass filter.
+
+        Example::
+
+            from dosaku.types import Audio
+
+            audio = Audio(filename='tests/resources/fridman_susskind.mp3')
+            audio = audio.to_mono().resample(16000)
+        """
+        if sample_rate == self.sample_rate:
+            return self
+        return self._with_data(resample_poly(self.data, sample_rate, self.sample_rate), sample_rate=sample_rate)
+
+    def gain(self, db: float) -> 'Audio':
+        """Return the audio amplified by the given number of decibels (negative values attenuate), with clipping."""
+        return self._with_data(self.data * np.float32(10 ** (db / 20)))
+
+    def normalize(self, headroom: float = 0.1) -> 'Audio':
+        """Return the audio scaled so that its peak sits the given number of decibels below full scale."""
+        peak = float(np.max(np.abs(self.data))) if len(self.data) > 0 else 0.
+        if peak == 0:
+            return self
+        return self._with_data(self.data * np.float32(self._full_scale() * 10 ** (-headroom / 20) / peak))
+
+    @staticmethod
+    def _check_compatible(audios: Sequence['Audio']):
+        if len(audios) == 0:
+            raise ValueError('At least one Audio is required.')
+        if len(set(audio.sample_rate for audio in audios)) > 1 or len(set(audio.channels for audio in audios)) > 1:
+            raise ValueError('Audio must share the same sample rate and number of channels. Use resample() and '
+                             'to_mono() first.')
+
+    @classmethod
+    def concatenate(cls, audios: Sequence['Audio']) -> 'Audio':
+        """Join the given audio end to end, without gaps.
 
-    def load(self, filename, normalized=False):
-        """MP3 to numpy array"""
-        audio = AudioSegment.from_mp3(filename)
-        _tmp = Audio.from_audiosegment(audio, normalized=normalized)
-        self.data = _tmp.data
-        self.sample_rate = _tmp.sample_rate
+        Example::
 
-    def write(self, filename: str, normalized=False):
-        audio = self.to_audiosegment(normalized)
-        audio.export(filename, format='mp3', bitrate='320k')
+            from dosaku.types import Audio
+
+            intro = Audio(filename='intro.mp3')
+            body = Audio(filename='body.mp3')
+            audio = Audio.concatenate([intro, body])
+        """
+        cls._check_compatible(audios)
+        first = audios[0]
+        return Audio(sample_rate=first.sample_rate, data=np.concatenate([audio.data for audio in audios]),
+                     normalized=first.normalized)
+
+    @classmethod
+    def mix(cls, audios: Sequence['Audio'], gains: Optional[Sequence[float]] = None) -> 'Audio':
+        """Overlay the given audio, each scaled by its gain (in decibels), padding shorter audio with silence."""
+        cls._check_compatible(audios)
+        gains = ifnone(gains, default=[0.] * len(audios))
+        first = audios[0]
+        mixed = np.zeros((max(len(audio.data) for audio in audios),) + first.data.shape[1:], dtype=np.float32)
+        for audio, db in zip(audios, gains):
+            mixed[:len(audio.data)] += audio.data * np.float32(10 ** (db / 20))
+        return first._with_data(mixed)
+
+    @classmethod
+    def memmap(
+            cls,
+            filename: str,
+            sample_rate: Optional[int] = None,
+            channels: int = 1,
+            dtype: np.dtype = np.int16
+    ) -> 'Audio':
+        """Memory-map an uncompressed WAV or raw PCM file as the samples of an Audio object.
+
+        The samples are not read into memory; pages of the file are loaded by the OS as they are accessed, and are
+        shared with any other process mapping the same file.
+
+        Args:
+            filename: The WAV or raw PCM file.
+            sample_rate (optional): The sample rate of a raw PCM file. Read from the header for WAV files.
+            channels: The number of interleaved channels of a raw PCM file. Read from the header for WAV files.
+            dtype: The sample type of a raw PCM file. Read from the header for WAV files.
+
+        Returns:
+            The memory-mapped audio. Its data is a read-only numpy memmap.
+        """
+        with open(filename, 'rb') as file:
+            is_wav = file.read(12)[8:12] == b'WAVE'
+            file.seek(0)
+            if is_wav:
+                header = read_wav_header(file)
+                sample_rate, channels, dtype = header.sample_rate, header.channels, header.dtype
+                offset, size = header.data_offset, header.data_size
+            elif sample_rate is None:
+                raise ValueError('The sample rate must be given to memory-map a raw PCM file.')
+            else:
+                offset, size = 0, os.path.getsize(filename)
+        size = min(size, os.path.getsize(filename) - offset)  # Streamed WAV files may not record their data size
+        num_samples = size // (np.dtype(dtype).itemsize * channels)
+        shape = (num_samples, channels) if channels > 1 else (num_samples,)
+        data = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+        return Audio(sample_rate=sample_rate, data=data)
+
+    @classmethod
+    def stream(
+            cls,
+            filename: str,
+            block_duration: float = 60.,
+            start: float = 0.,
+            end: Optional[float] = None,
+            sample_rate: Optional[int] = None,
+            channels: Optional[int] = None,
+            normalized: bool = False
+    ) -> Iterator['Audio']:
+        """Decode an audio file as a stream of fixed-length Audio blocks.
+
+        Unlike decoding the whole file, only one block is held in memory at a time, so memory use does not depend on the
+        file length.
+
+        Args:
+            filename: The audio file to decode.
+            block_duration: The length of each block, in seconds. The last block may be shorter.
+            start: The time to start from, in seconds. Nothing before it is decoded.
+            end (optional): The time to stop at, in seconds. Defaults to the end of the file.
+            sample_rate (optional): The sample rate to decode to. Defaults to the sample rate of the file.
+            channels (optional): The number of channels to decode to. Defaults to the channels of the file.
+            normalized: Whether to return float samples in [-1, 1) rather than int16 samples.
+
+        Returns:
+            An iterator over the Audio blocks.
+
+        Raises:
+            ValueError: If the sample rate or channels are not given and cannot be probed from the file. WAV headers are
+                read directly; any other format requires ffprobe to be installed.
+
+        Example::
+
+            from dosaku.types import Audio
+
+            for block in Audio.stream('tests/resources/fridman_susskind.mp3', block_duration=10, start=30):
+                print(block.data.shape)
+        """
+        if sample_rate is None or channels is None:
+            file_sample_rate, file_channels = cls._probe(filename)
+            sample_rate = ifnone(sample_rate, default=file_sample_rate)
+            channels = ifnone(channels, default=file_channels)
+
+        block_size = max(int(block_duration * sample_rate), 1)
+        for block in decode_stream(filename, sample_rate, channels, block_size=block_size, start=start, end=end):
+            data = block if channels > 1 else block[:, 0]
+            if normalized:
+                data = np.float32(data) / 2 ** 15
+            yield Audio(sample_rate=sample_rate, data=data)
+
+    @staticmethod
+    def _probe(filename: str) -> Tuple[int, int]:
+        """Return the (sample_rate, channels) of an audio file, from its WAV header if it has one, else with ffprobe."""
+        with open(filename, 'rb') as file:
+            if sniff_format(file.read(12)) == 'wav':
+                file.seek(0)
+                try:
+                    header = read_wav_header(file)
+                    return header.sample_rate, header.channels
+                except CouldntDecodeError:  # e.g. 24 bit samples; ffprobe may still read it
+                    pass
+
+        if shutil.which('ffprobe') is None and shutil.which('avprobe') is None:
+            raise ValueError(f'Unable to probe the sample rate and channels of {filename}: ffprobe is not installed. '
+                             f'Install ffprobe (part of ffmpeg), or pass sample_rate and channels explicitly.')
+        info = mediainfo(filename)
+        try:
+            return int(info['sample_rate']), int(info['channels'])
+        except (KeyError, ValueError) as err:
+            raise ValueError(f'Unable to probe the sample rate and channels of {filename}. Pass sample_rate and '
+                             f'channels explicitly.') from err
+
+    def write(
+            self,
+            filename: str,
+            normalized: bool = False,
+            format: Optional[str] = None,
+            bitrate: Optional[str] = None):
+        """Write the audio to a file.
+
+        Args:
+            filename: The file to write to.
+            normalized: Whether the data is normalized to [-1, 1).
+            format (optional): The audio format to write. Defaults to the file extension, or 'mp3' if there is none.
+            bitrate (optional): The bitrate to encode at. If not given, audio in its source format is written as it is;
+                otherwise mp3 is encoded at 320k.
+        """
+        format = ifnone(format, default=os.path.splitext(filename)[1][1:].lower() or 'mp3')
+        if bitrate is None and not (self.has_source and self.format == format):
+            bitrate = self.default_bitrates.get(format)
+        with open(filename, 'wb') as file:
+            file.write(self.to_bytes(normalized=normalized, format=format, bitrate=bitrate))
 
     def to_audiosegment(self, normalized=False):
         """numpy array to MP3"""
@@ -40,14 +388,34 @@ class Audio:
         audio = pydub.AudioSegment(audio_data.tobytes(), frame_rate=self.sample_rate, sample_width=2, channels=channels)
         return audio
 
-    def to_bytes(self, normalized=False) -> bytes:
-        audio = self.to_audiosegment(normalized)
-        buffer = BytesIO()
-        audio.export(buffer, format='mp3')
-        return buffer.getvalue()
+    def to_bytes(self, normalized: bool = False, format: str = 'mp3', bitrate: Optional[str] = None) -> bytes:
+        """Return the audio encoded in the given format.
+
+        Audio in its source format is returned as the source bytes, without decoding it. Any other encoding is cached,
+        so that it is only encoded once.
+
+        Args:
+            normalized: Whether the data is normalized to [-1, 1).
+            format: The audio format to encode to.
+            bitrate (optional): The bitrate to encode at. Defaults to the source bytes for the source format, and to the
+                encoder default otherwise.
 
-    def to_ascii(self, normalized=False) -> str:
-        audio = self.to_bytes(normalized=normalized)
+        Returns:
+            The encoded audio.
+        """
+        if self.has_source and self.format == format and bitrate is None:
+            return self.source_bytes()
+
+        key = (format, bitrate, normalized)
+        encoded = self._encodings.get(key)
+        if encoded is None:
+            samples = np.int16(self.data * 2 ** 15) if normalized else np.int16(self.data)
+            encoded = codec_pool.encode(samples, sample_rate=self.sample_rate, format=format, bitrate=bitrate)
+            self._encodings[key] = encoded
+        return encoded
+
+    def to_ascii(self, normalized: bool = False, format: str = 'mp3', bitrate: Optional[str] = None) -> str:
+        audio = self.to_bytes(normalized=normalized, format=format, bitrate=bitrate)
         converter = base64.b64encode(audio)
         return converter.decode('ascii')
 
@@ -65,9 +433,37 @@ class Audio:
         return Audio(sample_rate=sample_rate, data=data, normalized=normalized)
 
     @classmethod
-    def from_bytes(cls, bytes: BytesIO):
-        audio = pydub.AudioSegment.from_mp3(bytes)
-        return Audio.from_audiosegment(audio)
+    def from_bytes(cls, bytes: Union[bytes, BytesIO], format: Optional[str] = None):
+        """Create an Audio object backed by the given encoded bytes. The format is detected if not given."""
+        encoded = bytes.getvalue() if isinstance(bytes, BytesIO) else bytes
+        return Audio(encoded=encoded, format=format)
+
+    @classmethod
+    def from_pcm(
+            cls,
+            pcm: bytes,
+            sample_rate: int,
+            channels: int = 1,
+            dtype: np.dtype = np.int16,
+            normalized: bool = False):
+        """Create an Audio object from raw, interleaved PCM samples, viewing them as a numpy array without copying.
+
+        Args:
+            pcm: The raw PCM samples.
+            sample_rate: The sample rate of the audio.
+            channels: The number of interleaved channels.
+            dtype: The sample type.
+            normalized: Whether to convert integer samples to floats in [-1, 1).
+
+        Returns:
+            The Audio object.
+        """
+        data = np.frombuffer(pcm, dtype=dtype)
+        if channels > 1:
+            data = data.reshape(-1, channels)
+        if normalized and np.issubdtype(data.dtype, np.integer):
+            data = np.float32(data) / 2 ** (8 * data.dtype.itemsize - 1)
+        return Audio(sample_rate=sample_rate, data=data, normalized=normalized)
 
     @classmethod
     def from_ascii(cls, ascii: str):
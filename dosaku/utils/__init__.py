@@ -1,6 +1,16 @@
 """Dosaku utility module."""
 from dosaku.utils.checks import ifnone
-from dosaku.utils.conversions import (pil_to_ascii, ascii_to_pil, pil_to_bytes, bytes_to_pil, pil_to_tensor,
-                                      tensor_to_pil, pil_to_ndarray, ndarray_to_pil, pil_to_cv2, cv2_to_pil)
+from dosaku.utils.audio import (rms_envelope, silence_boundaries, decode_stream, split_stream, read_wav_header,
+                                WavHeader, sniff_format, read_wav, polyphase_filter, resample_poly)
+from dosaku.utils.conversions import (IMAGE_ENCODINGS, pil_to_ascii, ascii_to_pil, pil_to_bytes, pil_to_bytes_async,
+                                      encode_images, bytes_to_pil, pil_to_tensor, tensor_to_pil, ImageBatch,
+                                      pil_to_tensor_batch, tensor_to_pil_batch, pil_to_ndarray, ndarray_to_pil,
+                                      pil_to_cv2, cv2_to_pil)
 from dosaku.utils.logging import default_formatter, default_logger
-from dosaku.utils.image import canny, fit, center, erode, binary_mask_to_alpha, insert_image
+from dosaku.utils.image import (canny, fit, center, erode, binary_mask_to_alpha, insert_image, canny_batch, fit_batch,
+                                center_batch, erode_batch, binary_mask_to_alpha_batch, Placement, composite_images,
+                                tile_boxes, stitch_tiles)
+from dosaku.utils.transcription_cache import TranscriptionCache
+from dosaku.utils.job_manifest import JobManifest
+from dosaku.utils.text import remove_fillers, split_sentences, clean_transcript, split_text
+from dosaku.utils.codec_pool import CodecPool, codec_pool
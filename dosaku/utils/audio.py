@@ -0,0 +1,394 @@
+"""Utility methods relating to audio processing."""
+from dataclasses import dataclass
+from functools import lru_cache
+from math import gcd
+import struct
+import subprocess
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+
+
+@dataclass(frozen=True)
+class WavHeader:
+    """The format and location of the sample data of a WAV file."""
+    sample_rate: int
+    channels: int
+    dtype: np.dtype
+    data_offset: int
+    data_size: int
+
+
+_wav_dtypes = {
+    (1, 8): np.dtype('u1'),
+    (1, 16): np.dtype('<i2'),
+    (1, 32): np.dtype('<i4'),
+    (3, 32): np.dtype('<f4'),
+    (3, 64): np.dtype('<f8'),
+}
+
+
+def read_wav_header(file: BinaryIO) -> WavHeader:
+    """Read the header of a WAV file, without reading any of its sample data.
+
+    Args:
+        file: The WAV file, opened in binary mode and positioned at its start.
+
+    Returns:
+        The WAV header. The data offset is relative to the start of the file.
+
+    Raises:
+        CouldntDecodeError: If the file is not a WAV file, or its sample format is not one of 8, 16 or 32 bit integer or
+            32 or 64 bit float PCM.
+    """
+    riff = file.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+        raise CouldntDecodeError('Not a WAV file.')
+
+    fmt = None
+    offset = 12
+    while True:
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            raise CouldntDecodeError('WAV file has no data chunk.')
+        chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        offset += 8
+        if chunk_id == b'fmt ':
+            body = file.read(chunk_size)
+            fmt = struct.unpack('<HHIIHH', body[:16])
+            if fmt[0] == 0xFFFE and len(body) >= 26:  # WAVE_FORMAT_EXTENSIBLE; the real format leads the subformat
+                fmt = (struct.unpack('<H', body[24:26])[0],) + fmt[1:]
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise CouldntDecodeError('WAV data chunk precedes its fmt chunk.')
+            audio_format, channels, sample_rate, _, _, bits = fmt
+            if (audio_format, bits) not in _wav_dtypes:
+                raise CouldntDecodeError(f'Unsupported WAV sample format {audio_format} with {bits} bits per sample.')
+            return WavHeader(sample_rate, channels, _wav_dtypes[(audio_format, bits)], offset, chunk_size)
+        else:
+            file.seek(chunk_size, 1)
+        offset += chunk_size + chunk_size % 2
+        if chunk_size % 2:  # Chunks are padded to an even size
+            file.seek(1, 1)
+
+
+_magic_numbers = (
+    (0, b'RIFF', 8, b'WAVE', 'wav'),
+    (0, b'FORM', 8, b'AIFF', 'aiff'),
+    (0, b'fLaC', 0, b'', 'flac'),
+    (0, b'OggS', 0, b'', 'ogg'),
+    (0, b'ID3', 0, b'', 'mp3'),
+    (0, b'\x1a\x45\xdf\xa3', 0, b'', 'webm'),
+    (4, b'ftyp', 0, b'', 'mp4'),
+)
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Identify the format of encoded audio from its first few bytes.
+
+    Args:
+        header: The start of the encoded audio. The first 12 bytes are enough.
+
+    Returns:
+        The audio format, as understood by ffmpeg (e.g. 'wav', 'mp3'), or None if it was not recognized.
+    """
+    for offset, magic, extra_offset, extra_magic, format in _magic_numbers:
+        if header[offset:offset + len(magic)] == magic and \
+                header[extra_offset:extra_offset + len(extra_magic)] == extra_magic:
+            return format
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06 != 0:
+        return 'mp3'  # An MPEG audio frame sync without an ID3 tag (AAC ADTS streams have layer bits of 0)
+    return None
+
+
+def read_wav(file: Union[str, BinaryIO], normalized: bool = False) -> Tuple[int, np.ndarray]:
+    """Decode an integer PCM WAV file in-process, without an ffmpeg subprocess.
+
+    The samples are read with the standard library wave module and viewed as a numpy array without further copies.
+
+    Args:
+        file: The WAV filename, or a binary file object holding the WAV file.
+        normalized: Whether to return float samples in [-1, 1) rather than the stored integer samples.
+
+    Returns:
+        A tuple (sample_rate, data), with data of shape (num_samples,) or (num_samples, num_channels).
+
+    Raises:
+        CouldntDecodeError: If the file is not a WAV file the wave module can read (e.g. float or 24 bit samples).
+    """
+    try:
+        with wave.open(file, 'rb') as wav_file:
+            sample_rate, channels, sample_width = (
+                wav_file.getframerate(), wav_file.getnchannels(), wav_file.getsampwidth())
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError) as err:
+        raise CouldntDecodeError(f'Unable to read WAV file: {err}') from err
+    if sample_width not in (1, 2, 4):
+        raise CouldntDecodeError(f'Unsupported WAV sample width of {sample_width} bytes.')
+
+    dtype = _wav_dtypes[(1, 8 * sample_width)]
+    data = np.frombuffer(frames, dtype=dtype)
+    if channels > 1:
+        data = data.reshape(-1, channels)
+    if normalized:
+        data = (np.float32(data) - 128) / 128 if sample_width == 1 else np.float32(data) / 2 ** (8 * sample_width - 1)
+    return sample_rate, data
+
+
+def rms_envelope(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """Compute the root-mean-square energy envelope of the given audio samples.
+
+    The samples are split into consecutive, non-overlapping frames of frame_length samples each (the last frame is zero
+    padded), and the RMS energy of each frame is computed in a single vectorized pass.
+
+    Args:
+        samples: Audio samples, either of shape (num_samples,) or (num_samples, num_channels). Multichannel audio is
+            averaged down to mono first.
+        frame_length: The number of samples per frame.
+
+    Returns:
+        An array of shape (ceil(num_samples / frame_length),) with the RMS energy of each frame.
+
+    Example::
+
+        import numpy as np
+        from dosaku.utils import rms_envelope
+
+        sample_rate = 16000
+        samples = np.random.randn(10 * sample_rate)
+        envelope = rms_envelope(samples, frame_length=sample_rate // 20)  # 50ms frames
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    num_frames = -(-len(samples) // frame_length)
+    padded = np.zeros(num_frames * frame_length, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = padded.reshape(num_frames, frame_length)
+    return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame_length)
+
+
+def silence_boundaries(
+        samples: np.ndarray,
+        sample_rate: int,
+        chunk_length: float,
+        tolerance: float,
+        frame_duration: float = 0.05
+) -> List[Tuple[int, int]]:
+    """Split audio into chunks of at most chunk_length seconds, cutting at the quietest point near each boundary.
+
+    Rather than cutting at fixed chunk_length offsets, which often cuts mid-word, each cut is moved to the lowest-energy
+    frame within the last tolerance seconds before the fixed offset. The next chunk is then measured from the new cut.
+
+    Args:
+        samples: Audio samples, either of shape (num_samples,) or (num_samples, num_channels).
+        sample_rate: The sample rate of the audio.
+        chunk_length: The maximum length of each chunk, in seconds.
+        tolerance: How far back from the fixed offset a cut may be moved, in seconds. A tolerance of 0 cuts at the
+            fixed offsets.
+        frame_duration: The length of each frame of the energy envelope, in seconds. Cuts are made on frame boundaries.
+
+    Returns:
+        A list of (start, end) sample indices of each chunk.
+
+    Example::
+
+        from dosaku.types import Audio
+        from dosaku.utils import silence_boundaries
+
+        audio = Audio(filename='tests/resources/fridman_susskind.mp3')
+        chunks = silence_boundaries(audio.data, audio.sample_rate, chunk_length=10, tolerance=2)
+        print([(start / audio.sample_rate, end / audio.sample_rate) for start, end in chunks])
+    """
+    num_samples = len(samples)
+    frame_length = max(int(frame_duration * sample_rate), 1)
+    chunk_frames = max(int(chunk_length * sample_rate) // frame_length, 1)
+    tolerance_frames = min(int(tolerance * sample_rate) // frame_length, chunk_frames - 1)
+    envelope = rms_envelope(samples, frame_length)
+    num_frames = len(envelope)
+
+    spans = []
+    start = 0
+    while start < num_frames:
+        end = start + chunk_frames
+        if end < num_frames and tolerance_frames > 0:
+            window = envelope[end - tolerance_frames:end + 1]
+            # Quietest frame in the window; on ties, prefer the latest frame to keep chunks as long as possible
+            end = end - int(np.argmin(window[::-1]))
+        end = min(end, num_frames)
+        spans.append((start * frame_length, min(end * frame_length, num_samples)))
+        start = end
+
+    return spans
+
+
+def decode_stream(
+        filename: str,
+        sample_rate: int,
+        channels: int,
+        block_size: int,
+        start: float = 0.,
+        end: Optional[float] = None
+) -> Iterator[np.ndarray]:
+    """Decode an audio file block by block, without ever holding more than one block in memory.
+
+    The file is decoded by an ffmpeg subprocess, which resamples and remixes it to the given sample rate and number of
+    channels and pipes raw 16-bit PCM back in fixed-size blocks. Seeking to the start time is done by ffmpeg on the
+    input, so nothing before it is decoded.
+
+    Args:
+        filename: The audio file to decode, in any format ffmpeg supports.
+        sample_rate: The sample rate to decode to.
+        channels: The number of channels to decode to.
+        block_size: The number of samples (per channel) in each block. The last block may be shorter.
+        start: The time to start decoding from, in seconds.
+        end (optional): The time to stop decoding at, in seconds. Defaults to the end of the file.
+
+    Returns:
+        An iterator over int16 sample blocks, each of shape (num_samples, channels).
+
+    Example::
+
+        from dosaku.utils import decode_stream
+
+        for block in decode_stream('tests/resources/fridman_susskind.mp3', 16000, 1, block_size=16000 * 60):
+            print(block.shape)  # One minute of mono audio at a time
+    """
+    command = [AudioSegment.converter, '-nostdin', '-v', 'error', '-ss', str(start), '-i', filename]
+    if end is not None:
+        command += ['-t', str(max(end - start, 0))]
+    command += ['-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-ac', str(channels), 'pipe:1']
+
+    block_bytes = block_size * channels * 2
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            buffer = process.stdout.read(block_bytes)
+            if len(buffer) == 0:
+                break
+            buffer = buffer[:len(buffer) - len(buffer) % (channels * 2)]  # Drop any trailing partial sample
+            yield np.frombuffer(buffer, dtype=np.int16).reshape(-1, channels)
+        if process.wait() != 0:
+            raise CouldntDecodeError(f'Decoding {filename} failed: {process.stderr.read().decode(errors="replace")}')
+    finally:  # Also runs if the caller stops iterating early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def split_stream(
+        blocks: Iterable[np.ndarray],
+        sample_rate: int,
+        chunk_length: float,
+        tolerance: float,
+        frame_duration: float = 0.05
+) -> Iterator[np.ndarray]:
+    """Split a stream of audio blocks into chunks, cutting at the quietest point near each boundary.
+
+    This is the streaming counterpart of silence_boundaries(), and produces the same chunks, but only ever buffers
+    slightly more than one chunk of audio at a time.
+
+    Args:
+        blocks: Consecutive blocks of audio samples, e.g. from decode_stream().
+        sample_rate: The sample rate of the audio.
+        chunk_length: The maximum length of each chunk, in seconds.
+        tolerance: How far back from the fixed offset a cut may be moved, in seconds.
+        frame_duration: The length of each frame of the energy envelope, in seconds.
+
+    Returns:
+        An iterator over the audio chunks, in order.
+    """
+    frame_length = max(int(frame_duration * sample_rate), 1)
+    chunk_frames = max(int(chunk_length * sample_rate) // frame_length, 1)
+    required = (chunk_frames + 1) * frame_length  # Enough to see every frame a boundary may be snapped to
+
+    buffer = None
+    for block in blocks:
+        buffer = block if buffer is None else np.concatenate([buffer, block])
+        while len(buffer) >= required:
+            _, end = silence_boundaries(
+                buffer[:required], sample_rate, chunk_length, tolerance, frame_duration=frame_duration)[0]
+            yield buffer[:end]
+            buffer = buffer[end:]
+
+    if buffer is not None and len(buffer) > 0:
+        for start, end in silence_boundaries(buffer, sample_rate, chunk_length, tolerance, frame_duration):
+            yield buffer[start:end]
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(up: int, down: int, zero_crossings: int = 16, beta: float = 8.) -> np.ndarray:
+    """Return the polyphase decomposition of a Kaiser-windowed sinc low-pass filter for resampling by up / down.
+
+    Filters are cached, so repeatedly resampling between the same pair of sample rates designs the filter only once.
+
+    Args:
+        up: The upsampling factor.
+        down: The downsampling factor.
+        zero_crossings: The number of zero crossings of the sinc on each side of its center. Higher is sharper.
+        beta: The Kaiser window shape parameter. Higher trades a wider transition band for more stopband attenuation.
+
+    Returns:
+        A read-only array of shape (up, taps), holding the filter taps of each phase.
+    """
+    factor = max(up, down)
+    half_length = zero_crossings * factor
+    n = np.arange(-half_length, half_length + 1)
+    taps = np.sinc(n / factor) * np.kaiser(len(n), beta) * up / factor
+
+    num_taps = -(-len(taps) // up)
+    phases = np.zeros(num_taps * up, dtype=np.float32)
+    phases[:len(taps)] = taps
+    phases = phases.reshape(num_taps, up).T.copy()
+    phases.setflags(write=False)
+    return phases
+
+
+def resample_poly(
+        data: np.ndarray,
+        up: int,
+        down: int,
+        zero_crossings: int = 16,
+        block_size: int = 2 ** 16
+) -> np.ndarray:
+    """Resample audio by the rational factor up / down with a polyphase filter.
+
+    Only the filter taps that meet non-zero samples are ever computed: each output sample is the dot product of one
+    phase of the filter with the input samples around it. Outputs are computed in blocks of block_size samples, so that
+    memory use stays bounded for long audio.
+
+    Args:
+        data: The audio samples, of shape (num_samples,) or (num_samples, num_channels).
+        up: The upsampling factor.
+        down: The downsampling factor.
+        zero_crossings: The number of zero crossings of the filter on each side of its center. See polyphase_filter().
+        block_size: The number of output samples computed at a time.
+
+    Returns:
+        The resampled float32 samples, of shape (ceil(num_samples * up / down),) or (..., num_channels).
+    """
+    divisor = gcd(up, down)
+    up, down = up // divisor, down // divisor
+    samples = np.asarray(data, dtype=np.float32)
+    if up == down:
+        return samples.copy()
+
+    phases = polyphase_filter(up, down, zero_crossings=zero_crossings)
+    num_taps = phases.shape[1]
+    center = zero_crossings * max(up, down)  # The filter delay, in upsampled samples
+    padded = np.zeros((len(samples) + 2 * num_taps,) + samples.shape[1:], dtype=np.float32)
+    padded[num_taps:num_taps + len(samples)] = samples
+
+    num_outputs = -(-len(samples) * up // down)
+    output = np.empty((num_outputs,) + samples.shape[1:], dtype=np.float32)
+    offsets = np.arange(num_taps)
+    for start in range(0, num_outputs, block_size):
+        positions = np.arange(start, min(start + block_size, num_outputs)) * down + center
+        frames = padded[(positions // up + num_taps)[:, None] - offsets[None, :]]
+        output[start:start + len(positions)] = np.einsum('bt,bt...->b...', phases[positions % up], frames)
+    return output
@@ -0,0 +1,264 @@
+"""Bounded worker pool for audio conversions."""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+import subprocess
+import threading
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+import soundfile
+
+from dosaku import Config
+from dosaku.utils.audio import read_wav_header, resample_poly, sniff_format
+from dosaku.utils.checks import ifnone
+
+
+class CodecPool:
+    """Bounded pool of workers for encoding and decoding audio.
+
+    WAV, FLAC, Ogg Vorbis, AIFF and MP3 are decoded in-process with libsndfile (through soundfile), and WAV, FLAC, AIFF
+    and Ogg Vorbis are encoded in-process the same way. Decoding to a different sample rate or to mono is done
+    in-process as well, with a polyphase resampler. Only MP3 and AAC encoding, Ogg Vorbis at a given bitrate and
+    formats libsndfile cannot read (e.g. AAC) start an ffmpeg process, one per conversion. These processes are fed and
+    drained entirely through pipes: no temporary files are written and no separate ffprobe process is run, as pydub
+    does for every conversion.
+
+    At most max_workers conversions run at a time, and at most max_pending more may wait in the queue; submitting beyond
+    that blocks (or, from asyncio, awaits) until a slot frees up, so that bursts of requests apply backpressure rather
+    than spawning unbounded processes.
+
+    Args:
+        max_workers (optional): The maximum number of concurrent conversions. Defaults to CODEC_POOL/MAX_WORKERS.
+        max_pending (optional): The maximum number of queued conversions. Defaults to CODEC_POOL/MAX_PENDING.
+
+    Example::
+
+        from dosaku.utils import codec_pool
+
+        mp3 = codec_pool.encode(samples, sample_rate=16000, format='mp3', bitrate='32k')
+        sample_rate, samples = codec_pool.decode(mp3)
+
+        # Or, from a coroutine
+        mp3 = await codec_pool.encode_async(samples, sample_rate=16000, format='mp3', bitrate='32k')
+    """
+    config = Config()
+    muxers = {'aac': 'adts', 'm4a': 'adts'}  # Formats whose ffmpeg muxer has a different name
+    soundfile_formats = ('wav', 'flac', 'ogg', 'aiff', 'mp3')  # Formats decoded in-process by soundfile
+    soundfile_encoders = {
+        'wav': ('WAV', 'PCM_16'),
+        'flac': ('FLAC', 'PCM_16'),
+        'aiff': ('AIFF', 'PCM_16'),
+        'ogg': ('OGG', 'VORBIS')
+    }
+    lossless_formats = ('wav', 'flac', 'aiff')  # Formats for which any bitrate given is ignored
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = ifnone(max_workers, default=int(self.config['CODEC_POOL']['MAX_WORKERS']))
+        self.max_pending = ifnone(max_pending, default=int(self.config['CODEC_POOL']['MAX_PENDING']))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='codec')
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Run the given conversion in the pool, blocking while the pool is full."""
+        self._slots.acquire()
+        return self._submit(fn, *args, **kwargs)
+
+    async def submit_async(self, fn: Callable, *args, **kwargs):
+        """Run the given conversion in the pool and await its result, without blocking the event loop."""
+        if not self._slots.acquire(blocking=False):
+            acquire = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # The waiting thread cannot be interrupted, so hand back the slot as soon as it is acquired
+                acquire.add_done_callback(lambda _: self._slots.release())
+                raise
+        return await asyncio.wrap_future(self._submit(fn, *args, **kwargs))
+
+    def _submit(self, fn: Callable, *args, **kwargs) -> Future:
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def encode(
+            self,
+            samples: np.ndarray,
+            sample_rate: int,
+            format: str = 'mp3',
+            bitrate: Optional[str] = None
+    ) -> bytes:
+        """Encode int16 samples, of shape (num_samples,) or (num_samples, num_channels), in the given format.
+
+        The bitrate is ignored for lossless formats (WAV, FLAC and AIFF).
+        """
+        return self.submit(self._encode, samples, sample_rate, format, bitrate).result()
+
+    async def encode_async(
+            self,
+            samples: np.ndarray,
+            sample_rate: int,
+            format: str = 'mp3',
+            bitrate: Optional[str] = None
+    ) -> bytes:
+        """Asynchronous version of encode()."""
+        return await self.submit_async(self._encode, samples, sample_rate, format, bitrate)
+
+    def decode(
+            self,
+            source: Union[bytes, str],
+            format: Optional[str] = None,
+            sample_rate: Optional[int] = None,
+            channels: Optional[int] = None
+    ) -> Tuple[int, np.ndarray]:
+        """Decode encoded audio bytes or an audio file to int16 samples.
+
+        Args:
+            source: The encoded audio, or the name of an audio file.
+            format (optional): The format of the source. Detected by ffmpeg if not given.
+            sample_rate (optional): The sample rate to decode to. Defaults to that of the source.
+            channels (optional): The number of channels to decode to. Defaults to that of the source.
+
+        Returns:
+            A tuple (sample_rate, samples), with samples of shape (num_samples,) or (num_samples, num_channels).
+        """
+        return self.submit(self._decode, source, format, sample_rate, channels).result()
+
+    async def decode_async(
+            self,
+            source: Union[bytes, str],
+            format: Optional[str] = None,
+            sample_rate: Optional[int] = None,
+            channels: Optional[int] = None
+    ) -> Tuple[int, np.ndarray]:
+        """Asynchronous version of decode()."""
+        return await self.submit_async(self._decode, source, format, sample_rate, channels)
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the pool's worker threads."""
+        self._executor.shutdown(wait=wait)
+
+    @staticmethod
+    def _run(command: list, stdin: Optional[bytes]) -> bytes:
+        if stdin is None:
+            command = ['-nostdin'] + command
+        process = subprocess.run(
+            [AudioSegment.converter, '-v', 'error'] + command,
+            input=stdin,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise CouldntDecodeError(f'ffmpeg failed: {process.stderr.decode(errors="replace")}')
+        return process.stdout
+
+    def _encode(self, samples: np.ndarray, sample_rate: int, format: str, bitrate: Optional[str]) -> bytes:
+        samples = np.ascontiguousarray(samples, dtype='<i2')
+        if format in self.soundfile_encoders and (bitrate is None or format in self.lossless_formats):
+            encoded = BytesIO()
+            sf_format, subtype = self.soundfile_encoders[format]
+            soundfile.write(encoded, samples, sample_rate, format=sf_format, subtype=subtype)
+            return encoded.getvalue()
+
+        channels = 1 if samples.ndim == 1 else samples.shape[1]
+        command = ['-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0']
+        if bitrate is not None:
+            command += ['-b:a', bitrate]
+        command += ['-f', self.muxers.get(format, format), 'pipe:1']
+        return self._run(command, stdin=samples.tobytes())
+
+    def _decode(
+            self,
+            source: Union[bytes, str],
+            format: Optional[str],
+            sample_rate: Optional[int],
+            channels: Optional[int]
+    ) -> Tuple[int, np.ndarray]:
+        decoded = self._decode_in_process(source, sample_rate, channels)
+        if decoded is not None:
+            return decoded
+
+        command = ['-f', format] if format is not None and isinstance(source, bytes) else []
+        command += ['-i', 'pipe:0' if isinstance(source, bytes) else source]
+        if sample_rate is not None:
+            command += ['-ar', str(sample_rate)]
+        if channels is not None:
+            command += ['-ac', str(channels)]
+        command += ['-f', 'wav', '-acodec', 'pcm_s16le', 'pipe:1']
+        wav = self._run(command, stdin=source if isinstance(source, bytes) else None)
+
+        header = read_wav_header(BytesIO(wav))  # Piped WAV output does not record its data size
+        frame_size = header.channels * header.dtype.itemsize
+        num_bytes = (len(wav) - header.data_offset) // frame_size * frame_size
+        samples = np.frombuffer(wav, dtype=header.dtype, count=num_bytes // header.dtype.itemsize,
+                                offset=header.data_offset)
+        if header.channels > 1:
+            samples = samples.reshape(-1, header.channels)
+        return header.sample_rate, samples
+
+    def _decode_in_process(
+            self,
+            source: Union[bytes, str],
+            sample_rate: Optional[int],
+            channels: Optional[int]
+    ) -> Optional[Tuple[int, np.ndarray]]:
+        """Decode the source without an ffmpeg process, if its format allows it. Returns None if it does not."""
+        if isinstance(source, bytes):
+            header = source[:12]
+        else:
+            with open(source, 'rb') as file:
+                header = file.read(12)
+        format = sniff_format(header)
+        if format not in self.soundfile_formats:
+            return None
+
+        decoded = None
+        if format == 'wav':  # 16 bit WAV is read directly, without copying byte sources
+            with BytesIO(source) if isinstance(source, bytes) else open(source, 'rb') as file:
+                try:
+                    wav = read_wav_header(file)
+                except CouldntDecodeError:
+                    wav = None
+                if wav is not None and wav.dtype == np.dtype('<i2'):
+                    file.seek(wav.data_offset)
+                    data = file.read(wav.data_size if wav.data_size > 0 else -1)  # Piped WAV may not record its size
+                    frame_size = 2 * wav.channels
+                    samples = np.frombuffer(data, dtype='<i2', count=len(data) // frame_size * wav.channels)
+                    decoded = wav.sample_rate, samples.reshape(-1, wav.channels) if wav.channels > 1 else samples
+        if decoded is None:
+            try:
+                with soundfile.SoundFile(BytesIO(source) if isinstance(source, bytes) else source) as sound_file:
+                    decoded = sound_file.samplerate, sound_file.read(dtype='int16', always_2d=False)
+            except RuntimeError:  # Malformed or unsupported by this libsndfile build; let ffmpeg try to decode it
+                return None
+        return self._convert(*decoded, sample_rate=sample_rate, channels=channels)
+
+    @staticmethod
+    def _convert(
+            source_rate: int,
+            samples: np.ndarray,
+            sample_rate: Optional[int],
+            channels: Optional[int]
+    ) -> Optional[Tuple[int, np.ndarray]]:
+        """Remix and resample decoded samples as ffmpeg would. Returns None for remixes other than to or from mono."""
+        source_channels = 1 if samples.ndim == 1 else samples.shape[1]
+        if channels is not None and channels != source_channels:
+            if channels == 1:
+                samples = samples.mean(axis=1, dtype=np.float32)
+            elif source_channels == 1:
+                samples = np.repeat(samples[:, None], channels, axis=1)
+            else:
+                return None
+        if sample_rate is not None and sample_rate != source_rate:
+            samples = resample_poly(samples, sample_rate, source_rate)
+        if samples.dtype != np.int16:
+            samples = np.clip(np.rint(samples), -2 ** 15, 2 ** 15 - 1).astype(np.int16)
+        return ifnone(sample_rate, default=source_rate), samples
+
+
+codec_pool = CodecPool()
@@ -1,6 +1,10 @@
 """Utility methods relating to image conversion."""
+import asyncio
 import base64
+import collections.abc
+from concurrent.futures import ThreadPoolExecutor
 import io
+from typing import List, Optional, Sequence, Union
 import PIL
 from PIL.Image import Image
 
@@ -11,10 +15,29 @@ from torchvision.transforms.v2 import functional as F
 
 from dosaku.utils import ifnone
 
-
-def pil_to_ascii(image: Image) -> str:
+# Named image encoding presets, used as pil_to_bytes(image, **IMAGE_ENCODINGS[name])
+IMAGE_ENCODINGS = {
+    'archive': dict(format='png'),  # Smallest lossless PNG; slow to encode
+    'fast': dict(format='png', compress_level=1),  # Lossless PNG, ~4x faster to encode than 'archive'
+    'lossless_fast': dict(format='webp', lossless=True, quality=0),  # Lossless and faster still, if WebP is accepted
+    'webp': dict(format='webp', quality=90),
+    'jpeg': dict(format='jpeg', quality=90),  # Fastest by far, but lossy and without an alpha channel
+}
+
+_pil_formats = {'jpg': 'jpeg'}
+
+
+def pil_to_ascii(
+        image: Image,
+        format: str = 'png',
+        quality: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        lossless: bool = False
+) -> str:
     """Serialize PIL Image to ascii.
 
+    Takes the same encoding options as pil_to_bytes().
+
     Example::
 
           import PIL
@@ -24,9 +47,8 @@ def pil_to_ascii(image: Image) -> str:
           ascii_image = pil_to_ascii(image)
           decoded_image = ascii_to_pil(ascii_image)
     """
-    imageio = io.BytesIO()
-    image.save(imageio, 'png')
-    bytes_image = base64.b64encode(imageio.getvalue())
+    bytes_image = base64.b64encode(
+        pil_to_bytes(image, format=format, quality=quality, compress_level=compress_level, lossless=lossless))
     ascii_image = bytes_image.decode('ascii')
     return ascii_image
 
@@ -46,24 +68,90 @@ def ascii_to_pil(ascii_image: str) -> Image:
     return PIL.Image.open(io.BytesIO(base64.b64decode(ascii_image)))
 
 
-def pil_to_bytes(image: Image) -> bytes:
+def pil_to_bytes(
+        image: Image,
+        format: str = 'png',
+        quality: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        lossless: bool = False
+) -> bytes:
     """Serialize PIL Image into io.BytesIO stream.
 
+    The defaults give the smallest lossless PNG, which is slow to encode for large images. Pass one of the
+    IMAGE_ENCODINGS presets (or your own options) where encoding speed matters more than size.
+
+    Args:
+        image: The image to encode.
+        format: The image format, e.g. 'png', 'webp' or 'jpeg'.
+        quality (optional): The quality for lossy formats, in [0, 100]. For lossless WebP, the compression effort.
+        compress_level (optional): The PNG compression level, from 0 (none, fastest) to 9 (smallest). Defaults to 6.
+        lossless: Whether to encode WebP losslessly.
+
+    Returns:
+        The encoded image.
+
     Example::
 
           import PIL
-          from dosaku.utils import pil_to_bytes, bytes_to_pil
+          from dosaku.utils import IMAGE_ENCODINGS, pil_to_bytes, bytes_to_pil
 
           image = PIL.Image.open('tests/resources/hopper.png')
           bytes_image = pil_to_bytes(image)
-          decoded_image = bytes_to_pil(ascii_image)
+          decoded_image = bytes_to_pil(bytes_image)
+
+          fast_bytes_image = pil_to_bytes(image, **IMAGE_ENCODINGS['fast'])
     """
+    format = _pil_formats.get(format.lower(), format.lower())
+    options = dict()
+    if quality is not None:
+        options['quality'] = quality
+    if compress_level is not None:
+        options['compress_level'] = compress_level
+    if lossless:
+        options['lossless'] = True
+        options['method'] = 0  # The fastest lossless WebP method; quality then trades speed for size
+    if format == 'jpeg' and image.mode not in ('RGB', 'L', 'CMYK'):  # JPEG has no alpha channel
+        image = image.convert('RGB')
+
     imageio = io.BytesIO()
-    image.save(imageio, 'png')
+    image.save(imageio, format, **options)
     image_stream = imageio.getvalue()
     return image_stream
 
 
+async def pil_to_bytes_async(image: Image, **options) -> bytes:
+    """Asynchronous version of pil_to_bytes(), encoding in a worker thread.
+
+    Pillow releases the GIL while encoding, so the event loop (and other encodes) carry on in the meantime.
+    """
+    return await asyncio.to_thread(pil_to_bytes, image, **options)
+
+
+def encode_images(images: Sequence[Image], max_workers: Optional[int] = None, **options) -> List[bytes]:
+    """Encode several images in parallel, with the given pil_to_bytes() options.
+
+    Pillow releases the GIL while encoding, so the images are encoded concurrently on up to max_workers threads.
+
+    Args:
+        images: The images to encode.
+        max_workers (optional): The maximum number of encoding threads. Defaults to the ThreadPoolExecutor default.
+        options: Encoding options passed on to pil_to_bytes().
+
+    Returns:
+        The encoded images, in order.
+
+    Example::
+
+        from dosaku.utils import IMAGE_ENCODINGS, encode_images
+
+        encoded = encode_images(images, **IMAGE_ENCODINGS['lossless_fast'])
+    """
+    if len(images) <= 1:
+        return [pil_to_bytes(image, **options) for image in images]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-encoder') as executor:
+        return list(executor.map(lambda image: pil_to_bytes(image, **options), images))
+
+
 def bytes_to_pil(bytes_image: bytes) -> Image:
     """Convert io.BytesIO stream to PIL Image.
 
@@ -100,6 +188,8 @@ def tensor_to_pil(image: torch.Tensor, mode=None, min_val=None, max_val=None) ->
     the range [0, 1]. If no min / max value is provided, the output range will be identically 0 / 1, respectively. Else
     you may pass in min / max range values explicitly.
 
+    A uint8 tensor with an explicit range of [0, 255] is converted as it is, without scaling.
+
     Example::
         from PIL import Image
         from dosaku.utils import pil_to_tensor, tensor_to_pil
@@ -108,36 +198,171 @@ def tensor_to_pil(image: torch.Tensor, mode=None, min_val=None, max_val=None) ->
         tensor_image = pil_to_tensor(image)
         pil_image = tensor_to_pil(tensor_image)
     """
-    min_ = ifnone(min_val, default=torch.min(image))
-    max_ = ifnone(max_val, default=torch.max(image))
-    return F.to_pil_image((image - min_) / (max_ - min_), mode=mode)
+    if min_val is None or max_val is None:
+        tensor_min, tensor_max = torch.aminmax(image)  # One pass over the tensor for both
+        min_val = ifnone(min_val, default=tensor_min)
+        max_val = ifnone(max_val, default=tensor_max)
+    if image.dtype == torch.uint8 and min_val == 0 and max_val == 255:
+        return F.to_pil_image(image, mode=mode)
+
+    # Scale into a single new tensor, in place, rather than allocating a copy per operation
+    scaled = image.sub(min_val) if image.is_floating_point() else image.float().sub_(min_val)
+    scaled = scaled.div_(max_val - min_val)
+    if mode != 'F':
+        scaled = scaled.mul_(255).to(torch.uint8)
+    return F.to_pil_image(scaled, mode=mode)
+
+
+class ImageBatch(collections.abc.Sequence):
+    """A sequence of PIL images backed by a single NHWC (or NHW) uint8 array.
+
+    Each PIL image is only created when it is first accessed, and shares its pixels with the array where PIL allows.
+
+    Args:
+        array: The uint8 images, of shape (N, H, W, C) with C in {1, 3, 4}, or (N, H, W).
+    """
+    def __init__(self, array: np.ndarray):
+        self.array = array[..., 0] if array.ndim == 4 and array.shape[-1] == 1 else array
+        self._images = [None] * len(self.array)
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[Image, List[Image]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if self._images[idx] is None:
+            self._images[idx] = PIL.Image.fromarray(self.array[idx])
+        return self._images[idx]
+
+
+def pil_to_tensor_batch(images: Union[Sequence[Image], np.ndarray]) -> torch.Tensor:
+    """Convert a list of same-sized PIL images (or an NHWC uint8 stack) into a single NCHW uint8 tensor.
+
+    The pixels are copied once, into one NHWC buffer, and the returned tensor is an NCHW view of it (i.e. it is in
+    torch.channels_last memory format). Call .contiguous() on it if a contiguous NCHW tensor is needed.
+
+    Example::
+
+        from PIL import Image
+        from dosaku.utils import pil_to_tensor_batch
+
+        images = [Image.open('tests/resources/hopper.png'), Image.open('tests/resources/hopper_photograph.png')]
+        tensor = pil_to_tensor_batch(images)  # Shape (2, 3, 1024, 768)
+    """
+    if isinstance(images, np.ndarray):
+        array = images
+    else:
+        first = np.asarray(images[0])
+        array = np.empty((len(images),) + first.shape, dtype=first.dtype)
+        for idx, image in enumerate(images):
+            array[idx] = np.asarray(image)
+    if array.ndim == 3:
+        array = array[..., None]
+    return torch.from_numpy(array).permute(0, 3, 1, 2)
+
+
+def tensor_to_pil_batch(
+        images: torch.Tensor,
+        channels_first: bool = True,
+        normalize: Optional[str] = 'sample',
+        min_val: Optional[float] = None,
+        max_val: Optional[float] = None
+) -> ImageBatch:
+    """Convert a batch of image tensors into (lazily created) PIL images in one vectorized pass.
+
+    As with tensor_to_pil(), each image is scaled to fit [0, 1] before conversion to uint8. The range to scale from is
+    computed per sample (normalize='sample'), over the whole batch (normalize='global'), or given explicitly with
+    min_val and max_val. With normalize=None, float tensors are taken to already be in [0, 1] and uint8 tensors are
+    converted as they are.
+
+    Args:
+        images: The images, of shape (N, C, H, W) if channels_first, else (N, H, W, C), with C in {1, 3, 4}.
+        channels_first: Whether the images are NCHW (True) or NHWC (False).
+        normalize (optional): How to compute the range to scale from. One of {'sample', 'global', None}.
+        min_val (optional): The minimum of the range to scale from, overriding normalize.
+        max_val (optional): The maximum of the range to scale from, overriding normalize.
 
+    Returns:
+        An ImageBatch of PIL images, backed by a single uint8 array (ImageBatch.array).
+
+    Example::
+
+        from dosaku.utils import tensor_to_pil_batch
 
-def pil_to_ndarray(image: Image, image_format='RGB') -> np.ndarray:
+        images = tensor_to_pil_batch(model_output)  # model_output of shape (N, 3, H, W)
+        images[0].show()
+    """
+    if normalize not in ['sample', 'global', None]:
+        raise AssertionError(f'Unknown normalization "{normalize}". Expected one of "sample", "global" or None.')
+    images = images.detach().cpu()
+    if min_val is None or max_val is None:
+        if normalize is None:
+            default_min, default_max = 0, 1 if images.is_floating_point() else 255
+        elif normalize == 'global':
+            default_min, default_max = torch.aminmax(images)
+        else:
+            samples = images.flatten(start_dim=1)  # amin and amax are much faster than aminmax along a dim
+            default_min, default_max = samples.amin(dim=1).view(-1, 1, 1, 1), samples.amax(dim=1).view(-1, 1, 1, 1)
+        min_val = ifnone(min_val, default=default_min)
+        max_val = ifnone(max_val, default=default_max)
+
+    if channels_first:
+        images = images.permute(0, 2, 3, 1)
+    if images.dtype == torch.uint8 and not any(torch.is_tensor(val) for val in [min_val, max_val]) and \
+            (min_val, max_val) == (0, 255):
+        return ImageBatch(images.contiguous().numpy())  # Already in range; no scaling needed
+
+    # Scale a few samples at a time (so that temporaries stay in cache) into a single uint8 output buffer
+    def per_sample(val, start: int, end: int):
+        return val[start:end] if torch.is_tensor(val) and val.ndim == 4 else val
+
+    output = torch.empty(images.shape, dtype=torch.uint8)
+    chunk_size = max(1, 2 ** 20 // max(1, images[0].numel()))
+    for start in range(0, len(images), chunk_size):
+        end = start + chunk_size
+        min_, max_ = per_sample(min_val, start, end), per_sample(max_val, start, end)
+        chunk = images[start:end]
+        scaled = chunk.sub(min_) if chunk.is_floating_point() else chunk.float().sub_(min_)
+        value_range = torch.as_tensor(max_ - min_, dtype=scaled.dtype)
+        scaled = scaled.div_(torch.where(value_range > 0, value_range, 1)).mul_(255)
+        output[start:end].copy_(scaled)  # Truncates to uint8, as tensor_to_pil() does
+    return ImageBatch(output.numpy())
+
+
+def pil_to_ndarray(
+        image: Image,
+        image_format='RGB',
+        out: Optional[np.ndarray] = None,
+        copy: bool = True
+) -> np.ndarray:
     """Convert PIL image to numpy ndarray.
 
-    If an alpha channel is present, it will automatically be copied over as well.
+    If an alpha channel is present, it will automatically be copied over as well. The image is only converted if it is
+    not already in the output mode ('RGB', or 'RGBA' with an alpha channel).
 
     Args:
         image: The input image.
         image_format: The format of the *output* image. One of {'RGB', 'BGR'}.
+        out (optional): A uint8 array of the output shape to write the output image into, e.g. to reuse one buffer
+            across many conversions.
+        copy: Whether to return a writable copy of the image data. If False, an 'RGB' array (with out not given) is
+            instead a read-only view of the image data, which saves a copy when the array is only read.
 
     Returns:
         An np.ndarray image in the specified format.
     """
-    if image.mode in ['LA', 'RGBA']:  # Alpha channel present
-        image = image.convert(mode='RGBA')
-        if image_format == 'RGB':
-            return np.array(image)
-        elif image_format == 'BGR':
-            return cv2.cvtColor(np.array(image), cv2.COLOR_RGBA2BGRA)
-
-    else:  # No alpha channel
-        image = image.convert(mode='RGB')
-        if image_format == 'RGB':
-            return np.array(image)
-        elif image_format == 'BGR':
-            return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    mode = 'RGBA' if image.mode in ['LA', 'RGBA'] else 'RGB'  # With or without an alpha channel
+    if image.mode != mode:
+        image = image.convert(mode=mode)
+
+    if image_format == 'RGB':
+        if out is None:
+            return np.array(image) if copy else np.asarray(image)
+        np.copyto(out, np.asarray(image))
+        return out
+    elif image_format == 'BGR':
+        return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGBA2BGRA if mode == 'RGBA' else cv2.COLOR_RGB2BGR, dst=out)
 
 
 def ndarray_to_pil(image: np.ndarray, image_format: str = 'RGB'):
@@ -165,8 +390,10 @@ def ndarray_to_pil(image: np.ndarray, image_format: str = 'RGB'):
         plt.show()
         pil_image.show()
     """
+    owned = False  # Whether the image is a new array that may be modified in place
     if np.issubdtype(image.dtype, np.floating):
-        image = (image * 255).astype(np.uint8)
+        image = np.multiply(image, 255, out=np.empty(image.shape, dtype=np.uint8), casting='unsafe')
+        owned = True
     elif not np.issubdtype(image.dtype, np.integer) and image.dtype != bool:
         raise AssertionError(f'Unknown image dtype {image.dtype}. Expected one of bool, np.floating or np.integer.')
 
@@ -177,14 +404,12 @@ def ndarray_to_pil(image: np.ndarray, image_format: str = 'RGB'):
     elif num_channels == 1 or image_format == 'RGB' or image.dtype == bool:
         return PIL.Image.fromarray(image)
     elif image_format == 'BGR':
-        if num_channels == 3:
-            return PIL.Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        elif num_channels == 4:
-            return PIL.Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA))
+        code = cv2.COLOR_BGR2RGB if num_channels == 3 else cv2.COLOR_BGRA2RGBA
+        return PIL.Image.fromarray(cv2.cvtColor(image, code, dst=image if owned else None))
     raise AssertionError(f'Unknown image format "{image_format}". Expected one of "RGB" or "BGR".')
 
 
-def pil_to_cv2(image: Image) -> np.ndarray:
+def pil_to_cv2(image: Image, out: Optional[np.ndarray] = None) -> np.ndarray:
     """Convert PIL image to cv2 image.
 
     Note that, in addition to cv2 images being numpy arrays, PIL Images follow RGB format while cv2 images follow BGR
@@ -192,6 +417,7 @@ def pil_to_cv2(image: Image) -> np.ndarray:
 
     Args:
         image: The input image.
+        out (optional): A uint8 array of the output shape to write the output image into.
 
     Returns:
         An np.ndarray image in 'BGR' (cv2) format.
@@ -204,7 +430,7 @@ def pil_to_cv2(image: Image) -> np.ndarray:
           pil_image = PIL.Image.open('tests/resources/hopper.png')
           cv2_image = pil_to_cv2(pil_image)
     """
-    return pil_to_ndarray(image, image_format='BGR')
+    return pil_to_ndarray(image, image_format='BGR', out=out)
 
 
 def cv2_to_pil(image: np.ndarray) -> Image:
@@ -1,13 +1,18 @@
 """Utility methods relating to image processing."""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import PIL
 from PIL.Image import Image
-from typing import Optional
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
 
 from dosaku.utils import pil_to_cv2, cv2_to_pil, ifnone
 
+Images = Union[Sequence[Image], Sequence[np.ndarray], np.ndarray]
+ImageArrays = Union[List[np.ndarray], np.ndarray]
+
 
 def canny(image: Image, low_thresh: int = 100, high_thresh: int = 200, mode='L') -> Image:
     """Computes Canny edges using OpenCV.
@@ -274,3 +279,354 @@ def insert_image(
         output_image.paste(source_image, (left, top))
 
     return output_image
+
+
+@dataclass
+class Placement:
+    """A source image to composite onto a destination image with composite_images().
+
+    The fields mirror the arguments of insert_image().
+    """
+    source: Image
+    mask: Optional[Image] = None
+    left: int = 0
+    top: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def _alpha_mask(mask: Image, size: tuple) -> Image:
+    """Return the given mask as an 'L' image, taking the alpha channel of 'LA' and 'RGBA' masks."""
+    if mask.mode in ['LA', 'RGBA']:
+        mask = mask.getchannel('A')
+    if mask.mode not in ['L', '1']:
+        raise AssertionError(f'The source_mask mode must be one of ["1", "L", "LA", "RGBA"], found "{mask.mode}".')
+    if mask.size != size:
+        raise AssertionError(f'The source_image and source_mask must be the same size, '
+                             f'found {size} and {mask.size}, respectively.')
+    return mask.convert('L')
+
+
+def _prepare_placement(placement: Placement) -> tuple:
+    """Resize a placement's source (and mask), returning its RGB pixels, alpha and premultiplied pixels as arrays."""
+    source, mask = placement.source, placement.mask
+    if mask is not None:
+        mask = _alpha_mask(mask, source.size)
+
+    width, height = placement.width, placement.height
+    if width is not None or height is not None:
+        if width is None:
+            width = int(source.size[0] * height / source.size[1])
+        if height is None:
+            height = int(source.size[1] * width / source.size[0])
+        if mask is not None:  # Resize the source and mask together, as insert_image() does
+            source = source.convert('RGB')
+            source.putalpha(mask)
+            source = source.resize((width, height))
+            mask = source.getchannel('A')
+        else:
+            source = source.resize((width, height))
+
+    pixels = np.asarray(source.convert('RGB'))
+    if mask is None:
+        return pixels, None, None
+    alpha = np.asarray(mask)[..., None]
+    return pixels, alpha, pixels * (alpha * np.float32(1 / 255))  # The last being the premultiplied source
+
+
+def composite_images(destination_image: Image, placements: Iterable[Placement]) -> Image:
+    """Resize and composite many source images onto a destination image in a single pass.
+
+    This gives the same result as calling insert_image() once per placement, feeding each output into the next call,
+    but the destination is converted to an array once, each distinct source (and size) is resized and premultiplied by
+    its alpha once, and each placement is blended in place into just the region it covers. The cost therefore grows
+    with the total area of the placements, rather than with their number times the area of the destination.
+
+    Args:
+        destination_image: The image onto which the source images are composited.
+        placements: The source images, with their masks, sizes and locations, in the order to composite them.
+
+    Returns:
+        An image. The returned image will have mode 'RGB' and the same resolution as the destination image.
+
+    Example::
+
+        from PIL import Image
+        from dosaku.utils import composite_images, Placement
+
+        background = Image.open('tests/resources/office_in_a_small_city.png')
+        sprite = Image.open('tests/resources/hopper.png')
+        sprite_mask = Image.open('tests/resources/hopper_mask.png')
+        image = composite_images(background, [Placement(sprite, sprite_mask, left=100 * idx, width=200)
+                                              for idx in range(8)])
+    """
+    canvas = np.array(destination_image.convert(mode='RGB'))  # Converted (and copied) once, then blended in place
+    canvas_height, canvas_width = canvas.shape[:2]
+    # Each distinct (source, mask, size) is only converted and resized once. Keyed by object ids, so the placements
+    # (and, in each entry, the source and mask) are kept alive, ensuring that no id is reused by a new object
+    placements = list(placements)
+    prepared = dict()
+
+    for placement in placements:
+        key = (id(placement.source), id(placement.mask), placement.width, placement.height)
+        if key not in prepared:
+            prepared[key] = (placement.source, placement.mask, _prepare_placement(placement))
+        pixels, alpha, premultiplied = prepared[key][2]
+
+        # Clip the source to the canvas
+        left, top = placement.left, placement.top
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + pixels.shape[1], canvas_width), min(top + pixels.shape[0], canvas_height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        crop = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        region = canvas[y0:y1, x0:x1]
+
+        if alpha is None:
+            region[...] = pixels[crop]
+            continue
+        alpha = alpha[crop]
+        if alpha.min() == 255:  # Opaque
+            region[...] = pixels[crop]
+        elif alpha.max() > 0:  # Not fully transparent
+            blended = region * (1 - alpha * np.float32(1 / 255))
+            blended += premultiplied[crop]
+            np.rint(blended, out=blended)
+            region[...] = blended
+
+    return PIL.Image.fromarray(canvas)
+
+
+def _map_images(fn: Callable, images: Images, max_workers: Optional[int] = None) -> ImageArrays:
+    """Apply fn to each image on a thread pool, returning a stack for a stack and a list for a list.
+
+    OpenCV and Pillow release the GIL in their image operations, so threads scale with cores without the cost of
+    pickling images to and from worker processes.
+    """
+    if len(images) <= 1:
+        outputs = [fn(image) for image in images]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-batch') as executor:
+            outputs = list(executor.map(fn, images))
+    if isinstance(images, np.ndarray):
+        return np.stack(outputs) if len(outputs) > 0 else np.empty((0,), dtype=np.uint8)
+    return outputs
+
+
+def _as_pil(image: Union[Image, np.ndarray]) -> Image:
+    return image if isinstance(image, Image) else PIL.Image.fromarray(image)
+
+
+def canny_batch(
+        images: Images,
+        low_thresh: int = 100,
+        high_thresh: int = 200,
+        max_workers: Optional[int] = None
+) -> ImageArrays:
+    """Batch version of canny(), computing the edges of each image in parallel.
+
+    Args:
+        images: A list of PIL images or arrays, or an NHWC (or NHW) uint8 stack.
+        low_thresh: Lower threshold.
+        high_thresh: Upper threshold.
+        max_workers (optional): The maximum number of threads to use.
+
+    Returns:
+        The binary edge maps, as uint8 arrays with values 0 or 255: an NHW stack for a stack, else a list of arrays. Use
+        ndarray_to_pil() on each when PIL images are needed.
+
+    Example::
+
+        from dosaku.utils import canny_batch, ndarray_to_pil
+
+        edges = canny_batch(images)
+        edge_images = [ndarray_to_pil(edge) for edge in edges]
+    """
+    return _map_images(lambda image: cv2.Canny(np.asarray(image), low_thresh, high_thresh), images,
+                       max_workers=max_workers)
+
+
+def fit_batch(
+        images: Images,
+        height: Optional[int] = None,
+        width: Optional[int] = None,
+        max_workers: Optional[int] = None
+) -> ImageArrays:
+    """Batch version of fit(), resizing each image onto a transparent height by width canvas in parallel.
+
+    Each image is resized exactly as fit() does, but the results are returned as arrays.
+
+    Args:
+        images: A list of PIL images or RGB(A) arrays, or an NHWC uint8 stack.
+        height (optional): Height of the output images.
+        width (optional): Width of the output images.
+        max_workers (optional): The maximum number of threads to use.
+
+    Returns:
+        The fitted images as RGBA uint8 arrays: an NHWC stack for a stack, else a list of arrays.
+
+    Example::
+
+        from dosaku.utils import fit_batch
+
+        pages = fit_batch(images, height=1440, width=1080)  # An Nx1440x1080x4 stack for an NHWC stack of images
+    """
+    return _map_images(lambda image: np.asarray(fit(_as_pil(image), height=height, width=width)), images,
+                       max_workers=max_workers)
+
+
+def center_batch(
+        images: Images,
+        height: Optional[int] = None,
+        width: Optional[int] = None,
+        max_workers: Optional[int] = None
+) -> ImageArrays:
+    """Batch version of center(), centering each image on a transparent height by width canvas.
+
+    Args:
+        images: A list of PIL images or RGB(A) arrays, or an NHWC uint8 stack.
+        height (optional): Height of the output images.
+        width (optional): Width of the output images.
+        max_workers (optional): The maximum number of threads to use.
+
+    Returns:
+        The centered images as RGBA uint8 arrays: an NHWC stack for a stack, else a list of arrays.
+    """
+    return _map_images(lambda image: np.asarray(center(_as_pil(image), height=height, width=width)), images,
+                       max_workers=max_workers)
+
+
+def erode_batch(images: Images, iterations: int = 1, max_workers: Optional[int] = None) -> ImageArrays:
+    """Batch version of erode(), computing the morphological erosion of each image in parallel.
+
+    Unlike erode(), the outputs keep the channels of the inputs; convert them to the mode you need afterwards.
+
+    Args:
+        images: A list of PIL images or arrays, or an NHWC (or NHW) uint8 stack.
+        iterations: Number of times to apply the erosion.
+        max_workers (optional): The maximum number of threads to use.
+
+    Returns:
+        The eroded images as uint8 arrays: a stack for a stack, else a list of arrays.
+    """
+    kernel = np.asarray(cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    return _map_images(lambda image: cv2.erode(np.asarray(image), kernel, iterations=iterations), images,
+                       max_workers=max_workers)
+
+
+def binary_mask_to_alpha_batch(
+        masks: Images,
+        blur_radius: Optional[int] = None,
+        max_workers: Optional[int] = None
+) -> ImageArrays:
+    """Batch version of binary_mask_to_alpha(), returning the alpha mask of each mask as an array.
+
+    Blurring runs in parallel, and the normalization of each blurred mask to [0, 255] is vectorized over the stack.
+    PIL.Image.fromarray(alpha).convert('RGBA') gives the same image as binary_mask_to_alpha() for each output.
+
+    Args:
+        masks: A list of PIL images in mode '1' or 'L', or of HW arrays, or an NHW stack.
+        blur_radius (optional): The blur radius (ksize) passed into cv2.GaussianBlur.
+        max_workers (optional): The maximum number of threads to use.
+
+    Returns:
+        The alpha masks as uint8 arrays: an NHW stack for a stack, else a list of arrays.
+    """
+    def to_alpha(mask: Union[Image, np.ndarray]) -> np.ndarray:
+        mask = np.asarray(mask)
+        mask = mask.astype(np.uint8) * 255 if mask.dtype == bool else mask  # Mode '1' images are bool arrays
+        if blur_radius is None:
+            return mask
+        return cv2.GaussianBlur(mask, (blur_radius, blur_radius), 0)
+
+    alphas = _map_images(to_alpha, masks, max_workers=max_workers)
+    if blur_radius is None:
+        return alphas
+
+    stack = alphas if isinstance(alphas, np.ndarray) else None
+    if stack is None and len(set(alpha.shape for alpha in alphas)) == 1:
+        stack = np.stack(alphas)
+    if stack is None:  # Masks of different sizes; normalize one at a time
+        return [cv2.normalize(alpha, None, 0, 255, cv2.NORM_MINMAX) for alpha in alphas]
+
+    low = stack.min(axis=(1, 2), keepdims=True).astype(np.float32)
+    high = stack.max(axis=(1, 2), keepdims=True).astype(np.float32)
+    scale = np.divide(255, high - low, out=np.zeros_like(high), where=high > low)  # Constant masks go to 0
+    normalized = np.rint((stack - low) * scale).astype(np.uint8)
+    return normalized if isinstance(alphas, np.ndarray) else list(normalized)
+
+
+def tile_boxes(size: Tuple[int, int], tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """Split an image of the given size into overlapping tiles of at most tile_size by tile_size pixels.
+
+    Tiles are spread evenly along each axis, so that neighbouring tiles overlap by at least the given overlap.
+
+    Args:
+        size: The (width, height) of the image.
+        tile_size: The maximum width and height of each tile.
+        overlap: The minimum overlap between neighbouring tiles, in pixels. Must be less than tile_size.
+
+    Returns:
+        The (left, top, right, bottom) box of each tile, in row-major order.
+    """
+    if overlap >= tile_size:
+        raise AssertionError(f'The tile overlap ({overlap}) must be less than the tile size ({tile_size}).')
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        num_tiles = int(np.ceil((length - overlap) / (tile_size - overlap)))
+        return [round(idx * (length - tile_size) / (num_tiles - 1)) for idx in range(num_tiles)]
+
+    width, height = size
+    return [(left, top, min(left + tile_size, width), min(top + tile_size, height))
+            for top in starts(height) for left in starts(width)]
+
+
+def stitch_tiles(
+        tiles: Sequence[Image],
+        boxes: Sequence[Tuple[int, int, int, int]],
+        size: Tuple[int, int],
+        feather: int
+) -> Image:
+    """Reassemble processed tiles into a single image, feathering the seams between overlapping tiles.
+
+    Tiles are composited in order, each one fading in across the overlap with the tiles to its left and above it, so
+    that differences between neighbouring tiles are blended rather than showing as hard seams. Tiles that are not the
+    size of their box are resized to fit.
+
+    Args:
+        tiles: The processed tiles, in the row-major order given by tile_boxes().
+        boxes: The (left, top, right, bottom) box of each tile in the output image.
+        size: The (width, height) of the output image.
+        feather: The width of the blend across each seam, in pixels. At most the overlap between tiles.
+
+    Returns:
+        The stitched image, in mode 'RGB'.
+    """
+    masks = []
+    for idx, (left, top, right, bottom) in enumerate(boxes):
+        earlier = boxes[:idx]
+        blend_left = any(box[1] == top and box[0] < left < box[2] for box in earlier)
+        blend_top = any(box[0] == left and box[1] < top < box[3] for box in earlier)
+        mask = np.ones((bottom - top, right - left), dtype=bool)
+        if blend_left:
+            mask[:, :feather // 2] = False
+        if blend_top:
+            mask[:feather // 2, :] = False
+        masks.append(mask if blend_left or blend_top else None)
+
+    blur_radius = feather // 2 * 2 + 1  # cv2.GaussianBlur requires an odd kernel size
+    seams = [mask for mask in masks if mask is not None]
+    alphas = iter(binary_mask_to_alpha_batch(seams, blur_radius=blur_radius) if len(seams) > 0 else [])
+    placements = []
+    for tile, (left, top, right, bottom), mask in zip(tiles, boxes, masks):
+        resize = tile.size != (right - left, bottom - top)
+        placements.append(Placement(
+            tile,
+            mask=None if mask is None else PIL.Image.fromarray(next(alphas)).resize(tile.size),
+            left=left,
+            top=top,
+            width=right - left if resize else None,
+            height=bottom - top if resize else None))
+    return composite_images(PIL.Image.new('RGB', size), placements)
@@ -0,0 +1,201 @@
+"""Checkpointing for resumable, multi-stage jobs."""
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, IO, Iterator, Optional
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows; only threads within a single process are synchronized
+    fcntl = None
+
+from dosaku import Config
+from dosaku.utils.checks import ifnone
+
+
+class JobManifest:
+    """Checkpoint manifest for a resumable job made up of several items (e.g. audio chunks) processed in stages.
+
+    Each job gets its own directory, named by its job id, holding the output of every completed stage of every item
+    together with a manifest recording which stages have completed. Stage outputs and the manifest are written
+    atomically, so a job that crashes or is restarted resumes from its last completed stage, and jobs with different ids
+    never touch each other's files.
+
+    A stage may be completed with metadata (e.g. the parameters it was run with). The stage then only counts as complete
+    for those same parameters.
+
+    Several workers (threads or processes) may run the same job at once. Updates to the manifest are serialized with a
+    file lock, so no worker loses another's completed stages, and each open manifest holds a shared lock on the job so
+    that it cannot be restarted from under it. Call close() (or use the manifest as a context manager) once done with
+    the job, or remove() once its outputs are no longer needed.
+
+    Args:
+        job_id: Unique id of the job. Use job_id() to derive one from a source file and the job parameters.
+        jobs_dir (optional): Directory holding all job directories. Defaults to DIR_PATHS/TEMP/jobs.
+        params (optional): Job parameters, recorded in the manifest for reference.
+        restart: Whether to discard any previous progress and start the job over. Raises a RuntimeError if another
+            worker currently has the job open.
+
+    Example::
+
+        from dosaku.utils import JobManifest
+
+        job_id = JobManifest.job_id('tests/resources/fridman_susskind.mp3', chunk_length=1200)
+        with JobManifest(job_id) as job:
+            if not job.is_complete(0, 'transcribed'):
+                job.complete(0, 'transcribed', text=transcribe(...))  # Your (expensive) stage here
+            text = job.read(0, 'transcribed')
+    """
+    config = Config()
+    manifest_filename = 'manifest.json'
+    manifest_lock_filename = 'manifest.lock'
+
+    def __init__(
+            self,
+            job_id: str,
+            jobs_dir: Optional[str] = None,
+            params: Optional[Dict[str, Any]] = None,
+            restart: bool = False
+    ):
+        self.job_id = job_id
+        self.jobs_dir = ifnone(jobs_dir, default=os.path.join(self.config['DIR_PATHS']['TEMP'], 'jobs'))
+        self.job_dir = os.path.join(self.jobs_dir, job_id)
+        self._lock = threading.Lock()
+
+        # Held (shared) for as long as the manifest is open; lives outside the job directory so it survives a restart
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._job_lock = open(os.path.join(self.jobs_dir, f'{job_id}.lock'), 'a')
+        if restart:
+            if not self._flock(self._job_lock, exclusive=True, blocking=False):
+                self._job_lock.close()
+                raise RuntimeError(f'Unable to restart job {job_id}, as it is in use by another worker.')
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        self._flock(self._job_lock, exclusive=False)
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        self.manifest = self._load()
+        if params is not None and self.manifest.get('params') is None:
+            self.manifest['params'] = params
+            with self._lock:
+                self._save()
+
+    def close(self):
+        """Release the job, allowing it to be restarted by other workers."""
+        self._job_lock.close()  # Closing the file releases its lock
+
+    def remove(self) -> bool:
+        """Delete the job directory and release the job.
+
+        The directory is only deleted if no other worker has the job open, as it may still be reading from it; the last
+        worker to remove the job deletes it. The (empty) lock file is kept, so that workers opening the job at the same
+        time still exclude each other.
+
+        Returns:
+            Whether the job directory was deleted.
+        """
+        removed = self._flock(self._job_lock, exclusive=True, blocking=False)
+        if removed:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        self.close()
+        return removed
+
+    def __enter__(self) -> 'JobManifest':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def hash_file(filename: str, block_size: int = 2 ** 20) -> str:
+        """Return the sha256 hex digest of the given file, read in blocks."""
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def job_id(cls, filename: str, **params) -> str:
+        """Return a job id derived from the contents of the source file and the given job parameters."""
+        digest = hashlib.sha256()
+        digest.update(cls.hash_file(filename).encode('utf-8'))
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def path(self, filename: str) -> str:
+        """Return the path of the given file within the job directory."""
+        return os.path.join(self.job_dir, filename)
+
+    def is_complete(self, item: int, stage: str, **meta) -> bool:
+        """Return whether the given stage of the given item has completed (with the same metadata, if given)."""
+        with self._lock:
+            record = self.manifest['items'].get(str(item), dict()).get(stage)
+        return record is not None and all(record.get(key) == val for key, val in meta.items())
+
+    def read(self, item: int, stage: str) -> str:
+        """Return the text output of a completed stage."""
+        with open(self._stage_path(item, stage), 'r', encoding='utf-8') as stage_file:
+            return stage_file.read()
+
+    def complete(self, item: int, stage: str, text: Optional[str] = None, **meta):
+        """Mark the given stage of the given item as complete, saving its text output (if any) first.
+
+        Args:
+            item: Index of the item.
+            stage: Name of the stage.
+            text (optional): The text output of the stage, retrievable later with read().
+            **meta: Any metadata to record with the stage.
+        """
+        if text is not None:
+            self._write(self._stage_path(item, stage), text)
+        with self._lock:
+            self.manifest['items'].setdefault(str(item), dict())[stage] = meta
+            self._save()
+
+    def _stage_path(self, item: int, stage: str) -> str:
+        return self.path(f'{stage}_{item}.txt')
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path(self.manifest_filename), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'job_id': self.job_id, 'params': None, 'items': dict()}
+
+    def _save(self):
+        # Merge in progress saved by any other process running the same job, so that neither loses completed stages
+        with self._manifest_lock():
+            on_disk = self._load()
+            for item, stages in on_disk['items'].items():
+                for stage, meta in stages.items():
+                    self.manifest['items'].setdefault(item, dict()).setdefault(stage, meta)
+            self._write(self.path(self.manifest_filename), json.dumps(self.manifest, indent=4))
+
+    @contextmanager
+    def _manifest_lock(self) -> Iterator[None]:
+        with open(self.path(self.manifest_lock_filename), 'a') as lock_file:
+            self._flock(lock_file, exclusive=True)
+            yield  # The lock is released when the file is closed
+
+    @staticmethod
+    def _flock(file: IO, exclusive: bool, blocking: bool = True) -> bool:
+        """Lock the given open file, returning False if it could not be locked without blocking."""
+        if fcntl is None:
+            return True
+        flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(file.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    @staticmethod
+    def _write(path: str, text: str):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
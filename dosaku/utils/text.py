@@ -0,0 +1,114 @@
+"""Utility methods relating to text processing."""
+import re
+from typing import Iterator, List, Optional
+
+from dosaku.utils.checks import ifnone
+
+FILLER_WORDS = ('um', 'umm', 'uh', 'uhh', 'erm', 'er', 'ah', 'hmm', 'mm')
+ABBREVIATIONS = ('mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'jr', 'sr', 'vs', 'mt', 'e.g', 'i.e')  # Never end a sentence
+
+_filler_pattern = re.compile(
+    r'(?<![\w-])(?:' + '|'.join(FILLER_WORDS) + r')(?![\w-])[,.]?\s*', flags=re.IGNORECASE)
+_sentence_pattern = re.compile(
+    r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))' +
+    ''.join(rf'(?<!\b{re.escape(abbreviation)}\.)' for abbreviation in ABBREVIATIONS) +
+    r'\s+', flags=re.IGNORECASE)
+
+
+def remove_fillers(text: str) -> str:
+    """Remove filler words (e.g. "um", "uh") from the given text, along with any punctuation attached to them.
+
+    Args:
+        text: The text to clean up.
+
+    Returns:
+        The text without filler words, with whitespace collapsed.
+
+    Example::
+
+        from dosaku.utils import remove_fillers
+
+        remove_fillers('So, um, I was thinking, uh, about the Roman Empire.')  # 'So, I was thinking, about the ...'
+    """
+    text = _filler_pattern.sub('', text)
+    text = re.sub(r'\s+([,.!?])', r'\1', text)
+    text = re.sub(r',(?=[,.!?])', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split the given text into sentences on sentence-ending punctuation followed by whitespace.
+
+    Transcribed text is often not capitalized, so the case of the following word is ignored. Text is never split after
+    one of the common abbreviations in ABBREVIATIONS (e.g. "Dr. Smith"). The text of each sentence is left unchanged.
+
+    Args:
+        text: The text to split.
+
+    Returns:
+        The sentences, each stripped of surrounding whitespace.
+    """
+    return [sentence.strip() for sentence in _sentence_pattern.split(text) if len(sentence.strip()) > 0]
+
+
+def clean_transcript(text: str) -> str:
+    """Clean up raw transcribed text, removing filler words and placing each sentence on its own line.
+
+    Args:
+        text: The raw transcribed text.
+
+    Returns:
+        The cleaned text.
+    """
+    # Split both before and after removing fillers, as removing a filler can expose (or hide) a sentence break
+    return '\n'.join(
+        cleaned for sentence in split_sentences(text) for cleaned in split_sentences(remove_fillers(sentence)))
+
+
+def split_text(text: str, max_length: int = 4096, first_length: Optional[int] = None) -> List[str]:
+    """Split text into segments of at most max_length characters, breaking only between sentences where possible.
+
+    Sentences are packed into segments in order, and a new segment is started at a paragraph break whenever the current
+    segment is already at least half full. A single sentence longer than max_length is broken between words.
+
+    Args:
+        text: The text to split.
+        max_length: The maximum length of each segment, in characters.
+        first_length (optional): A (smaller) maximum length for the first segment, so that processing of the first
+            segment can finish sooner. Defaults to max_length.
+
+    Returns:
+        The text segments, in order.
+
+    Example::
+
+        from dosaku.utils import split_text
+
+        segments = split_text(long_text, max_length=1000, first_length=200)
+    """
+    limit = ifnone(first_length, default=max_length)
+    segments = []
+    current = ''
+
+    def pieces(sentence: str) -> Iterator[str]:
+        while len(sentence) > limit:
+            cut = sentence.rfind(' ', 0, limit + 1)
+            cut = cut if cut > 0 else limit
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        yield sentence
+
+    for paragraph in re.split(r'\n\s*\n', text):
+        sentences = split_sentences(paragraph.replace('\n', ' '))
+        for idx, sentence in enumerate(sentences):
+            for piece in pieces(sentence):
+                separator = '\n\n' if idx == 0 and len(current) > 0 else ' '
+                if len(current) > 0 and (len(current) + len(separator) + len(piece) > limit or
+                                         (idx == 0 and len(current) >= limit // 2)):
+                    segments.append(current)
+                    current = ''
+                    limit = max_length
+                current = piece if len(current) == 0 else current + separator + piece
+    if len(current) > 0:
+        segments.append(current)
+    return segments
@@ -0,0 +1,162 @@
+"""Content-addressed cache for audio transcriptions."""
+import hashlib
+import os
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+import uuid
+
+import numpy as np
+
+from dosaku import Config
+from dosaku.utils.checks import ifnone
+
+
+class TranscriptionCache:
+    """Size-bounded, on-disk cache of transcribed audio segments.
+
+    Entries are keyed by a hash of the decoded PCM samples of an audio segment together with its sample rate, the model
+    used and the prompt given to the model. Because keys depend only on content, the same audio re-submitted under a
+    different filename (or re-run through a pipeline) hits the cache. Long audio should be cached segment by segment, so
+    that requests which share some, but not all, of their audio still reuse the matching segments.
+
+    When the cache grows beyond its maximum size, the least recently used entries are evicted.
+
+    Args:
+        cache_dir (optional): Directory to store the cache entries in. Defaults to DIR_PATHS/CACHE/transcriptions.
+        max_size (optional): Maximum size of the cache, in bytes. Defaults to TRANSCRIPTION_CACHE/MAX_SIZE (in MB).
+
+    Example::
+
+        from dosaku.types import Audio
+        from dosaku.utils import TranscriptionCache
+
+        cache = TranscriptionCache()
+        audio = Audio(filename='tests/resources/fridman_susskind.mp3')
+        key = cache.key(audio.data, audio.sample_rate, model='whisper-1')
+        text = cache.get(key)
+        if text is None:
+            text = transcribe(audio)  # Your transcription method here
+            cache.put(key, text)
+    """
+    config = Config()
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[int] = None):
+        self.cache_dir = ifnone(cache_dir, default=os.path.join(self.config['DIR_PATHS']['CACHE'], 'transcriptions'))
+        self.max_size = ifnone(max_size, default=int(self.config['TRANSCRIPTION_CACHE']['MAX_SIZE']) * 2 ** 20)
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(pcm: np.ndarray, sample_rate: int, model: str, prompt: Optional[str] = None) -> str:
+        """Return the cache key for the given audio samples, model and prompt.
+
+        Args:
+            pcm: The decoded audio samples.
+            sample_rate: The sample rate of the audio.
+            model: Name of the transcription model.
+            prompt (optional): Any prompt given to the transcription model.
+
+        Returns:
+            A hex digest uniquely identifying the transcription request.
+        """
+        pcm = np.ascontiguousarray(pcm)
+        digest = hashlib.sha256()
+        digest.update(f'{model}\0{ifnone(prompt, default="")}\0{sample_rate}\0{pcm.dtype.str}\0{pcm.shape[1:]}\0'
+                      .encode('utf-8'))
+        digest.update(pcm.view(np.uint8).reshape(-1))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.txt')
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached transcription for the given key, or None if it has not been cached."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                text = cache_file.read()
+            os.utime(path)  # Mark as recently used
+            return text
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, text: str):
+        """Cache the transcription for the given key, evicting old entries as needed."""
+        os.makedirs(self.cache_dir, exist_ok=True)  # Created on first write, so unused caches leave no trace on disk
+        path = self._path(key)
+        try:
+            replaced_size = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_size = 0
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            cache_file.write(text)
+        os.replace(tmp_path, path)  # Atomic, so concurrent readers never see a partial entry
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path) - replaced_size
+            if self._size is None or self._size > self.max_size:
+                self._evict()
+
+    def transcribe(
+            self,
+            segments: Sequence[Tuple[np.ndarray, int]],
+            transcribe: Callable[[int], str],
+            model: str,
+            prompt: Optional[str] = None
+    ) -> List[str]:
+        """Transcribe a sequence of audio segments, transcribing only those segments which are not already cached.
+
+        Args:
+            segments: A sequence of (pcm, sample_rate) tuples.
+            transcribe: Callable taking the index of a segment and returning its transcription.
+            model: Name of the transcription model.
+            prompt (optional): Any prompt given to the transcription model.
+
+        Returns:
+            The transcription of each segment.
+        """
+        texts = []
+        for idx, (pcm, sample_rate) in enumerate(segments):
+            key = self.key(pcm, sample_rate, model=model, prompt=prompt)
+            text = self.get(key)
+            if text is None:
+                text = transcribe(idx)
+                self.put(key, text)
+            texts.append(text)
+        return texts
+
+    @property
+    def size(self) -> int:
+        """The total size of all cache entries, in bytes."""
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            for entry in self._entries():
+                self._remove(entry.path)
+            self._size = 0
+
+    def _entries(self) -> List[os.DirEntry]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.txt')]
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)  # Least recently used first
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size <= self.max_size:
+                break
+            size -= entry.stat().st_size
+            self._remove(entry.path)
+        self._size = size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # Already evicted by another process
+            pass
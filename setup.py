@@ -27,7 +27,8 @@ setuptools.setup(
      include_package_data=True,
      package_data={'': ['*.ini']},  # If any package contains *.ini files, include them
      scripts=[],
-     entry_points={'console_scripts': ['dosaku_gui=apps.dosaku_assistant:main']},
+     entry_points={'console_scripts': ['dosaku_gui=apps.dosaku_assistant:main',
+                                         'dosaku_snapshot=dosaku.core.model_snapshot:main']},
      classifiers=[
          "Programming Language :: Python :: 3",
          "Operating System :: OS Independent",
@@ -0,0 +1,160 @@
+"""Unit test methods for dosaku.apis.stability.clipdrop.Clipdrop class."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from dosaku.apis import Clipdrop
+from dosaku.utils import bytes_to_pil, pil_to_bytes, tile_boxes
+
+
+def gradient(width: int, height: int) -> Image.Image:
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    return Image.fromarray(np.uint8(np.stack([x, y, 255 - x], axis=2)))
+
+
+class FakeUpscaleClipdrop(Clipdrop):
+    """Clipdrop with _post replaced by a local upscale, recording each request."""
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self._requests_lock = threading.Lock()
+
+    def _post(self, endpoint, files, data=None):
+        tile = bytes_to_pil(files['image_file'][1])
+        with self._requests_lock:
+            self.requests.append((endpoint, tile.size, (data['target_width'], data['target_height'])))
+        upscaled = tile.resize((data['target_width'], data['target_height']), resample=Image.BILINEAR)
+        return SimpleNamespace(ok=True, content=pil_to_bytes(upscaled))
+
+
+def test_tiled():
+    clipdrop = Clipdrop()
+    image = gradient(300, 200)
+    tiles = []
+
+    def process(tile, tile_mask, size):
+        tiles.append(tile.size)
+        return tile
+
+    stitched = clipdrop._tiled(process, image, tile_size=128)
+    assert len(tiles) == len(tile_boxes(image.size, 128, min(clipdrop.tile_overlap, 128 // 4)))
+    assert stitched.size == image.size
+    assert np.abs(np.asarray(stitched, dtype=int) - np.asarray(image, dtype=int)).max() <= 1  # Tiles in place
+
+
+def test_tiled_upscale():
+    clipdrop = FakeUpscaleClipdrop()
+    clipdrop.max_image_sizes = dict(clipdrop.max_image_sizes, upscale=256)
+    image = gradient(120, 80)
+
+    upscaled = clipdrop.upscale(image, width=480, height=320)  # Over the limit, so upscaled in 64 pixel tiles
+    assert upscaled.size == (480, 320)
+    assert len(clipdrop.requests) == len(tile_boxes(image.size, 64, 16))
+    assert all(target[0] <= 256 and target[1] <= 256 for _, _, target in clipdrop.requests)
+    expected = image.resize((480, 320), resample=Image.BILINEAR)
+    assert np.abs(np.asarray(upscaled, dtype=int) - np.asarray(expected, dtype=int)).mean() < 2
+
+    # Upscale factors above tile_size / tile_overlap shrink the tile overlap rather than failing
+    clipdrop.requests = []
+    upscaled = clipdrop.upscale(gradient(12, 8), width=480, height=320)
+    assert upscaled.size == (480, 320)
+    assert len(clipdrop.requests) > 1
+
+    with pytest.raises(ValueError):
+        clipdrop.upscale(gradient(2, 2), width=1024, height=1024)
+
+
+class ClipdropHandler(BaseHTTPRequestHandler):
+    """Serves each path's queued status codes in turn, then 200 with a small PNG; '/slow' responds after a delay."""
+    protocol_version = 'HTTP/1.1'
+    statuses = dict()
+    hits = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.hits.append(self.path)
+        queued = self.statuses.get(self.path, [])
+        status = queued.pop(0) if len(queued) > 0 else 200
+        if self.path == '/slow':
+            time.sleep(1)
+        body = pil_to_bytes(Image.new('RGB', (4, 4))) if status == 200 else b''
+        try:
+            self.send_response(status)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):  # The client timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def clipdrop_server():
+    ClipdropHandler.statuses, ClipdropHandler.hits = dict(), []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ClipdropHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def local_config(url: str) -> dict:
+    endpoints = {'TEXT_TO_IMAGE': '/flaky', 'REMOVE_BACKGROUND': '/down', 'UPSCALE': '/slow'}
+    return {'CLIPDROP': {f'{endpoint}_URL': url + path for endpoint, path in endpoints.items()},
+            'API_KEYS': {'CLIPDROP': 'key'}}
+
+
+def test_retries(clipdrop_server):
+    clipdrop = Clipdrop(session=Clipdrop.create_session())
+    clipdrop.config = local_config(clipdrop_server)
+
+    ClipdropHandler.statuses = {'/flaky': [503, 429], '/down': [503] * (Clipdrop.max_retries + 1)}
+    assert clipdrop.text_to_image('prompt').size == (4, 4)  # Rate limited and unavailable responses are retried
+    assert ClipdropHandler.hits.count('/flaky') == 3
+
+    with pytest.raises(requests.HTTPError):
+        clipdrop.remove_background(Image.new('RGB', (8, 8)))
+    assert ClipdropHandler.hits.count('/down') == Clipdrop.max_retries + 1
+
+    clipdrop.timeouts = {'upscale': (1, 0.2)}
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        clipdrop.upscale(Image.new('RGB', (8, 8)), width=16, height=16)
+    assert ClipdropHandler.hits.count('/slow') == 1  # May already have been processed, so never retried
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter answering every request with a small PNG, recording the timeout it was sent with."""
+    def __init__(self):
+        super().__init__()
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.timeouts.append(kwargs['timeout'])
+        response = requests.Response()
+        response.status_code = 200
+        response._content = pil_to_bytes(Image.new('RGB', (4, 4)))
+        response.request = request
+        return response
+
+
+def test_timeouts():
+    adapter = RecordingAdapter()
+    session = requests.Session()
+    session.mount('http://', adapter)
+    clipdrop = Clipdrop(session=session)
+    clipdrop.config = local_config('http://clipdrop')
+
+    clipdrop.text_to_image('prompt')
+    clipdrop.remove_background(Image.new('RGB', (8, 8)))
+    assert adapter.timeouts == [Clipdrop.timeouts['text_to_image'], Clipdrop.timeout]
+    assert Clipdrop().session is Clipdrop.default_session()  # Shared unless a session is passed in
@@ -0,0 +1,143 @@
+"""Unit test methods for dosaku.core.model_registry.ModelRegistry class."""
+from functools import partial
+import gc
+import json
+import os
+import shutil
+
+import pytest
+import torch
+
+from dosaku import ModelKey, ModelRegistry, OptionNotSupported
+from dosaku.core import model_registry as model_registry_module
+from dosaku.core.model_snapshot import has_snapshot, manifest_filename, save_snapshot, snapshot_path
+from tests.dosaku.core.test_model_snapshot import tiny_bert
+
+
+def linear_loader(key: ModelKey) -> torch.nn.Module:
+    return torch.nn.Linear(256, 256)  # 256 * 256 * 4 + 256 * 4 = 263168 bytes
+
+
+model_size = 263168
+
+
+def test_shared_handles():
+    registry = ModelRegistry(memory_budget=0)
+    handle_1 = registry.acquire('task', 'model', loader=linear_loader)
+    handle_2 = registry.acquire('task', 'model', loader=linear_loader)
+    assert handle_1.model is handle_2.model
+    assert len(registry) == 1
+    assert registry.ref_count(handle_1.key) == 2
+    assert registry.memory_usage == model_size
+
+    handle_3 = registry.acquire('task', 'model', quantization='int8', loader=linear_loader)
+    assert handle_3.model is not handle_1.model
+    assert len(registry) == 2
+
+    with pytest.raises(OptionNotSupported):
+        registry.acquire('task', 'model', quantization='int4', loader=linear_loader)
+
+
+def test_handle_forwarding():
+    registry = ModelRegistry(memory_budget=0)
+    handle = registry.acquire('task', 'model', loader=linear_loader)
+    output = handle(torch.zeros(1, 256))
+    assert output.shape == (1, 256)
+    assert handle.in_features == 256
+
+
+def test_release():
+    registry = ModelRegistry(memory_budget=0)
+    handle = registry.acquire('task', 'model', loader=linear_loader)
+    key = handle.key
+    handle.release()
+    assert handle.released
+    assert registry.ref_count(key) == 0
+    assert key in registry  # Idle models are kept until evicted
+
+    handle.release()  # Releasing twice is a no-op
+    assert registry.ref_count(key) == 0
+
+    handle = registry.acquire('task', 'model', loader=linear_loader)
+    del handle
+    gc.collect()
+    assert registry.ref_count(key) == 0
+
+    registry.evict(memory_budget=0)
+    assert key not in registry
+
+
+def test_eviction():
+    registry = ModelRegistry(memory_budget=2 * model_size)
+    handle_1 = registry.acquire('task', 'model_1', loader=linear_loader)
+    handle_2 = registry.acquire('task', 'model_2', loader=linear_loader)
+    key_1, key_2 = handle_1.key, handle_2.key
+    handle_1.release()
+    handle_2.release()
+    assert len(registry) == 2
+
+    handle_3 = registry.acquire('task', 'model_3', loader=linear_loader)  # Evicts the least recently used idle model
+    assert key_1 not in registry
+    assert key_2 in registry
+    assert registry.memory_usage == 2 * model_size
+
+    # Models in use are never evicted, even when over budget
+    handle_4 = registry.acquire('task', 'model_4', loader=linear_loader)
+    assert key_2 not in registry
+    assert handle_3.key in registry and handle_4.key in registry
+    assert registry.memory_usage == 2 * model_size
+
+
+def test_pipeline_kwargs_key():
+    registry = ModelRegistry(memory_budget=0)
+    handle_1 = registry.acquire('task', 'model', loader=linear_loader, model_kwargs={'revision': 'a'})
+    handle_2 = registry.acquire('task', 'model', loader=linear_loader, model_kwargs={'revision': 'a'})
+    handle_3 = registry.acquire('task', 'model', loader=linear_loader, model_kwargs={'revision': 'b'})
+    assert handle_1.model is handle_2.model
+    assert handle_3.model is not handle_1.model
+    assert len(registry) == 2
+
+    with pytest.raises(ValueError):
+        registry.acquire('task', 'model', loader=linear_loader, weights=torch.zeros(2).numpy())
+
+
+def test_warm_up():
+    registry = ModelRegistry(memory_budget=0)
+    warmed_up = []
+    handle_1 = registry.acquire('task', 'model', loader=linear_loader)
+    handle_2 = registry.acquire('task', 'model', loader=linear_loader)
+    assert handle_1.warm_up(warmed_up.append)
+    assert not handle_2.warm_up(warmed_up.append)  # Already warmed up through the first handle
+    assert warmed_up == [handle_1.model]
+
+    handle_1.release()
+    handle_2.release()
+    registry.evict(memory_budget=0)
+    handle_3 = registry.acquire('task', 'model', loader=linear_loader)
+    assert handle_3.warm_up(warmed_up.append)  # Reloaded models are warmed up again
+    assert len(warmed_up) == 2
+
+
+def test_load_snapshot(tmp_path, monkeypatch):
+    models_dir = str(tmp_path / 'models')
+    monkeypatch.setattr(model_registry_module, 'has_snapshot', partial(has_snapshot, models_dir=models_dir))
+    monkeypatch.setattr(model_registry_module, 'snapshot_path', partial(snapshot_path, models_dir=models_dir))
+    hub_model = tiny_bert(str(tmp_path / 'hub'))  # Stands in for the model in the hub cache
+    key = ModelKey('feature-extraction', hub_model, device='cpu')
+
+    assert ModelRegistry._load(key).model.name_or_path == hub_model  # No snapshot
+
+    path = save_snapshot('feature-extraction', hub_model, models_dir=models_dir)
+    shutil.move(hub_model, str(tmp_path / 'moved'))  # Loading from the hub would now fail
+    model = ModelRegistry._load(key)
+    assert model.model.name_or_path == path
+    assert len(model('hello world')[0]) > 0
+    shutil.move(str(tmp_path / 'moved'), hub_model)
+
+    with open(os.path.join(path, manifest_filename), 'w') as manifest:  # Stale: left behind by another model
+        json.dump({'task': 'feature-extraction', 'model': 'other/model'}, manifest)
+    assert ModelRegistry._load(key).model.name_or_path == hub_model
+
+    save_snapshot('feature-extraction', hub_model, models_dir=models_dir, overwrite=True)
+    os.remove(os.path.join(path, 'model.safetensors'))  # Stale: weights removed from under the snapshot
+    assert ModelRegistry._load(key).model.name_or_path == hub_model
@@ -0,0 +1,44 @@
+"""Unit test methods for dosaku.core.model_snapshot module."""
+import os
+
+from transformers import BertConfig, BertModel, BertTokenizer, pipeline
+
+from dosaku import Config
+from dosaku.core.model_snapshot import configured_snapshots, has_snapshot, save_snapshot, snapshot_path
+
+
+def tiny_bert(model_dir: str) -> str:
+    """Save a tiny, randomly initialized BERT model to disk so that no download is required."""
+    vocab_file = os.path.join(model_dir, 'vocab.txt')
+    os.makedirs(model_dir, exist_ok=True)
+    with open(vocab_file, 'w') as vocab:
+        vocab.write('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'hello', 'world']))
+    config = BertConfig(vocab_size=7, hidden_size=8, num_hidden_layers=1, num_attention_heads=2, intermediate_size=8)
+    BertModel(config).save_pretrained(model_dir)
+    BertTokenizer(vocab_file).save_pretrained(model_dir)
+    return model_dir
+
+
+def test_snapshot_path():
+    assert snapshot_path('facebook/bart-large-cnn', models_dir='/models') == '/models/facebook--bart-large-cnn'
+    assert snapshot_path('facebook/bart-large-cnn').startswith(Config()['DIR_PATHS']['MODELS'])
+
+
+def test_configured_snapshots():
+    snapshots = configured_snapshots()
+    assert ('summarization', 'facebook/bart-large-cnn') in snapshots
+    assert all(len(snapshot) == 2 for snapshot in snapshots)
+
+
+def test_save_snapshot(tmp_path):
+    model = tiny_bert(str(tmp_path / 'source'))
+    models_dir = str(tmp_path / 'models')
+    assert not has_snapshot(model, models_dir=models_dir)
+
+    path = save_snapshot('feature-extraction', model, models_dir=models_dir)
+    assert has_snapshot(model, models_dir=models_dir)
+    assert os.path.exists(os.path.join(path, 'model.safetensors'))
+    assert save_snapshot('feature-extraction', model, models_dir=models_dir) == path  # Existing snapshots are reused
+
+    pipe = pipeline('feature-extraction', model=path, model_kwargs={'low_cpu_mem_usage': True, 'use_safetensors': True})
+    assert len(pipe('hello world')[0]) > 0
@@ -0,0 +1,139 @@
+"""Unit test methods for dosaku.modules.openai.interview_diarization.OpenAIInterviewDiarization class."""
+import threading
+import time
+from types import SimpleNamespace
+
+from pydub import AudioSegment
+import pytest
+
+from dosaku.modules import OpenAIInterviewDiarization
+import dosaku.modules.openai.interview_diarization as interview_diarization
+
+
+class FakeGPT:
+    """Stands in for GPT, returning the text after the interview header in upper case."""
+    def __init__(self, instructions: str = ''):
+        self.instructions = instructions
+
+    def message(self, text: str) -> SimpleNamespace:
+        return SimpleNamespace(message=text.split('\n\n', 1)[1].upper())
+
+
+def make_transcriber(tmp_path, monkeypatch, create, num_chunks: int):
+    """Return a transcriber streaming num_chunks silent chunks, and the list of chunk indices it has decoded."""
+    monkeypatch.setattr(interview_diarization, 'GPT', FakeGPT)
+    transcriber = OpenAIInterviewDiarization(use_cache=False)
+    transcriber.config = {'DIR_PATHS': {'TEMP': str(tmp_path)}}
+    transcriber.client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(transcriber, 'encode_chunk', lambda chunk: b'audio')
+
+    decoded = []
+
+    def stream_chunks(audio_file, chunk_length, tolerance=0):
+        for idx in range(num_chunks):
+            decoded.append(idx)
+            yield AudioSegment.silent(duration=100)
+
+    monkeypatch.setattr(transcriber, 'stream_chunks', stream_chunks)
+    return transcriber, decoded
+
+
+def chunk_index(file) -> int:
+    return int(file[0].split('.')[0].split('_')[1])  # Uploaded as (audio_{idx}.mp3, bytes)
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    filename = tmp_path / 'interview.mp3'
+    filename.write_bytes(b'interview')
+    return str(filename)
+
+
+def test_ordering(tmp_path, monkeypatch, audio_file):
+    num_chunks = 6
+
+    def create(model, file, prompt):
+        idx = chunk_index(file)
+        time.sleep(0.02 * (num_chunks - idx))  # Later chunks finish transcribing first
+        return SimpleNamespace(text=f'chunk {idx}')
+
+    transcriber, _ = make_transcriber(tmp_path, monkeypatch, create, num_chunks)
+    sections = list(transcriber.transcribe_interview_stream(audio_file, max_workers=3))
+    assert sections == [f'CHUNK {idx}' for idx in range(num_chunks)]
+
+    text = transcriber.transcribe_interview(audio_file, max_workers=3, chunk_separater='|')
+    assert text == '|'.join(sections)
+
+
+def test_backpressure(tmp_path, monkeypatch, audio_file):
+    release = threading.Event()
+
+    def create(model, file, prompt):
+        release.wait(timeout=10)
+        return SimpleNamespace(text=f'chunk {chunk_index(file)}')
+
+    transcriber, decoded = make_transcriber(tmp_path, monkeypatch, create, num_chunks=10)
+    sections = []
+    consumer = threading.Thread(
+        target=lambda: sections.extend(transcriber.transcribe_interview_stream(audio_file, max_workers=1)))
+    consumer.start()
+    time.sleep(0.3)
+    assert len(decoded) == 3  # Two chunks in flight, and the next one waiting for a free slot
+
+    release.set()
+    consumer.join(timeout=10)
+    assert not consumer.is_alive()
+    assert sections == [f'CHUNK {idx}' for idx in range(10)]
+
+
+def test_error_propagation(tmp_path, monkeypatch, audio_file):
+    def create(model, file, prompt):
+        idx = chunk_index(file)
+        if idx == 1:
+            raise RuntimeError('Transcription failed')
+        return SimpleNamespace(text=f'chunk {idx}')
+
+    transcriber, _ = make_transcriber(tmp_path, monkeypatch, create, num_chunks=4)
+    sections = []
+    with pytest.raises(RuntimeError, match='Transcription failed'):
+        for section in transcriber.transcribe_interview_stream(audio_file, max_workers=1):
+            sections.append(section)
+    assert sections == ['CHUNK 0']  # Chunks before the failed one are still delivered
+
+
+def test_cancellation(tmp_path, monkeypatch, audio_file):
+    num_chunks = 20
+    calls = []
+
+    def create(model, file, prompt):
+        calls.append(chunk_index(file))
+        time.sleep(0.05)
+        return SimpleNamespace(text=f'chunk {calls[-1]}')
+
+    transcriber, _ = make_transcriber(tmp_path, monkeypatch, create, num_chunks)
+    stream = transcriber.transcribe_interview_stream(audio_file, max_workers=1)
+    assert next(stream) == 'CHUNK 0'
+    stream.close()  # The caller stops early
+    num_calls = len(calls)
+    time.sleep(0.3)
+    assert len(calls) <= num_calls + 1  # At most the transcription already running when cancelled completes
+    assert len(calls) < num_chunks
+
+
+def test_concurrent_jobs(tmp_path, monkeypatch, audio_file):
+    def create(model, file, prompt):
+        return SimpleNamespace(text=f'chunk {chunk_index(file)}')
+
+    transcriber, _ = make_transcriber(tmp_path, monkeypatch, create, num_chunks=3)
+    jobs_dir = tmp_path / 'interviews'
+    first = transcriber.transcribe_interview_stream(audio_file, max_workers=1)
+    assert next(first) == 'CHUNK 0'
+
+    # The same file may be transcribed again while the first job runs, but not restarted from under it
+    assert transcriber.transcribe_interview(audio_file, max_workers=1, chunk_separater='|') == 'CHUNK 0|CHUNK 1|CHUNK 2'
+    with pytest.raises(RuntimeError):
+        transcriber.transcribe_interview(audio_file, restart=True)
+    assert any(path.is_dir() for path in jobs_dir.iterdir())  # Still in use by the first job
+
+    assert list(first) == ['CHUNK 1', 'CHUNK 2']
+    assert not any(path.is_dir() for path in jobs_dir.iterdir())  # Removed once the last job finished
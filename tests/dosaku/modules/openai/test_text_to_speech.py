@@ -0,0 +1,91 @@
+"""Unit test methods for dosaku.modules.openai.text_to_speech.OpenAITextToSpeech class."""
+from contextlib import contextmanager
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from dosaku.modules import OpenAITextToSpeech
+from dosaku.utils import codec_pool
+
+
+speech_bytes = bytes(range(256)) * 40
+
+
+class StreamingSpeech:
+    """Stands in for the speech API of openai clients with a streaming response interface."""
+    def __init__(self):
+        self.requests = []
+        self.with_streaming_response = SimpleNamespace(create=self.create)
+
+    @contextmanager
+    def create(self, **request):
+        self.requests.append(request)
+        yield SimpleNamespace(iter_bytes=lambda chunk_size: (
+            speech_bytes[start:start + chunk_size] for start in range(0, len(speech_bytes), chunk_size)))
+
+
+class Speech:
+    """Stands in for the speech API of older openai clients, which return the whole response."""
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **request):
+        self.requests.append(request)
+        return SimpleNamespace(content=speech_bytes)
+
+
+def test_text_to_speech_stream():
+    tts = OpenAITextToSpeech()
+    for speech in (StreamingSpeech(), Speech()):
+        tts.client = SimpleNamespace(audio=SimpleNamespace(speech=speech))
+        chunks = list(tts.text_to_speech_stream('Hello there.', chunk_size=1000, response_format='flac'))
+        assert b''.join(chunks) == speech_bytes
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+        assert speech.requests == [
+            {'model': 'tts-1', 'voice': 'alloy', 'input': 'Hello there.', 'response_format': 'flac'}]
+
+
+class SlowSpeech:
+    """Stands in for the speech API, synthesizing each sentence "Sentence <n>." as flac audio of constant value n."""
+    def __init__(self, fail: int = None):
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def create(self, input, response_format, **request):
+        number = int(re.search(r'\d+', input).group())
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01 * (number % 3))  # Segments finish out of order
+            if number == self.fail:
+                raise RuntimeError('Synthesis failed')
+            samples = np.full(100, number, dtype=np.int16)
+            return SimpleNamespace(content=codec_pool.encode(samples, sample_rate=8000, format=response_format))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_text_to_speech_segments():
+    tts = OpenAITextToSpeech()
+    text = ' '.join(f'Sentence {idx}.' for idx in range(12))
+    speech = SlowSpeech()
+    tts.client = SimpleNamespace(audio=SimpleNamespace(speech=speech))
+    segments = list(tts.text_to_speech_segments(text, segment_length=12, first_segment_length=12, max_workers=3))
+    assert [int(audio.data[0]) for audio in segments] == list(range(12))
+    assert 1 < speech.max_in_flight <= 3
+
+    speech = SlowSpeech(fail=5)
+    tts.client = SimpleNamespace(audio=SimpleNamespace(speech=speech))
+    segments = []
+    with pytest.raises(RuntimeError, match='Synthesis failed'):
+        for audio in tts.text_to_speech_segments(text, segment_length=12, first_segment_length=12, max_workers=3):
+            segments.append(int(audio.data[0]))
+    assert segments == list(range(5))  # Segments before the failed one are still delivered
@@ -0,0 +1,43 @@
+"""Unit test methods for dosaku.modules.openai.whisper.Whisper class."""
+from types import SimpleNamespace
+
+import numpy as np
+
+from dosaku.modules.openai import whisper as whisper_module
+from dosaku.types import Audio
+from dosaku.utils import TranscriptionCache
+
+
+class FakeModel:
+    """Stands in for the speech recognition pipeline, transcribing each segment as its first (normalized) sample."""
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, inputs):
+        self.inputs.append(inputs['raw'])
+        return {'text': f' {inputs["raw"][0]:.2f}'}
+
+
+def test_segment_cache(monkeypatch, tmp_path):
+    model = FakeModel()
+    monkeypatch.setattr(whisper_module, 'model_registry', SimpleNamespace(acquire=lambda *args, **kwargs: model))
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size=2 ** 20)
+    whisper = whisper_module.Whisper(use_cache=True, cache=cache)
+
+    sample_rate = whisper.sample_rate
+    segment = np.full(20 * sample_rate, 1000, dtype=np.int16)
+    silence = np.zeros(sample_rate, dtype=np.int16)
+    data = np.concatenate([segment, silence, segment // 2, silence, segment // 4])  # 64 seconds, 3 segments
+    data[0] = 2000  # The peak, by which the whole input is normalized
+
+    text = whisper.transcribe(Audio(sample_rate=sample_rate, data=data))
+    assert text == '1.00 0.25 0.12'  # Later segments keep the gain of the whole input
+    assert len(model.inputs) == 3
+    assert all(len(raw) <= whisper.segment_length * sample_rate for raw in model.inputs)
+
+    assert whisper.transcribe(Audio(sample_rate=sample_rate, data=data)) == text
+    assert len(model.inputs) == 3  # Every segment was cached
+
+    data[-1] = 0  # Only the last segment changed
+    assert whisper.transcribe(Audio(sample_rate=sample_rate, data=data)) == text
+    assert len(model.inputs) == 4
@@ -0,0 +1,21 @@
+"""Unit test methods for dosaku.modules.stability.clipdrop.text_to_image.ClipdropTextToImage class."""
+import requests
+
+from dosaku.apis import Clipdrop
+from dosaku.modules import ClipdropTextToImage
+from tests.dosaku.apis.stability.test_clipdrop import local_config, RecordingAdapter
+
+
+def test_session():
+    assert ClipdropTextToImage().clipdrop.session is Clipdrop.default_session()
+
+    adapter = RecordingAdapter()
+    session = requests.Session()
+    session.mount('http://', adapter)
+    text_to_image = ClipdropTextToImage(session=session)
+    text_to_image.clipdrop.config = local_config('http://clipdrop')
+    assert text_to_image.clipdrop.session is session
+
+    image = text_to_image('An astronaut riding a horse.')
+    assert image.size == (4, 4)
+    assert adapter.timeouts == [Clipdrop.timeouts['text_to_image']]
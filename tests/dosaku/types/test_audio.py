@@ -0,0 +1,141 @@
+"""Unit test methods for dosaku.types.Audio class."""
+from io import BytesIO
+import wave
+
+import numpy as np
+import pytest
+
+from dosaku.types import Audio
+
+
+def test_stream(tmp_path):
+    sample_rate = 8000
+    samples = (np.arange(5 * sample_rate) % 1000).astype(np.int16)
+    filename = str(tmp_path / 'audio.wav')
+    with wave.open(filename, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+    blocks = list(Audio.stream(filename, block_duration=2, sample_rate=sample_rate, channels=1))
+    assert [len(block.data) for block in blocks] == [2 * sample_rate, 2 * sample_rate, sample_rate]
+    assert np.array_equal(np.concatenate([block.data for block in blocks]), samples)
+
+    blocks = list(Audio.stream(filename, block_duration=10, start=1, end=3, sample_rate=sample_rate, channels=1))
+    assert len(blocks) == 1
+    assert np.array_equal(blocks[0].data, samples[sample_rate:3 * sample_rate])
+
+
+def test_lazy_source():
+    audio = Audio(encoded=b'mp3 bytes', format='mp3')
+    assert audio.to_bytes() == b'mp3 bytes'  # Passed through; never decoded
+    assert not audio.decoded
+
+    audio = Audio.from_ascii(audio.to_ascii())
+    assert audio.encoded == b'mp3 bytes'
+    assert not audio.decoded
+
+
+def test_memmap(tmp_path):
+    sample_rate = 8000
+    samples = (np.arange(2 * sample_rate * 2) % 1000).astype(np.int16).reshape(-1, 2)
+    filename = str(tmp_path / 'audio.wav')
+    with wave.open(filename, 'wb') as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+    audio = Audio.memmap(filename)
+    assert isinstance(audio.data, np.memmap)
+    assert audio.sample_rate == sample_rate
+    assert np.array_equal(audio.data, samples)
+
+    filename = str(tmp_path / 'audio.pcm')
+    samples[:, 0].tofile(filename)
+    audio = Audio.memmap(filename, sample_rate=sample_rate)
+    assert np.array_equal(audio.data, samples[:, 0])
+
+
+def test_cached_encodings(tmp_path):
+    audio = Audio(sample_rate=8000, data=np.zeros(800, dtype=np.int16))
+    encoded = audio.to_bytes(format='wav')
+    assert audio.to_bytes(format='wav') is encoded
+
+    audio.data = np.ones(800, dtype=np.int16)
+    assert audio.to_bytes(format='wav') != encoded
+
+    audio = Audio(encoded=b'mp3 bytes', format='mp3')
+    filename = tmp_path / 'audio.mp3'
+    audio.write(str(filename))
+    assert filename.read_bytes() == b'mp3 bytes'
+
+
+def test_native_decoding():
+    sample_rate = 8000
+    samples = (np.arange(sample_rate * 2) % 1000).astype(np.int16).reshape(-1, 2)
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+    audio = Audio.from_bytes(buffer.getvalue())
+    assert audio.format == 'wav'
+    assert audio.sample_rate == sample_rate
+    assert np.array_equal(audio.data, samples)
+
+    audio = Audio.from_pcm(samples.tobytes(), sample_rate=sample_rate, channels=2)
+    assert np.array_equal(audio.data, samples)
+
+
+def test_dsp():
+    sample_rate = 8000
+    t = np.arange(sample_rate) / sample_rate
+    tone = (np.sin(2 * np.pi * 440 * t) * 2 ** 14).astype(np.int16)
+    audio = Audio(sample_rate=sample_rate, data=np.stack([tone, tone // 2], axis=1))
+
+    mono = audio.to_mono()
+    assert mono.data.shape == (sample_rate,) and mono.data.dtype == np.int16
+    assert np.allclose(mono.data, (tone.astype(np.float32) + tone // 2) / 2, atol=1)
+
+    resampled = mono.resample(16000)
+    assert resampled.sample_rate == 16000 and len(resampled.data) == 2 * sample_rate
+    expected = np.sin(2 * np.pi * 440 * np.arange(16000) / 16000) * np.max(np.abs(mono.data))
+    assert np.max(np.abs(resampled.data[1000:-1000] - expected[1000:-1000])) < 2 ** 14 * 0.01
+
+    part = mono.slice(0.25, 0.5)
+    assert len(part.data) == sample_rate // 4
+    assert np.shares_memory(part.data, mono.data)
+
+    assert len(Audio.concatenate([part, part]).data) == sample_rate // 2
+    assert np.max(np.abs(mono.normalize(headroom=0).data)) == 2 ** 15 - 1
+    assert np.allclose(mono.gain(-6.0206).data, mono.data / 2, atol=1)
+    mixed = Audio.mix([mono, mono.slice(0, 0.5)], gains=[0, 0])
+    assert len(mixed.data) == sample_rate
+    assert np.allclose(mixed.data[:sample_rate // 2], np.clip(2 * mono.data[:sample_rate // 2].astype(int),
+                                                              -2 ** 15, 2 ** 15 - 1), atol=1)
+
+
+def test_stream_probe(tmp_path, monkeypatch):
+    sample_rate = 8000
+    samples = np.zeros((sample_rate, 2), dtype=np.int16)
+    filename = str(tmp_path / 'audio.wav')
+    with wave.open(filename, 'wb') as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+    monkeypatch.setattr('shutil.which', lambda name: None)  # WAV files are probed without ffprobe
+    blocks = list(Audio.stream(filename, block_duration=1))
+    assert blocks[0].sample_rate == sample_rate
+    assert blocks[0].data.shape == (sample_rate, 2)
+
+    mp3_filename = str(tmp_path / 'audio.mp3')
+    with open(mp3_filename, 'wb') as mp3_file:
+        mp3_file.write(b'ID3' + bytes(100))
+    with pytest.raises(ValueError, match='ffprobe'):
+        next(Audio.stream(mp3_filename))
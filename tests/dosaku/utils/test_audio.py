@@ -0,0 +1,50 @@
+"""Unit test methods for dosaku.utils.audio methods."""
+import numpy as np
+
+from dosaku.utils import rms_envelope, silence_boundaries, sniff_format, split_stream
+
+
+def test_rms_envelope():
+    samples = np.concatenate([np.ones(100), np.zeros(100), 2 * np.ones(50)])
+    envelope = rms_envelope(samples, frame_length=100)
+    assert envelope.shape == (3,)
+    assert np.allclose(envelope, [1, 0, np.sqrt(2)])
+
+    stereo = np.stack([samples, samples], axis=1)
+    assert np.allclose(rms_envelope(stereo, frame_length=100), envelope)
+
+
+def test_silence_boundaries():
+    sample_rate = 100
+    samples = np.ones(10 * sample_rate)
+    samples[850:900] = 0  # Silence within 2s before the first fixed 9s offset
+    samples = np.concatenate([samples, np.ones(5 * sample_rate)])
+
+    fixed = silence_boundaries(samples, sample_rate, chunk_length=9, tolerance=0, frame_duration=0.5)
+    assert fixed[0] == (0, 900)
+
+    spans = silence_boundaries(samples, sample_rate, chunk_length=9, tolerance=2, frame_duration=0.5)
+    assert spans[0] == (0, 850)
+    assert spans[-1][1] == len(samples)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    assert all(end - start <= 9 * sample_rate for start, end in spans)
+
+
+def test_split_stream():
+    sample_rate = 100
+    rng = np.random.default_rng(0)
+    samples = rng.standard_normal(60 * sample_rate) * np.repeat(rng.uniform(0, 1, 120), 50)
+
+    spans = silence_boundaries(samples, sample_rate, chunk_length=9, tolerance=3, frame_duration=0.5)
+    blocks = (samples[idx:idx + 70] for idx in range(0, len(samples), 70))
+    chunks = list(split_stream(blocks, sample_rate, chunk_length=9, tolerance=3, frame_duration=0.5))
+    assert len(chunks) == len(spans)
+    assert all(np.array_equal(chunk, samples[start:end]) for chunk, (start, end) in zip(chunks, spans))
+
+
+def test_sniff_format():
+    assert sniff_format(b'RIFF\x00\x00\x00\x00WAVEfmt ') == 'wav'
+    assert sniff_format(b'ID3\x04\x00\x00\x00\x00\x00\x00\x00\x00') == 'mp3'
+    assert sniff_format(b'\xff\xfb\x90\x00') == 'mp3'
+    assert sniff_format(b'OggS\x00\x02') == 'ogg'
+    assert sniff_format(b'not audio') is None
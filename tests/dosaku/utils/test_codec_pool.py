@@ -0,0 +1,94 @@
+"""Unit test methods for dosaku.utils.codec_pool."""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from dosaku.utils import CodecPool
+
+
+def test_codec_pool_round_trip():
+    pool = CodecPool(max_workers=2, max_pending=1)
+    samples = np.int16(10000 * np.sin(np.linspace(0, 100, 8000)))
+    stereo = np.stack([samples, -samples], axis=1)
+
+    encoded = pool.encode(samples, sample_rate=8000, format='wav')
+    assert encoded[:4] == b'RIFF'
+    sample_rate, decoded = pool.decode(encoded)
+    assert sample_rate == 8000
+    assert np.array_equal(decoded, samples)
+
+    sample_rate, decoded = pool.decode(pool.encode(stereo, sample_rate=8000, format='wav'), format='wav')
+    assert sample_rate == 8000
+    assert np.array_equal(decoded, stereo)
+
+    sample_rate, decoded = pool.decode(encoded, sample_rate=4000, channels=2)
+    assert sample_rate == 4000
+    assert decoded.shape[1] == 2
+    pool.shutdown()
+
+
+def test_codec_pool_async():
+    pool = CodecPool(max_workers=2, max_pending=0)
+    samples = np.int16(np.arange(-4000, 4000))
+
+    async def convert():
+        encoded = await asyncio.gather(*[pool.encode_async(samples, sample_rate=8000, format='wav') for _ in range(5)])
+        return await pool.decode_async(encoded[-1])
+
+    sample_rate, decoded = asyncio.run(convert())
+    assert sample_rate == 8000
+    assert np.array_equal(decoded, samples)
+    pool.shutdown()
+
+
+def test_codec_pool_in_process(monkeypatch):
+    pool = CodecPool(max_workers=1, max_pending=0)
+    samples = np.int16(10000 * np.sin(np.linspace(0, 100, 8000)))
+    stereo = np.stack([samples, -samples], axis=1)
+    mp3 = pool.encode(stereo, sample_rate=8000, format='mp3')  # MP3 is still encoded with ffmpeg
+
+    def no_ffmpeg(command, stdin):
+        raise AssertionError('ffmpeg should not be run')
+
+    monkeypatch.setattr(CodecPool, '_run', staticmethod(no_ffmpeg))
+    for format in ('wav', 'flac', 'aiff'):
+        for data in (samples, stereo):
+            sample_rate, decoded = pool.decode(pool.encode(data, sample_rate=8000, format=format, bitrate='32k'))
+            assert sample_rate == 8000
+            assert np.array_equal(decoded, data)
+
+    sample_rate, decoded = pool.decode(pool.encode(stereo, sample_rate=8000, format='ogg'))
+    assert sample_rate == 8000
+    assert decoded.shape == stereo.shape
+
+    sample_rate, decoded = pool.decode(mp3)
+    assert sample_rate == 8000
+    assert decoded.ndim == 2 and decoded.shape[1] == 2
+
+    sample_rate, decoded = pool.decode(pool.encode(stereo, sample_rate=8000, format='flac'), sample_rate=16000,
+                                       channels=1)
+    assert sample_rate == 16000
+    assert decoded.dtype == np.int16 and decoded.shape == (16000,)
+    assert np.abs(decoded[100:-100].astype(np.int32)).max() <= 1  # The channels cancel out
+    pool.shutdown()
+
+
+def test_codec_pool_async_cancel():
+    pool = CodecPool(max_workers=1, max_pending=0)
+    release = threading.Event()
+    busy = pool.submit(release.wait)  # Holds the only slot
+
+    async def cancel_waiting():
+        waiting = asyncio.ensure_future(pool.submit_async(lambda: 'never run'))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        release.set()
+        return await asyncio.wait_for(pool.submit_async(lambda: 'done'), timeout=5)  # The slot was not leaked
+
+    assert asyncio.run(cancel_waiting()) == 'done'
+    assert busy.result() is True
+    pool.shutdown()
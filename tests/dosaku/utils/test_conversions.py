@@ -3,9 +3,11 @@ from PIL.Image import Image
 import pytest
 
 import numpy as np
+import torch
 
-from dosaku.utils.conversions import (pil_to_ascii, ascii_to_pil, pil_to_bytes, bytes_to_pil, pil_to_tensor,
-                                      tensor_to_pil, pil_to_ndarray, ndarray_to_pil, pil_to_cv2, cv2_to_pil)
+from dosaku.utils.conversions import (IMAGE_ENCODINGS, pil_to_ascii, ascii_to_pil, pil_to_bytes, encode_images,
+                                      bytes_to_pil, pil_to_tensor, tensor_to_pil, pil_to_tensor_batch,
+                                      tensor_to_pil_batch, pil_to_ndarray, ndarray_to_pil, pil_to_cv2, cv2_to_pil)
 from tests import MockAssets, images_are_identical
 
 mocks = MockAssets()
@@ -90,3 +92,47 @@ def test_cv2_conversion(
     cv2_image = pil_to_cv2(image_rgba)
     pil_image = cv2_to_pil(cv2_image)
     assert images_are_identical(image_rgba, pil_image)
+
+
+def test_encoding_options(image: Image = mocks.image):
+    for name in ['archive', 'fast', 'lossless_fast']:
+        assert images_are_identical(image, bytes_to_pil(pil_to_bytes(image, **IMAGE_ENCODINGS[name])))
+    assert bytes_to_pil(pil_to_bytes(image, **IMAGE_ENCODINGS['jpeg'])).format == 'JPEG'
+    assert bytes_to_pil(pil_to_bytes(image.convert('RGBA'), format='jpg')).mode == 'RGB'
+    assert len(pil_to_bytes(image, compress_level=1)) >= len(pil_to_bytes(image, compress_level=9))
+
+    encoded = encode_images([image, image.convert('L')], **IMAGE_ENCODINGS['fast'])
+    assert images_are_identical(image, bytes_to_pil(encoded[0]))
+    assert bytes_to_pil(encoded[1]).mode == 'L'
+
+
+def test_conversion_buffers(image: Image = mocks.image, image_rgba: Image = mocks.image_rgba):
+    out = np.empty((image.height, image.width, 3), dtype=np.uint8)
+    assert pil_to_cv2(image, out=out) is out
+    assert images_are_identical(image, cv2_to_pil(out))
+
+    out = np.empty((image_rgba.height, image_rgba.width, 4), dtype=np.uint8)
+    assert pil_to_ndarray(image_rgba, out=out) is out
+    assert images_are_identical(image_rgba, ndarray_to_pil(out))
+
+    assert pil_to_ndarray(image).flags.writeable  # A copy by default
+    view = pil_to_ndarray(image, copy=False)
+    assert not view.flags.writeable
+    assert images_are_identical(image, ndarray_to_pil(view))
+
+
+def test_batch_tensor_conversion(image: Image = mocks.image, image_rgba: Image = mocks.image_rgba):
+    images = [image, image.transpose(0)]
+    tensor = pil_to_tensor_batch(images)
+    assert tensor.shape == (2, 3, image.height, image.width)
+    pil_images = tensor_to_pil_batch(tensor, normalize=None)
+    assert all(images_are_identical(im, pil_image) for im, pil_image in zip(images, pil_images))
+    assert images_are_identical(image_rgba, tensor_to_pil_batch(pil_to_tensor_batch([image_rgba]), normalize=None)[0])
+
+    noise = torch.randn(3, 3, 32, 48)
+    for pil_image, sample in zip(tensor_to_pil_batch(noise), noise):
+        assert images_are_identical(tensor_to_pil(sample), pil_image)
+    low, high = noise.min(), noise.max()
+    for pil_image, sample in zip(tensor_to_pil_batch(noise.permute(0, 2, 3, 1), channels_first=False,
+                                                     normalize='global'), noise):
+        assert images_are_identical(tensor_to_pil(sample, min_val=low, max_val=high), pil_image)
@@ -0,0 +1,70 @@
+"""Unit test methods for dosaku.utils.image utility module."""
+import PIL.Image
+from PIL.Image import Image
+import numpy as np
+
+from dosaku.utils import (canny, fit, center, erode, binary_mask_to_alpha, insert_image, canny_batch, fit_batch,
+                          center_batch, erode_batch, binary_mask_to_alpha_batch, Placement, composite_images,
+                          tile_boxes, stitch_tiles, ndarray_to_pil, pil_to_ndarray)
+from tests import MockAssets
+
+mocks = MockAssets()
+
+
+def test_batch_matches_single(image: Image = mocks.image, image_mask: Image = mocks.image_mask):
+    images = [image, image.transpose(0)]
+    stack = np.stack([pil_to_ndarray(im, copy=False) for im in images])
+
+    for batch in [canny_batch(images), canny_batch(stack)]:
+        for im, edges in zip(images, batch):
+            assert np.array_equal(edges, np.asarray(canny(im)))
+
+    for batch in [fit_batch(images, height=500, width=300), fit_batch(stack, height=500)]:
+        assert batch[0].shape[2] == 4
+    for im, fitted in zip(images, fit_batch(stack, height=500, width=300)):
+        assert np.array_equal(fitted, np.asarray(fit(im, height=500, width=300)))
+    for im, centered in zip(images, center_batch(images, height=900, width=1200)):
+        assert np.array_equal(centered, np.asarray(center(im, height=900, width=1200)))
+
+    for im, eroded in zip(images, erode_batch(stack, iterations=2)):
+        assert np.array_equal(ndarray_to_pil(eroded).convert('L'), erode(im, iterations=2))
+
+    masks = [image_mask, image_mask.transpose(0)]
+    for alpha, mask in zip(binary_mask_to_alpha_batch(masks, blur_radius=5), masks):
+        expected = np.asarray(binary_mask_to_alpha(mask, blur_radius=5))[..., 0]
+        assert np.abs(alpha.astype(int) - expected).max() <= 1
+    assert np.array_equal(binary_mask_to_alpha_batch(masks)[0], np.asarray(image_mask))
+
+
+def test_composite_images(image: Image = mocks.image, image_mask: Image = mocks.image_mask,
+                          background: Image = mocks.image_background):
+    placements = [Placement(image, image_mask, left=150 * idx - 100, top=40 * idx, width=300) for idx in range(4)]
+    placements += [Placement(image, left=500, top=-50, height=200),
+                   Placement(image.convert('L'), binary_mask_to_alpha(image_mask, blur_radius=31), left=-300, top=200)]
+
+    expected = background
+    for placement in placements:
+        expected = insert_image(expected, placement.source, placement.mask, source_width=placement.width,
+                                source_height=placement.height, left=placement.left, top=placement.top)
+    composite = composite_images(background, placements)
+    assert composite.mode == 'RGB' and composite.size == background.size
+    assert np.abs(np.asarray(composite, dtype=int) - np.asarray(expected, dtype=int)).max() <= 1
+
+    # Generated sources are freed as soon as they are composited, so their ids may be reused by later sources
+    colors = [(16 * idx, 255 - 16 * idx, 0) for idx in range(16)]
+    placements = (Placement(PIL.Image.new('RGB', (20, 20), color), left=25 * idx) for idx, color in enumerate(colors))
+    composite = composite_images(PIL.Image.new('RGB', (400, 20)), placements)
+    assert [composite.getpixel((25 * idx + 10, 10)) for idx in range(len(colors))] == colors
+
+
+def test_tiles(image: Image = mocks.image):
+    boxes = tile_boxes(image.size, tile_size=400, overlap=64)
+    assert all(right - left <= 400 and bottom - top <= 400 for left, top, right, bottom in boxes)
+    assert max(box[2] for box in boxes) == image.width and max(box[3] for box in boxes) == image.height
+    assert tile_boxes(image.size, tile_size=2048, overlap=64) == [(0, 0, image.width, image.height)]
+
+    stitched = stitch_tiles([image.crop(box) for box in boxes], boxes, image.size, feather=64)
+    assert np.array_equal(np.asarray(stitched), np.asarray(image))
+
+    halves = [image.crop(box).resize(((box[2] - box[0]) // 2, (box[3] - box[1]) // 2)) for box in boxes]
+    assert stitch_tiles(halves, boxes, image.size, feather=64).size == image.size
@@ -0,0 +1,103 @@
+"""Unit test methods for dosaku.utils.job_manifest.JobManifest class."""
+import multiprocessing
+
+import pytest
+
+from dosaku.utils import JobManifest
+
+
+def test_job_id(tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text('source')
+    job_id = JobManifest.job_id(str(source), chunk_length=1200)
+    assert job_id == JobManifest.job_id(str(source), chunk_length=1200)
+    assert job_id != JobManifest.job_id(str(source), chunk_length=600)
+
+    source.write_text('new source')
+    assert job_id != JobManifest.job_id(str(source), chunk_length=1200)
+
+
+def test_stages(tmp_path):
+    job = JobManifest('job', jobs_dir=str(tmp_path), params={'chunk_length': 1200})
+    assert not job.is_complete(0, 'transcription')
+
+    job.complete(0, 'audio')
+    job.complete(0, 'transcription', text='raw text')
+    job.complete(0, 'edit', text='edited text', speaker='A')
+    assert job.is_complete(0, 'audio')
+    assert job.read(0, 'transcription') == 'raw text'
+    assert job.is_complete(0, 'edit', speaker='A')
+    assert not job.is_complete(0, 'edit', speaker='B')
+    assert not job.is_complete(1, 'transcription')
+
+
+def test_resume(tmp_path):
+    job = JobManifest('job', jobs_dir=str(tmp_path))
+    job.complete(0, 'transcription', text='raw text')
+
+    resumed_job = JobManifest('job', jobs_dir=str(tmp_path))
+    assert resumed_job.is_complete(0, 'transcription')
+    assert resumed_job.read(0, 'transcription') == 'raw text'
+
+    other_job = JobManifest('other_job', jobs_dir=str(tmp_path))
+    assert not other_job.is_complete(0, 'transcription')
+
+    job.close()
+    resumed_job.close()
+    restarted_job = JobManifest('job', jobs_dir=str(tmp_path), restart=True)
+    assert not restarted_job.is_complete(0, 'transcription')
+
+
+def test_restart_in_use(tmp_path):
+    job = JobManifest('job', jobs_dir=str(tmp_path))
+    job.complete(0, 'transcription', text='raw text')
+    with pytest.raises(RuntimeError):
+        JobManifest('job', jobs_dir=str(tmp_path), restart=True)  # Never removes a job another worker is running
+    assert job.read(0, 'transcription') == 'raw text'
+
+    job.close()
+    with JobManifest('job', jobs_dir=str(tmp_path), restart=True) as restarted_job:
+        assert not restarted_job.is_complete(0, 'transcription')
+
+
+def test_remove(tmp_path):
+    job = JobManifest('job', jobs_dir=str(tmp_path))
+    job.complete(0, 'transcription', text='raw text')
+    other_job = JobManifest('job', jobs_dir=str(tmp_path))
+    assert not job.remove()  # Still open in another worker
+    assert other_job.read(0, 'transcription') == 'raw text'
+
+    assert other_job.remove()
+    assert not (tmp_path / 'job').exists()
+
+
+def test_concurrent_writers(tmp_path):
+    job_1 = JobManifest('job', jobs_dir=str(tmp_path))
+    job_2 = JobManifest('job', jobs_dir=str(tmp_path))
+    job_1.complete(0, 'transcription', text='chunk 0')
+    job_2.complete(1, 'transcription', text='chunk 1')
+
+    job = JobManifest('job', jobs_dir=str(tmp_path))
+    assert job.is_complete(0, 'transcription') and job.is_complete(1, 'transcription')
+
+
+def complete_items(jobs_dir: str, worker: int, num_items: int):
+    with JobManifest('job', jobs_dir=jobs_dir) as job:
+        for idx in range(num_items):
+            job.complete(worker * num_items + idx, 'transcription', text=f'chunk {idx}')
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='Requires the fork start method')
+def test_interleaved_writers(tmp_path):
+    num_workers, num_items = 4, 50
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=complete_items, args=(str(tmp_path), worker, num_items))
+               for worker in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    job = JobManifest('job', jobs_dir=str(tmp_path))
+    assert all(job.is_complete(idx, 'transcription') for idx in range(num_workers * num_items))
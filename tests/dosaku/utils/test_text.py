@@ -0,0 +1,33 @@
+"""Unit test methods for dosaku.utils.text utility module."""
+from dosaku.utils import remove_fillers, split_sentences, clean_transcript, split_text
+
+
+def test_remove_fillers():
+    assert remove_fillers('So, um, I was thinking, uh, about the Roman Empire.') == \
+        'So, I was thinking, about the Roman Empire.'
+    assert remove_fillers('An umbrella and a drummer.') == 'An umbrella and a drummer.'
+
+
+def test_split_sentences():
+    text = 'hello there. How are you? I am fine! "Quoted." It costs 3.5 million.'
+    assert split_sentences(text) == ['hello there.', 'How are you?', 'I am fine!', '"Quoted."', 'It costs 3.5 million.']
+    # Sentences are split whatever the case of the next word, and keep their original case
+    assert split_sentences('it takes about ten seconds. uh yes it is.') == \
+        ['it takes about ten seconds.', 'uh yes it is.']
+    # Nor after common abbreviations
+    assert split_sentences('I met Dr. Smith and mr. Jones, e.g. at work. Then we left.') == \
+        ['I met Dr. Smith and mr. Jones, e.g. at work.', 'Then we left.']
+
+
+def test_clean_transcript():
+    assert clean_transcript(' um so I said hello. Uh, then he left.') == 'so I said hello.\nthen he left.'
+    assert clean_transcript('it takes about ten seconds. uh yes it is.') == 'it takes about ten seconds.\nyes it is.'
+
+
+def test_split_text():
+    text = ' '.join(f'Sentence number {idx} is here.' for idx in range(50)) + '\n\nA new paragraph.'
+    segments = split_text(text, max_length=200, first_length=50)
+    assert len(segments[0]) <= 50
+    assert all(len(segment) <= 200 for segment in segments)
+    assert all(segment.endswith('.') for segment in segments)
+    assert ' '.join(segments).split() == text.split()
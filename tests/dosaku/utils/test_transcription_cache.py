@@ -0,0 +1,75 @@
+"""Unit test methods for dosaku.utils.transcription_cache.TranscriptionCache class."""
+import numpy as np
+
+from dosaku.utils import TranscriptionCache
+
+
+def test_key():
+    pcm = np.arange(16000, dtype=np.int16)
+    key = TranscriptionCache.key(pcm, 16000, model='whisper-1')
+    assert key == TranscriptionCache.key(pcm.copy(), 16000, model='whisper-1')
+    assert key != TranscriptionCache.key(pcm, 8000, model='whisper-1')
+    assert key != TranscriptionCache.key(pcm, 16000, model='whisper-2')
+    assert key != TranscriptionCache.key(pcm, 16000, model='whisper-1', prompt='prompt')
+    assert key != TranscriptionCache.key(pcm.astype(np.float32), 16000, model='whisper-1')
+    assert key != TranscriptionCache.key(pcm[::-1], 16000, model='whisper-1')
+
+
+def test_get_put(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size=2 ** 20)
+    key = cache.key(np.zeros(100, dtype=np.int16), 16000, model='whisper-1')
+    assert cache.get(key) is None
+    cache.put(key, 'hello world')
+    assert cache.get(key) == 'hello world'
+    assert TranscriptionCache(cache_dir=str(tmp_path)).get(key) == 'hello world'  # Persists across instances
+
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_segment_reuse(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size=2 ** 20)
+    segments = [(np.full(100, idx, dtype=np.int16), 16000) for idx in range(4)]
+    transcribed = []
+
+    def transcribe(idx):
+        transcribed.append(idx)
+        return f'segment {idx}'
+
+    assert cache.transcribe(segments[:2], transcribe, model='whisper-1') == ['segment 0', 'segment 1']
+    assert transcribed == [0, 1]
+
+    texts = cache.transcribe(segments[1:], lambda idx: transcribe(idx + 1), model='whisper-1')
+    assert texts == ['segment 1', 'segment 2', 'segment 3']
+    assert transcribed == [0, 1, 2, 3]  # Segment 1 was reused
+
+
+def test_eviction(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size=250)
+    keys = [cache.key(np.full(100, idx, dtype=np.int16), 16000, model='whisper-1') for idx in range(4)]
+    for key in keys:
+        cache.put(key, 'x' * 100)
+    assert cache.size <= 250
+    assert cache.get(keys[-1]) == 'x' * 100
+    assert cache.get(keys[0]) is None
+
+
+def test_overwrite_size(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size=2 ** 20)
+    key = cache.key(np.zeros(100, dtype=np.int16), 16000, model='whisper-1')
+    for _ in range(4):  # Rewriting an entry must not count its size twice
+        cache.put(key, 'x' * 100)
+    assert cache._size == cache.size == 100
+
+
+def test_lazy_cache_dir(tmp_path):
+    cache_dir = tmp_path / 'transcriptions'
+    cache = TranscriptionCache(cache_dir=str(cache_dir), max_size=2 ** 20)
+    key = cache.key(np.zeros(100, dtype=np.int16), 16000, model='whisper-1')
+    assert cache.get(key) is None
+    assert cache.size == 0
+    assert not cache_dir.exists()  # Not created until the first entry is written
+
+    cache.put(key, 'hello world')
+    assert cache_dir.is_dir()
+    assert cache.get(key) == 'hello world'